@@ -1,24 +1,55 @@
 import importlib
-from typing import Any
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import numpy as np
 
+from src import const
 from src.log import log
 
 
-def optional_numba_jit(func) -> Any:
-    try:
-        numba = importlib.import_module("numba")
-    except Exception as e:
-        log.warning(
-            f"Function {func.__name__} is missing numba package for better performance! "
-            "Error details:")
-        log.warning(f" - numba import error: {e}")
-        return func
-    return numba.njit(fastmath=True)(func)
+class JitKernel:
+    """Function that is compiled by numba in background. Until compilation is finished (or if numba is not
+    available) calls are served by pure Python implementation"""
+
+    def __init__(self, func: Callable[..., Any], precompile_args: Tuple[Any, ...]) -> None:
+        self.py_func = func
+        self.precompile_args = precompile_args
+        self.compiled: Optional[Callable[..., Any]] = None
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+        self.__wrapped__ = func
+
+    def __call__(self, *args: Any) -> Any:
+        compiled = self.compiled
+        if compiled is not None:
+            return compiled(*args)
+        return self.py_func(*args)
+
+    def compile(self, numba: Any) -> None:
+        # Compiled code is stored on disk, so after restart it is loaded from cache instead of compiling again
+        jitted = numba.njit(fastmath=True, cache=True)(self.py_func)
+        jitted(*self.precompile_args)
+        self.compiled = jitted
+
+
+# Function name -> kernel that is compiled by precompile_algs()
+jit_kernels: Dict[str, JitKernel] = dict()
+_precompile_thread: Optional[threading.Thread] = None
 
 
-@optional_numba_jit
+def optional_numba_jit(*precompile_args: Any) -> Callable[[Callable[..., Any]], JitKernel]:
+    """Register function for background compilation by numba.
+    precompile_args are passed to the function to compile it for their types"""
+    def decorator(func: Callable[..., Any]) -> JitKernel:
+        kernel = JitKernel(func, precompile_args)
+        jit_kernels[func.__name__] = kernel
+        return kernel
+    return decorator
+
+
+@optional_numba_jit("", "")
 def levenshtein_distance(a: str, b: str):
     """
     Calculates Levenshtein distance between two strings using dynamic programming.
@@ -37,7 +68,32 @@ def levenshtein_distance(a: str, b: str):
     return d[m, n]
 
 
-def precompile_algs() -> None:
-    log.debug("Started precompiling functions...")
-    levenshtein_distance("", "")
+def _precompile_worker() -> None:
+    try:
+        numba = importlib.import_module("numba")
+    except Exception as e:
+        log.warning(
+            f"Functions {', '.join(jit_kernels.keys())} are missing numba package for better performance! "
+            "Error details:")
+        log.warning(f" - numba import error: {e}")
+        return
+    for name, kernel in jit_kernels.items():
+        try:
+            kernel.compile(numba)
+        except Exception as e:
+            log.warning(f"Failed to compile function {name} with numba, pure Python version is used. Error: {e}")
     log.debug("Finished precompiling functions")
+
+
+def precompile_algs(wait: bool = False) -> None:
+    """Compile registered functions in background thread"""
+    global _precompile_thread
+    if _precompile_thread is None:
+        # numba reads cache directory from environment when it is imported by worker thread.
+        # Environment is modified in the calling (main) thread before the worker is started
+        os.environ.setdefault("NUMBA_CACHE_DIR", os.path.join(const.WALBOT_DIR, const.NUMBA_CACHE_DIRECTORY))
+        log.debug("Started precompiling functions...")
+        _precompile_thread = threading.Thread(target=_precompile_worker, name="precompile_algs", daemon=True)
+        _precompile_thread.start()
+    if wait:
+        _precompile_thread.join()
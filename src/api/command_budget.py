@@ -0,0 +1,55 @@
+"""Limits of work that is done by one command message including all its subcommands"""
+
+import contextlib
+import contextvars
+from typing import Iterator, Optional
+
+from src import const
+
+
+class CommandBudget:
+    """Work done by top-level command and all commands that are run by it (subcommands, !loop iterations, etc.)"""
+
+    __slots__ = ("calls", "output_size")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.output_size = 0
+
+
+# Context variables are inherited by nested coroutines and tasks, so every nested command run sees its depth
+_depth: contextvars.ContextVar[int] = contextvars.ContextVar("command_depth", default=0)
+_budget: contextvars.ContextVar[Optional[CommandBudget]] = contextvars.ContextVar("command_budget", default=None)
+
+
+@contextlib.contextmanager
+def command_run() -> Iterator[Optional[str]]:
+    """Account command run. Yields error message if command should not be run because limits are exceeded"""
+    depth = _depth.get()
+    budget = _budget.get() if depth > 0 else None
+    budget_token = None
+    if budget is None:
+        budget = CommandBudget()
+        budget_token = _budget.set(budget)
+    error = None
+    if depth >= const.MAX_SUBCOMMAND_DEPTH:
+        error = "Maximum subcommand depth is reached!"
+    elif budget.calls >= const.MAX_COMMAND_CALLS:
+        error = f"Maximum number of command calls ({const.MAX_COMMAND_CALLS}) is reached!"
+    elif budget.output_size >= const.MAX_COMMAND_OUTPUT_SIZE:
+        error = f"Maximum size of command output ({const.MAX_COMMAND_OUTPUT_SIZE} bytes) is reached!"
+    budget.calls += 1
+    depth_token = _depth.set(depth + 1)
+    try:
+        yield error
+    finally:
+        _depth.reset(depth_token)
+        if budget_token is not None:
+            _budget.reset(budget_token)
+
+
+def add_output(result: Optional[str]) -> None:
+    """Account output of command run"""
+    budget = _budget.get()
+    if budget is not None and isinstance(result, str):
+        budget.output_size += len(result)
@@ -0,0 +1,162 @@
+"""Single path of command runs for all backends"""
+
+import bisect
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from src import const, subcommands
+from src.api.command_budget import add_output, command_run
+from src.api.execution_context import ExecutionContext
+from src.api.variables import VariableTemplate, compile_template
+from src.log import log
+
+
+class LatencyHistogram:
+    """Command run durations in logarithmic buckets: bucket i counts durations below 2^i microseconds"""
+
+    BUCKETS_COUNT = 32
+    _BOUNDS = [2 ** i / 1e6 for i in range(BUCKETS_COUNT)]
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * self.BUCKETS_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration: float) -> None:
+        """Add duration (in seconds)"""
+        self.buckets[min(bisect.bisect_right(self._BOUNDS, duration), self.BUCKETS_COUNT - 1)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def percentile(self, percent: float) -> float:
+        """Get upper bound (in seconds) of duration of percent of recorded runs"""
+        rank = self.count * percent / 100
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(self._BOUNDS[i], self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1e3, 3) if self.count else 0,
+            "p50_ms": round(self.percentile(50) * 1e3, 3),
+            "p95_ms": round(self.percentile(95) * 1e3, 3),
+            "p99_ms": round(self.percentile(99) * 1e3, 3),
+            "max_ms": round(self.max * 1e3, 3),
+        }
+
+
+class CommandDispatcher:
+    """Runs commands of all backends: checks limits, channel availability and permissions, applies time limit,
+    expands variables and subcommands once and executes command.
+
+    Commands are objects with times_called, max_execution_time and postpone_execution attributes and
+    can_be_subcommand(), template() and execute() methods. Platform specific parts (lookup of commands by name,
+    per channel availability and permission level settings) are provided by execution context"""
+
+    def __init__(self) -> None:
+        # Command name -> latency of its runs (including subcommands)
+        self.latency: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+
+    async def run(
+            self, command: Any, cmd_line: List[str], execution_ctx: ExecutionContext,
+            time_limit: bool = True) -> Optional[str]:
+        """Run command. cmd_line[0] is the name of command"""
+        start = time.perf_counter()
+        try:
+            with command_run() as error:
+                if error is not None:
+                    await execution_ctx.send_message(f"ERROR: {error}")
+                    return None
+                result = await self._run_checked(command, cmd_line, execution_ctx, time_limit)
+                add_output(result)
+                return result
+        finally:
+            self.latency[cmd_line[0]].record(time.perf_counter() - start)
+
+    async def _run_checked(
+            self, command: Any, cmd_line: List[str], execution_ctx: ExecutionContext,
+            time_limit: bool) -> Optional[str]:
+        log.debug(f"Processing command: {' '.join(cmd_line)}")
+        if not execution_ctx.is_command_available(cmd_line[0]):
+            await execution_ctx.send_message(f"Command '{cmd_line[0]}' is not available in this channel")
+            return None
+        settings = execution_ctx.command_settings(cmd_line[0], command)
+        if execution_ctx.permission_level < settings.permission_level:
+            await execution_ctx.send_message(f"You don't have permission to call command '{cmd_line[0]}'")
+            return None
+        command.times_called += 1
+        if settings is not command:
+            settings.times_called += 1
+        if not time_limit or command.max_execution_time == -1:
+            return await self._expand_and_execute(command, cmd_line, execution_ctx)
+        from src.utils import Util
+        timeout_error, result = await Util.run_function_with_time_limit(
+            self._expand_and_execute(command, cmd_line, execution_ctx), command.max_execution_time)
+        if timeout_error:
+            await execution_ctx.send_message(f"Command '{' '.join(cmd_line)}' took too long to execute")
+        return result
+
+    async def _expand_and_execute(
+            self, command: Any, cmd_line: List[str], execution_ctx: ExecutionContext) -> Optional[str]:
+        if command.postpone_execution:
+            log.debug2("Subcommands are not processed!")
+            return await command.execute(' '.join(cmd_line), execution_ctx)
+        cmd_line = VariableTemplate(' '.join(cmd_line)).render(execution_ctx, cmd_line).split(' ')
+        template = command.template()
+        if template is None:
+            text, safe = ' '.join(cmd_line), False
+        else:
+            source, safe = template
+            text = compile_template(source).render(execution_ctx, cmd_line, safe)
+        log.debug2(f"Command (after processing variables): {text}")
+        text = await self.expand_subcommands(execution_ctx, text, safe)
+        if template is None:
+            # Subcommands with empty results leave empty arguments in command line
+            text = ' '.join(filter(None, text.split(' ')))
+        log.debug2(f"Command (after processing subcommands): {text}")
+        return await command.execute(text, execution_ctx)
+
+    async def expand_subcommands(self, execution_ctx: ExecutionContext, string: str, safe: bool = False) -> str:
+        """Substitute results of subcommands. If safe is True, only alphanumeric results are substituted"""
+        async def run_subcommand(subcommand_string: str) -> str:
+            cmd_line = subcommand_string.split(' ')
+            if not cmd_line[0]:
+                return ""
+            found = execution_ctx.find_command(cmd_line[0])
+            if found is None:
+                await execution_ctx.send_message(f"Unknown command '{cmd_line[0]}'")
+                return ""
+            cmd_line[0], command = found
+            if not command.can_be_subcommand():
+                await execution_ctx.send_message(f"Command '{cmd_line[0]}' can not be used as subcommand")
+                return ""
+            log.debug(f"Processing subcommand: {cmd_line[0]}: {subcommand_string}")
+            real_silent_status = execution_ctx.silent
+            execution_ctx.silent = True
+            try:
+                result = await self.run(command, cmd_line, execution_ctx)
+            finally:
+                execution_ctx.silent = real_silent_status
+            if result is None or (safe and not const.ALNUM_STRING_REGEX.match(result)):
+                return ""
+            return result
+
+        result = await subcommands.expand(string, run_subcommand)
+        # run_subcommand() never stops processing, so result is always a string
+        return result if result is not None else ""
+
+    def latency_summary(self, command_names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        names = sorted(self.latency.keys()) if not command_names else command_names
+        return {name: self.latency[name].summary() for name in names if name in self.latency}
+
+
+dispatcher = CommandDispatcher()
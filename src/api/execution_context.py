@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Optional, Tuple
 
 from src import const
 
@@ -46,3 +46,28 @@ class ExecutionContext(ABC):
     @abstractmethod
     def bot_user_id(self) -> int:
         pass
+
+    def command_platforms(self) -> int:
+        """Get platforms (SupportedPlatforms flags) that command should support to be called in this context.
+        By default only commands that are supported on all platforms can be called"""
+        from src.api.command import SupportedPlatforms
+        return SupportedPlatforms.ALL
+
+    def find_command(self, command_name: str) -> Optional[Tuple[str, Any]]:
+        """Get command (and its canonical name) that can be called on this platform"""
+        from src.config import bc
+        command = bc.executor.commands.get(command_name)
+        if command is None:
+            return None
+        platforms = self.command_platforms()
+        if command.supported_platforms & platforms != platforms:
+            return None
+        return command_name, command
+
+    def command_settings(self, command_name: str, command: Any) -> Any:
+        """Get object that stores permission level and call counter of command on this platform"""
+        return command
+
+    def is_command_available(self, command_name: str) -> bool:
+        """Check if command is enabled in the channel of this context"""
+        return True
@@ -0,0 +1,109 @@
+"""Variables of command templates: @author@, @args@, @args1-2@, @arg1@ and others"""
+
+import functools
+from typing import List, Tuple, Union
+
+from src import const
+from src.api.execution_context import ExecutionContext
+
+_SERVER = 0
+_CHANNEL_ID = 1
+_CHANNEL = 2
+_AUTHOR_ID = 3
+_AUTHOR = 4
+_COMMAND = 5
+_ARGS = 6
+_ARGS_RANGE = 7
+_ARG = 8
+
+_VARIABLES = {
+    "server": _SERVER,
+    "channelid": _CHANNEL_ID,
+    "channel": _CHANNEL,
+    "authorid": _AUTHOR_ID,
+    "author": _AUTHOR,
+    "command": _COMMAND,
+    "args": _ARGS,
+}
+
+
+class VariableTemplate:
+    """String that is split to literal text and variables once, so rendering is a single join"""
+
+    __slots__ = ("source", "segments")
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        # Literal strings and variables: (variable type, first argument, last argument, source text)
+        self.segments: List[Union[str, Tuple[int, int, int, str]]] = []
+        if '@' not in source:
+            self.segments.append(source)
+            return
+        position = 0
+        for match in const.VARIABLES_REGEX.finditer(source):
+            name, first, last, index = match.groups()
+            if name in _VARIABLES:
+                variable = (_VARIABLES[name], 0, 0, match.group())
+            elif index is not None:
+                if str(int(index)) != index:
+                    continue
+                variable = (_ARG, int(index), 0, match.group())
+            else:
+                variable = (_ARGS_RANGE, int(first) if first else -1, int(last) if last else -1, match.group())
+            if match.start() > position:
+                self.segments.append(source[position:match.start()])
+            self.segments.append(variable)
+            position = match.end()
+        if position < len(source):
+            self.segments.append(source[position:])
+
+    def render(self, execution_ctx: ExecutionContext, cmd_line: List[str], safe: bool = False) -> str:
+        """Substitute variables. If safe is True, only alphanumeric arguments are substituted"""
+        if len(self.segments) == 1 and isinstance(self.segments[0], str):
+            return self.segments[0]
+        result = []
+        args = None
+        for segment in self.segments:
+            if isinstance(segment, str):
+                result.append(segment)
+                continue
+            kind, first, last, text = segment
+            value = None
+            if kind == _SERVER:
+                if execution_ctx.platform == const.BotBackend.DISCORD:
+                    value = execution_ctx.message.guild.name
+            elif kind == _CHANNEL_ID:
+                value = str(execution_ctx.channel_id())
+            elif kind == _CHANNEL:
+                value = execution_ctx.channel_name()
+            elif kind == _AUTHOR_ID:
+                value = str(execution_ctx.message_author_id())
+            elif kind == _AUTHOR:
+                value = execution_ctx.message_author()
+            elif kind == _COMMAND:
+                value = ' '.join(cmd_line)
+            elif kind == _ARG:
+                if first < len(cmd_line) and (not safe or const.ALNUM_STRING_REGEX.match(cmd_line[first])):
+                    value = cmd_line[first]
+            else:
+                if args is None:
+                    args = ' '.join(cmd_line[1:])
+                # Argument ranges are substituted only if all arguments are safe
+                if not safe or const.ALNUM_STRING_REGEX.match(args):
+                    if kind == _ARGS:
+                        value = args
+                    else:
+                        n1 = 1 if first == -1 else first
+                        n2 = len(cmd_line) if last == -1 else last + 1
+                        if 0 < n1 < len(cmd_line) and 0 < n2 <= len(cmd_line) and n1 <= n2:
+                            value = ' '.join(cmd_line[n1:n2])
+                            if safe and not const.ALNUM_STRING_REGEX.match(value):
+                                value = None
+            result.append(text if value is None else value)
+        return ''.join(result)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(source: str) -> VariableTemplate:
+    """Get compiled template of command message or external command line"""
+    return VariableTemplate(source)
@@ -10,6 +10,8 @@ import discord
 from src import const
 from src.algorithms import levenshtein_distance
 from src.api.command import BaseCmd
+from src.api.dispatcher import dispatcher
+from src.backend.discord.context import DiscordExecutionContext
 from src.backend.discord.message import Msg
 from src.backend.discord.utils import DiscordUtil
 from src.config import Command, bc, log
@@ -30,7 +32,7 @@ class BuiltinCommands(BaseCmd):
             "permuser": dict(permission=const.Permission.ADMIN.value, subcommand=False),
             "whitelist": dict(permission=const.Permission.MOD.value, subcommand=False),
             "config": dict(permission=const.Permission.MOD.value, subcommand=False),
-            "silent": dict(permission=const.Permission.USER.value, subcommand=False),
+            "silent": dict(permission=const.Permission.USER.value, subcommand=False, max_execution_time=-1),
             "addalias": dict(permission=const.Permission.MOD.value, subcommand=False),
             "delalias": dict(permission=const.Permission.MOD.value, subcommand=False),
             "listalias": dict(permission=const.Permission.USER.value, subcommand=True),
@@ -52,6 +54,8 @@ class BuiltinCommands(BaseCmd):
             return null(await Msg.response(message, f"Command {command_name} already exists", silent))
         bc.discord.commands.data[command_name] = Command(command_name, message=' '.join(command[2:]))
         bc.discord.commands.data[command_name].channels.append(message.channel.id)
+        bc.discord.command_index.add(command_name)
+        bc.config.mark_dirty("commands")
         await Msg.response(
             message,
             f"Command '{command_name}' -> '{bc.discord.commands.data[command_name].message}' successfully added",
@@ -68,6 +72,7 @@ class BuiltinCommands(BaseCmd):
             if bc.discord.commands.data[command_name].message is None:
                 return null(await Msg.response(message, f"Command '{command_name}' is not editable", silent))
             bc.discord.commands.data[command_name].message = ' '.join(command[2:])
+            bc.config.mark_dirty("commands")
             return null(
                 await Msg.response(
                     message,
@@ -90,14 +95,17 @@ class BuiltinCommands(BaseCmd):
             if len(command) == 2 or command[2] == "channel":
                 if message.channel.id not in bc.discord.commands.data[command_name].channels:
                     bc.discord.commands.data[command_name].channels.append(message.channel.id)
+                    bc.config.mark_dirty("commands")
                 await Msg.response(message, f"Command '{command_name}' is enabled in this channel", silent)
             elif command[2] == "guild":
                 for channel in message.channel.guild.text_channels:
                     if channel.id not in bc.discord.commands.data[command_name].channels:
                         bc.discord.commands.data[command_name].channels.append(channel.id)
+                        bc.config.mark_dirty("commands")
                 await Msg.response(message, f"Command '{command_name}' is enabled in this guild", silent)
             elif command[2] == "global":
                 bc.discord.commands.data[command_name].is_global = True
+                bc.config.mark_dirty("commands")
                 await Msg.response(message, f"Command '{command_name}' is enabled in global scope", silent)
             else:
                 await Msg.response(message, f"Unknown scope '{command[2]}'", silent)
@@ -121,12 +129,15 @@ class BuiltinCommands(BaseCmd):
             if scope == "channel":
                 if message.channel.id not in bc.discord.commands.data[command_name].channels:
                     bc.discord.commands.data[command_name].channels.append(message.channel.id)
+                    bc.config.mark_dirty("commands")
             elif scope == "guild":
                 for channel in message.channel.guild.text_channels:
                     if channel.id not in bc.discord.commands.data[command_name].channels:
                         bc.discord.commands.data[command_name].channels.append(channel.id)
+                        bc.config.mark_dirty("commands")
             elif scope == "global":
                 bc.discord.commands.data[command_name].is_global = True
+                bc.config.mark_dirty("commands")
             else:
                 await Msg.response(message, f"Unknown scope '{scope}'", silent)
                 return
@@ -147,14 +158,17 @@ class BuiltinCommands(BaseCmd):
             if len(command) == 2 or command[2] == "channel":
                 if message.channel.id in bc.discord.commands.data[command_name].channels:
                     bc.discord.commands.data[command_name].channels.remove(message.channel.id)
+                    bc.config.mark_dirty("commands")
                 await Msg.response(message, f"Command '{command_name}' is disabled in this channel", silent)
             elif command[2] == "guild":
                 for channel in message.channel.guild.text_channels:
                     if channel.id in bc.discord.commands.data[command_name].channels:
                         bc.discord.commands.data[command_name].channels.remove(channel.id)
+                        bc.config.mark_dirty("commands")
                 await Msg.response(message, f"Command '{command_name}' is disabled in this guild", silent)
             elif command[2] == "global":
                 bc.discord.commands.data[command_name].is_global = False
+                bc.config.mark_dirty("commands")
                 await Msg.response(message, f"Command '{command_name}' is disabled in global scope", silent)
             else:
                 await Msg.response(message, f"Unknown scope '{command[2]}'", silent)
@@ -174,6 +188,7 @@ class BuiltinCommands(BaseCmd):
             return
         if command_name in bc.discord.commands.data.keys():
             bc.discord.commands.data[command_name].permission = perm
+            bc.config.mark_dirty("commands")
             return null(
                 await Msg.response(
                     message, f"Set permission level {command[2]} for command '{command_name}'", silent))
@@ -214,6 +229,7 @@ class BuiltinCommands(BaseCmd):
         max_exec_time = await DiscordUtil.parse_int_for_discord(
             message, command[2], f"Third argument of command '{command[0]}' should be an integer", silent)
         com.max_execution_time = max_exec_time
+        bc.config.mark_dirty("commands")
         await Msg.response(
             message, f"Set maximal execution time for command '{command[1]}' to {max_exec_time}", silent)
 
@@ -235,6 +251,7 @@ class BuiltinCommands(BaseCmd):
         user_id = int(r.group(1))
         if user_id in bc.config.discord.users.keys():
             bc.config.discord.users[user_id].permission_level = perm
+            bc.config.mark_dirty("discord")
             return null(
                 await Msg.response(message, f"Set permission level {command[2]} for user '{command[1]}'", silent))
         else:
@@ -252,15 +269,19 @@ class BuiltinCommands(BaseCmd):
             return
         if command[1] == "enable":
             bc.config.discord.guilds[message.channel.guild.id].is_whitelisted = True
+            bc.config.mark_dirty("discord")
             await Msg.response(message, "This guild is whitelisted for bot", silent)
         elif command[1] == "disable":
             bc.config.discord.guilds[message.channel.guild.id].is_whitelisted = False
+            bc.config.mark_dirty("discord")
             await Msg.response(message, "This guild is not whitelisted for bot", silent)
         elif command[1] == "add":
             bc.config.discord.guilds[message.channel.guild.id].whitelist.add(message.channel.id)
+            bc.config.mark_dirty("discord")
             await Msg.response(message, "This channel is added to bot's whitelist", silent)
         elif command[1] == "remove":
             bc.config.discord.guilds[message.channel.guild.id].whitelist.discard(message.channel.id)
+            bc.config.mark_dirty("discord")
             await Msg.response(message, "This channel is removed from bot's whitelist", silent)
         else:
             await Msg.response(message, f"Unknown argument '{command[1]}'", silent)
@@ -288,9 +309,11 @@ class BuiltinCommands(BaseCmd):
                     return
                 if message.channel.id in bc.config.discord.guilds[message.channel.guild.id].reactions_whitelist:
                     bc.config.discord.guilds[message.channel.guild.id].reactions_whitelist.remove(message.channel.id)
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.red
                 else:
                     bc.config.discord.guilds[message.channel.guild.id].reactions_whitelist.add(message.channel.id)
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.green
                 await interaction.response.edit_message(content=header, view=self)
                 await Msg.response(
@@ -316,9 +339,11 @@ class BuiltinCommands(BaseCmd):
                 if message.channel.id in bc.config.discord.guilds[message.channel.guild.id].markov_logging_whitelist:
                     bc.config.discord.guilds[message.channel.guild.id].markov_logging_whitelist.remove(
                         message.channel.id)
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.red
                 else:
                     bc.config.discord.guilds[message.channel.guild.id].markov_logging_whitelist.add(message.channel.id)
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.green
                 await interaction.response.edit_message(content=header, view=self)
                 await Msg.response(
@@ -344,9 +369,11 @@ class BuiltinCommands(BaseCmd):
                     return
                 if message.channel.id in bc.config.discord.guilds[message.channel.guild.id].responses_whitelist:
                     bc.config.discord.guilds[message.channel.guild.id].responses_whitelist.remove(message.channel.id)
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.red
                 else:
                     bc.config.discord.guilds[message.channel.guild.id].responses_whitelist.add(message.channel.id)
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.green
                 await interaction.response.edit_message(content=header, view=self)
                 await Msg.response(
@@ -373,10 +400,12 @@ class BuiltinCommands(BaseCmd):
                 if message.channel.id in bc.config.discord.guilds[message.channel.guild.id].markov_responses_whitelist:
                     bc.config.discord.guilds[message.channel.guild.id].markov_responses_whitelist.remove(
                         message.channel.id)
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.red
                 else:
                     bc.config.discord.guilds[message.channel.guild.id].markov_responses_whitelist.add(
                         message.channel.id)
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.green
                 await interaction.response.edit_message(content=header, view=self)
                 await Msg.response(
@@ -402,9 +431,11 @@ class BuiltinCommands(BaseCmd):
                     return
                 if bc.config.discord.guilds[message.channel.guild.id].markov_pings:
                     bc.config.discord.guilds[message.channel.guild.id].markov_pings = False
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.red
                 else:
                     bc.config.discord.guilds[message.channel.guild.id].markov_pings = True
+                    bc.config.mark_dirty("discord")
                     button.style = discord.ButtonStyle.green
                 await interaction.response.edit_message(content=header, view=self)
                 await Msg.response(
@@ -437,12 +468,14 @@ class BuiltinCommands(BaseCmd):
                             message, "Adding reactions is already enabled for this channel", silent)
                     else:
                         bc.config.discord.guilds[message.channel.guild.id].reactions_whitelist.add(message.channel.id)
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Adding reactions is successfully enabled for this channel", silent)
                 elif command[2] in ("disable", "false", "off"):
                     if message.channel.id in bc.config.discord.guilds[message.channel.guild.id].reactions_whitelist:
                         bc.config.discord.guilds[message.channel.guild.id].reactions_whitelist.discard(
                             message.channel.id)
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Adding reactions is successfully disabled for this channel", silent)
                     else:
@@ -459,6 +492,7 @@ class BuiltinCommands(BaseCmd):
                     else:
                         bc.config.discord.guilds[message.channel.guild.id].markov_logging_whitelist.add(
                             message.channel.id)
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Adding messages to Markov model is successfully enabled for this channel", silent)
                 elif command[2] in ("disable", "false", "off"):
@@ -466,6 +500,7 @@ class BuiltinCommands(BaseCmd):
                             in bc.config.discord.guilds[message.channel.guild.id].markov_logging_whitelist):
                         bc.config.discord.guilds[message.channel.guild.id].markov_logging_whitelist.discard(
                             message.channel.id)
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Adding messages to Markov model is successfully disabled for this channel",
                             silent)
@@ -479,12 +514,14 @@ class BuiltinCommands(BaseCmd):
                             message, "Bot responses are already enabled for this channel", silent)
                     else:
                         bc.config.discord.guilds[message.channel.guild.id].responses_whitelist.add(message.channel.id)
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Bot responses are successfully enabled for this channel", silent)
                 elif command[2] in ("disable", "false", "off"):
                     if message.channel.id in bc.config.discord.guilds[message.channel.guild.id].responses_whitelist:
                         bc.config.discord.guilds[message.channel.guild.id].responses_whitelist.discard(
                             message.channel.id)
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Bot responses are successfully disabled for this channel",
                             silent)
@@ -502,6 +539,7 @@ class BuiltinCommands(BaseCmd):
                     else:
                         bc.config.discord.guilds[message.channel.guild.id].markov_responses_whitelist.add(
                             message.channel.id)
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Bot responses on mentioning are successfully enabled for this channel", silent)
                 elif command[2] in ("disable", "false", "off"):
@@ -509,6 +547,7 @@ class BuiltinCommands(BaseCmd):
                             in bc.config.discord.guilds[message.channel.guild.id].markov_responses_whitelist):
                         bc.config.discord.guilds[message.channel.guild.id].markov_responses_whitelist.discard(
                             message.channel.id)
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Bot responses on mentioning are successfully disabled for this channel",
                             silent)
@@ -524,11 +563,13 @@ class BuiltinCommands(BaseCmd):
                             message, "Markov pings are already enabled for this channel", silent)
                     else:
                         bc.config.discord.guilds[message.channel.guild.id].markov_pings = True
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Markov pings are successfully enabled for this channel", silent)
                 elif command[2] in ("disable", "false", "off"):
                     if bc.config.discord.guilds[message.channel.guild.id].markov_pings:
                         bc.config.discord.guilds[message.channel.guild.id].markov_pings = False
+                        bc.config.mark_dirty("discord")
                         await Msg.response(
                             message, "Markov pings are successfully disabled for this channel", silent)
                     else:
@@ -548,12 +589,13 @@ class BuiltinCommands(BaseCmd):
         if not await DiscordUtil.check_args_count(message, command, silent, min=2):
             return
         command = command[1:]
-        if command[0] not in bc.discord.commands.data.keys():
+        execution_ctx = DiscordExecutionContext(message, silent=True)
+        found = execution_ctx.find_command(command[0])
+        if found is None:
             await Msg.response(message, f"Unknown command '{command[0]}'", silent)
         else:
-            cmd = bc.discord.commands.data[command[0]]
-            message.content = message.content.split(' ', 1)[-1]
-            await cmd.run(message, command, None, silent=True)
+            command[0], cmd = found
+            await dispatcher.run(cmd, command, execution_ctx)
 
     @staticmethod
     async def _addalias(message, command, silent=False):
@@ -569,6 +611,8 @@ class BuiltinCommands(BaseCmd):
         if command[2] in bc.discord.commands.aliases.keys():
             return null(await Msg.response(message, f"Alias '{command[2]}' already exists", silent))
         bc.discord.commands.aliases[command[2]] = command[1]
+        bc.discord.command_index.add(command[2], command[1])
+        bc.config.mark_dirty("commands")
         await Msg.response(message, f"Alias '{command[2]}' for '{command[1]}' was successfully created", silent)
 
     @staticmethod
@@ -581,6 +625,8 @@ class BuiltinCommands(BaseCmd):
         if command[1] not in bc.discord.commands.aliases.keys():
             return null(await Msg.response(message, f"Alias '{command[1]}' does not exist", silent))
         bc.discord.commands.aliases.pop(command[1])
+        bc.discord.command_index.remove(command[1])
+        bc.config.mark_dirty("commands")
         await Msg.response(message, f"Alias '{command[1]}' was successfully deleted", silent)
 
     @staticmethod
@@ -732,9 +778,10 @@ class BuiltinCommands(BaseCmd):
         if not await DiscordUtil.check_args_count(message, command, silent, min=2):
             return
         command = command[1:]
-        if command[0] not in bc.discord.commands.data.keys():
+        execution_ctx = DiscordExecutionContext(message)
+        found = execution_ctx.find_command(command[0])
+        if found is None:
             await Msg.response(message, f"Unknown command '{command[0]}'", silent)
         else:
-            cmd = bc.discord.commands.data[command[0]]
-            message.content = message.content.split(' ', 1)[-1]
-            await cmd.run(message, command, bc.config.discord.users[message.author.id])
+            command[0], cmd = found
+            await dispatcher.run(cmd, command, execution_ctx, time_limit=False)
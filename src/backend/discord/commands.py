@@ -46,6 +46,7 @@ class Commands:
         for command in bc.executor.commands.values():
             if command.supported_platforms & SupportedPlatforms.DISCORD:
                 binding.bind(command.command_name, command)
+        bc.discord.command_index.rebuild(self.data.keys(), self.aliases)
         if not reload:
             self.export_help(const.DISCORD_COMMANDS_DOC_PATH)  # Discord legacy help export
 
@@ -107,9 +108,11 @@ class Commands:
             self.data[command_name] = Command(module_name, class_name, '_' + command_name, **kwargs)
         self.data[command_name].is_global = True
         self.data[command_name].is_private = ".private." in module_name
+        bc.discord.command_index.add(command_name)
 
     def unregister_command(self, command_name: str) -> None:
         self.data.pop(command_name, None)
+        bc.discord.command_index.remove(command_name)
 
     def register_commands(self, module_name: str, class_name: str, commands: Dict[str, Dict[str, Any]]) -> None:
         """Register multiple commands. It calls register_command"""
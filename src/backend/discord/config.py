@@ -3,5 +3,5 @@ from typing import Any, Dict
 
 class DiscordConfig:
     def __init__(self) -> None:
-        self.guilds: Dict[str, Any] = dict()
-        self.users: Dict[str, Any] = dict()
+        self.guilds: Dict[int, Any] = dict()
+        self.users: Dict[int, Any] = dict()
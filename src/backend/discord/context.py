@@ -1,9 +1,10 @@
 import re
-from typing import Any, Optional
+from typing import Any, Optional, Tuple
 
 import discord
 
 from src import const
+from src.api.command import SupportedPlatforms
 from src.api.execution_context import ExecutionContext
 from src.backend.discord.message import Msg
 from src.config import bc
@@ -66,3 +67,24 @@ class DiscordExecutionContext(ExecutionContext):
 
     def bot_user_id(self) -> int:
         return bc.discord.bot_user_id
+
+    def find_command(self, command_name: str) -> Optional[Tuple[str, Any]]:
+        command_name = bc.discord.command_index.resolve(command_name)
+        if command_name is None:
+            return None
+        command = bc.executor.commands.get(command_name)
+        if command is None or not (command.supported_platforms & SupportedPlatforms.DISCORD):
+            # Discord-only command
+            command = bc.discord.commands.data.get(command_name)
+        return (command_name, command) if command is not None else None
+
+    def command_settings(self, command_name: str, command: Any) -> Any:
+        return bc.discord.commands.data.get(command_name, command)
+
+    def is_command_available(self, command_name: str) -> bool:
+        if command_name not in bc.discord.commands.data.keys():
+            return True
+        channel_id = self.message.channel.id
+        if isinstance(self.message.channel, discord.Thread):  # Inherit command permissions for threads
+            channel_id = self.message.channel.parent_id
+        return bc.discord.commands.data[command_name].is_available(channel_id)
@@ -2,6 +2,7 @@ import asyncio
 import datetime
 import importlib
 import itertools
+import os
 import re
 import sys
 from typing import Any, Mapping, Optional, cast
@@ -9,8 +10,8 @@ from typing import Any, Mapping, Optional, cast
 import discord
 
 from src import const
-from src.algorithms import levenshtein_distance
 from src.api.bot_instance import BotInstance
+from src.api.dispatcher import dispatcher
 from src.backend.discord.commands import DiscordCommandBinding
 from src.backend.discord.context import DiscordExecutionContext
 from src.bot_cache import BotCache
@@ -18,9 +19,11 @@ from src.config import Config, GuildSettings, SecretConfig, User, bc
 from src.ff import FF
 from src.log import log
 from src.mail import Mail
+from src.markov import collect_garbage_incrementally
 from src.message_cache import CachedMsg
 from src.message_processing import MessageProcessing
 from src.reminder import ReminderProcessing
+from src.startup_profiler import profiler
 from src.utils import Time, Util
 
 
@@ -104,10 +107,20 @@ class WalBot(discord.Client):
         while not self.is_closed():
             await asyncio.sleep(self.config.saving["period"] * 60)
             if index % self.config.saving["backup"]["period"] == 0:
-                self.config.backup(const.CONFIG_PATH, const.MARKOV_PATH)
-            self.config.save(const.CONFIG_PATH, const.MARKOV_PATH, const.SECRET_CONFIG_PATH)
+                domain_files = [Config.domain_path(const.CONFIG_PATH, domain) for domain in Config.DOMAINS]
+                self.config.backup(
+                    const.CONFIG_PATH, *filter(os.path.isfile, domain_files), markov_file=bc.markov.STORAGE_PATH)
+            self.config.save(const.CONFIG_PATH, bc.markov.STORAGE_PATH, const.SECRET_CONFIG_PATH)
             index += 1
 
+    async def _markov_gc(self) -> None:
+        await self.wait_until_ready()
+        while not self.is_closed():
+            await asyncio.sleep(const.MARKOV_GC_INTERVAL)
+            removed = await collect_garbage_incrementally(bc.markov)
+            if removed:
+                log.info(f"Markov garbage collection removed {len(removed)} words")
+
     @Mail.send_exception_info_to_admin_emails
     async def _process_reminders(self) -> None:
         await self.wait_until_ready()
@@ -126,12 +139,16 @@ class WalBot(discord.Client):
             "ready": True,
         })
         self.bot_cache.dump_to_file()
+        profiler.event("Connected to Discord gateway")
         bc.discord.guilds = self.guilds
         for guild in self.guilds:
             if guild.id not in self.config.discord.guilds.keys():
                 self.config.discord.guilds[guild.id] = GuildSettings(guild.id)
+                self.config.mark_dirty("discord")
         bc.discord.bot_user = self.user
         self.loop.create_task(self._config_autosave())
+        if FF.is_enabled("WALBOT_FEATURE_MARKOV_BACKGROUND_GC"):
+            self.loop.create_task(self._markov_gc())
 
     @Mail.send_exception_info_to_admin_emails
     async def on_message(self, message: discord.Message) -> None:
@@ -150,6 +167,7 @@ class WalBot(discord.Client):
                 return
         if message.author.id not in self.config.discord.users.keys():
             self.config.discord.users[message.author.id] = User(message.author.id)
+            self.config.mark_dirty("discord")
         if self.config.discord.users[message.author.id].permission_level < 0:
             return
         if message.content.startswith(self.config.commands_prefix):
@@ -180,6 +198,7 @@ class WalBot(discord.Client):
                 return
         if message.author.id not in self.config.discord.users.keys():
             self.config.discord.users[message.author.id] = User(message.author.id)
+            self.config.mark_dirty("discord")
         if self.config.discord.users[message.author.id].permission_level < 0:
             return
         if (Time().now().astimezone() - message.created_at >
@@ -210,15 +229,8 @@ class WalBot(discord.Client):
                 await message.channel.send(message.author.mention + ' ' + result)
         elif channel_id in self.config.discord.guilds[message.channel.guild.id].markov_logging_whitelist:
             # If the message is in a channel that is supposed to log markov chains, doesn't mention the bot then
-            # add the message to the markov chain DB
-            needs_to_be_added = True
-            if not FF.is_enabled("WALBOT_FEATURE_MARKOV_MONGO"):
-                for ignored_prefix in bc.markov.ignored_prefixes.values():
-                    if message.content.startswith(ignored_prefix):
-                        needs_to_be_added = False
-                        break
-            if needs_to_be_added:
-                bc.markov.add_string(message.content)
+            # add the message to the markov chain DB (ignored prefixes and filters are applied by ingestion thread)
+            bc.markov_ingest.push(message.content)
         if channel_id in self.config.discord.guilds[message.channel.guild.id].responses_whitelist:
             # If the message is in a channel that is supposed to respond to messages then
             # answer with corresponding response from config.responses dictionary
@@ -241,45 +253,15 @@ class WalBot(discord.Client):
         command[0] = command[0][1:]
         if not command[0]:
             return log.debug("Ignoring empty command")
-        if command[0] not in self.config.commands.data.keys():
-            if command[0] in self.config.commands.aliases.keys():
-                command[0] = self.config.commands.aliases[command[0]]
-            else:
-                await message.channel.send(
-                    f"Unknown command '{command[0]}', "
-                    f"probably you meant '{self._suggest_similar_command(command[0])}'")
-                return None
-        max_exec_time = self.config.commands.data[command[0]].max_execution_time
-        if command[0] in self.config.executor["commands_data"].keys():
-            max_exec_time = bc.executor.commands[command[0]].max_execution_time
-        if max_exec_time != -1:
-            timeout_error, result = await Util.run_function_with_time_limit(
-                self.config.commands.data[command[0]].run(
-                    message, command, self.config.discord.users[message.author.id], silent=silent),
-                max_exec_time)
-            if command[0] not in (
-                "silent",
-            ) and timeout_error:
-                await message.channel.send(f"Command '{' '.join(command)}' took too long to execute")
-            return result
-        else:
-            return await self.config.commands.data[command[0]].run(
-                message, command, self.config.discord.users[message.author.id], silent=silent)
-
-    def _suggest_similar_command(self, unknown_command: str) -> str:
-        min_dist = 100000
-        suggestion = ""
-        for command in self.config.commands.data.keys():
-            dist = levenshtein_distance(unknown_command, command)
-            if dist < min_dist:
-                suggestion = command
-                min_dist = dist
-        for command in self.config.commands.aliases.keys():
-            dist = levenshtein_distance(unknown_command, command)
-            if dist < min_dist:
-                suggestion = command
-                min_dist = dist
-        return suggestion
+        execution_ctx = DiscordExecutionContext(message, silent)
+        found = execution_ctx.find_command(command[0])
+        if found is None:
+            await message.channel.send(
+                f"Unknown command '{command[0]}', "
+                f"probably you meant '{bc.discord.command_index.suggest(command[0])}'")
+            return None
+        command[0], cmd = found
+        return await dispatcher.run(cmd, command, execution_ctx)
 
     async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
         data = cast(Mapping[str, Any], payload.data)
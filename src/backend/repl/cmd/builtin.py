@@ -1,6 +1,8 @@
 import inspect
 import itertools
 
+from src.api.dispatcher import dispatcher
+from src.backend.repl.context import ReplExecutionContext
 from src.config import bc
 
 
@@ -62,3 +64,17 @@ class REPLCommands:
             return "Cannot send message to undefined channel. First execute: join <channel_id>"
         t = bc.discord.background_loop.create_task(self._current_channel.send(text))
         bc.discord.background_loop.run_until_complete(t)
+
+    async def cmd(self, command):
+        """Run bot command"""
+        if len(command) < 2:
+            return "Usage: cmd <command> [args...]"
+        execution_ctx = ReplExecutionContext()
+        found = execution_ctx.find_command(command[1])
+        if found is None:
+            if command[1] in bc.executor.commands:
+                return f"Command '{command[1]}' is not supported in REPL"
+            return f"Unknown command '{command[1]}'"
+        cmd_name, cmd = found
+        await dispatcher.run(cmd, [cmd_name] + command[2:], execution_ctx)
+        return '\n'.join(execution_ctx.output)
@@ -0,0 +1,40 @@
+from typing import List
+
+from src import const
+from src.api.execution_context import ExecutionContext
+
+
+class ReplExecutionContext(ExecutionContext):
+    def __init__(self) -> None:
+        super().__init__()
+        self.platform = str(const.BotBackend.REPL)
+        self.output: List[str] = []
+
+    async def send_message(self, message: str, *args, **kwargs) -> None:
+        if self.silent:
+            return
+        self.output.append(message)
+
+    async def reply(self, message: str, *args, **kwargs) -> None:
+        return await self.send_message(message, *args, **kwargs)
+
+    async def send_direct_message(self, user_id: int, message: str, *args, **kwargs) -> None:
+        return await self.send_message(message, *args, **kwargs)
+
+    async def disable_pings(self, message: str) -> str:
+        return message
+
+    def message_author(self) -> str:
+        return "repl"
+
+    def message_author_id(self) -> str:
+        return "0"
+
+    def channel_name(self) -> str:
+        return "repl"
+
+    def channel_id(self) -> int:
+        return 0
+
+    def bot_user_id(self) -> int:
+        return 0
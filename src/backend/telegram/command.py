@@ -22,6 +22,7 @@ async def command_handler(command_name: str, update: Update, context: CallbackCo
     log_message(update)
     if update.message.from_user.id not in bc.config.telegram.users.keys():
         bc.config.telegram.users[update.message.from_user.id] = User(update.message.from_user.id)
+        bc.config.mark_dirty("telegram")
     # 'authorize' and 'resetpass' commands should be available for all channels to authorize bot there
     if command_name not in ("authorize", "resetpass") and not check_auth(update):
         return
@@ -6,4 +6,4 @@ class TelegramConfig:
     def __init__(self) -> None:
         self.channel_whitelist: Set[str] = set()
         self.passphrase = uuid.uuid4().hex
-        self.users: Dict[str, Any] = dict()
+        self.users: Dict[int, Any] = dict()
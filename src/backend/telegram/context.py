@@ -5,6 +5,7 @@ from telegram import Update
 from telegram.ext import CallbackContext
 
 from src import const
+from src.api.command import SupportedPlatforms
 from src.api.execution_context import ExecutionContext
 from src.backend.telegram.util import escape_markdown_text, reply, send_message
 from src.config import bc
@@ -21,6 +22,9 @@ class TelegramExecutionContext(ExecutionContext):
         self.permission_level = bc.config.telegram.users[update.message.from_user.id].permission_level
         self._replace_patterns: Dict[str, str] = dict()
 
+    def command_platforms(self) -> int:
+        return SupportedPlatforms.TELEGRAM
+
     async def send_message(self, message: str, *args, **kwargs) -> None:
         if self.silent:
             return
@@ -36,7 +36,7 @@ class TelegramBotInstance(BotInstance):
         if not check_auth(update):
             return
         bc.message_cache.push(update.message.chat.id, CachedMsg(text, str(update.message.from_user.id)))
-        bc.markov.add_string(text)
+        bc.markov_ingest.push(text)
         await MessageProcessing.process_responses(TelegramExecutionContext(update, context), text)
         await MessageProcessing.process_repetitions(TelegramExecutionContext(update, context))
         await bc.plugin_manager.broadcast_command("on_message", TelegramExecutionContext(update, context))
@@ -0,0 +1,256 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import zlib
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src import const
+from src.log import log
+from src.utils import Time, Util
+
+# Random 64-bit values for every byte value. They are derived from SHA-256, so chunk boundaries are stable
+_GEAR = np.frombuffer(b''.join(hashlib.sha256(bytes([i])).digest()[:8] for i in range(256)), dtype='<u8')
+
+
+class BackupStore:
+    """Content-addressed store of file backups.
+
+    Every file is split into content-defined chunks: chunk ends where rolling hash of last CHUNK_WINDOW bytes
+    has CHUNK_BITS leading zero bits, so insertion of data changes only chunks around it.
+    Chunks are stored once under chunks/ by SHA-256 of their content. Every backup is a JSON manifest
+    under snapshots/ that lists chunks of the file.
+    Zip archives <name>_<time><ext>.zip that were created before the store was introduced are kept in the root
+    directory of the store. They are removed by retention policy together with snapshots of the same file"""
+
+    CHUNK_WINDOW = 16
+    CHUNK_BITS = 16  # average chunk size is 64 KiB
+    CHUNK_MIN_SIZE = 16 << 10
+    CHUNK_MAX_SIZE = 256 << 10
+    READ_BLOCK_SIZE = 4 << 20
+    TIME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+    # Retention periods: name -> function that maps snapshot time to period
+    RETENTION_PERIODS = {
+        "hourly": lambda time: (time.date(), time.hour),
+        "daily": lambda time: time.date(),
+        "weekly": lambda time: time.isocalendar()[:2],
+    }
+
+    _LEGACY_BACKUP_REGEX = re.compile(r"^(.*)_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})(\.[^.]*)?\.zip$")
+
+    # First byte of stored chunk
+    _RAW_CHUNK = b"\x00"
+    _COMPRESSED_CHUNK = b"\x01"
+
+    def __init__(self, path: str = const.BACKUP_DIRECTORY, compress: bool = True) -> None:
+        self.path = path
+        self.compress = compress
+        self._chunks_path = os.path.join(path, "chunks")
+        self._snapshots_path = os.path.join(path, "snapshots")
+
+    @classmethod
+    def _window_hashes(cls, data: np.ndarray) -> np.ndarray:
+        """Get hashes of all windows of CHUNK_WINDOW bytes. Item i is the hash of window that ends at data[i]"""
+        gear = _GEAR[data]
+        hashes = gear.copy()
+        for shift in range(1, cls.CHUNK_WINDOW):
+            hashes[shift:] += gear[:-shift] << np.uint64(shift)
+        return hashes[cls.CHUNK_WINDOW - 1:]
+
+    @classmethod
+    def split(cls, f: BinaryIO) -> Iterator[bytes]:
+        """Split file to content-defined chunks"""
+        pending = b""
+        tail = np.zeros(0, dtype=np.uint8)
+        while True:
+            block = f.read(cls.READ_BLOCK_SIZE)
+            if not block:
+                break
+            data = np.concatenate((tail, np.frombuffer(block, dtype=np.uint8)))
+            boundaries = np.flatnonzero(cls._window_hashes(data) >> np.uint64(64 - cls.CHUNK_BITS) == 0)
+            # Convert indexes of windows to chunk end offsets in pending
+            ends = boundaries + (cls.CHUNK_WINDOW - len(tail) + len(pending))
+            pending += block
+            start = 0
+            for end in ends.tolist():
+                if end - start < cls.CHUNK_MIN_SIZE:
+                    continue
+                while end - start > cls.CHUNK_MAX_SIZE:
+                    yield pending[start:start + cls.CHUNK_MAX_SIZE]
+                    start += cls.CHUNK_MAX_SIZE
+                yield pending[start:end]
+                start = end
+            while len(pending) - start > cls.CHUNK_MAX_SIZE:
+                yield pending[start:start + cls.CHUNK_MAX_SIZE]
+                start += cls.CHUNK_MAX_SIZE
+            pending = pending[start:]
+            tail = data[len(data) - min(len(data), cls.CHUNK_WINDOW - 1):]
+        if pending:
+            yield pending
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self._chunks_path, digest[:2], digest)
+
+    def _snapshot_path(self, snapshot_id: str) -> str:
+        return os.path.join(self._snapshots_path, snapshot_id + ".json")
+
+    def _write_chunk(self, digest: str, chunk: bytes) -> int:
+        """Store chunk if it is not stored yet. Returns number of written bytes"""
+        path = self._chunk_path(digest)
+        if os.path.isfile(path):
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = self._COMPRESSED_CHUNK + zlib.compress(chunk) if self.compress else self._RAW_CHUNK + chunk
+        with Util.atomic_write(path) as f:
+            f.write(data)
+        return len(data)
+
+    def _read_chunk(self, digest: str) -> bytes:
+        with open(self._chunk_path(digest), 'rb') as f:
+            data = f.read()
+        chunk = zlib.decompress(data[1:]) if data[:1] == self._COMPRESSED_CHUNK else data[1:]
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise ValueError(f"Backup chunk {digest} is corrupted")
+        return chunk
+
+    def backup(self, path: str) -> str:
+        """Create backup of file. Returns snapshot id"""
+        file_hash = hashlib.sha256()
+        chunks = []
+        size = written = 0
+        with open(path, 'rb') as f:
+            for chunk in self.split(f):
+                digest = hashlib.sha256(chunk).hexdigest()
+                written += self._write_chunk(digest, chunk)
+                file_hash.update(chunk)
+                chunks.append(digest)
+                size += len(chunk)
+        name = os.path.basename(path)
+        time = Time().now().strftime(self.TIME_FORMAT)
+        snapshot_id = f"{name}_{time}"
+        index = 1
+        while os.path.isfile(self._snapshot_path(snapshot_id)):
+            snapshot_id = f"{name}_{time}_{index}"
+            index += 1
+        manifest = {
+            "id": snapshot_id,
+            "file": name,
+            "time": time,
+            "size": size,
+            "sha256": file_hash.hexdigest(),
+            "chunks": chunks,
+        }
+        os.makedirs(self._snapshots_path, exist_ok=True)
+        with Util.atomic_write(self._snapshot_path(snapshot_id)) as f:
+            f.write(json.dumps(manifest, indent=1).encode("utf-8"))
+        log.info(
+            f"Created backup for {path}: {snapshot_id} ({len(chunks)} chunks, "
+            f"{written} bytes of new chunks are written)")
+        return snapshot_id
+
+    def _manifests(self) -> Tuple[List[Dict[str, Any]], int]:
+        """Get manifests of all snapshots and number of manifests that can not be read"""
+        if not os.path.isdir(self._snapshots_path):
+            return [], 0
+        result = []
+        failed = 0
+        for entry in os.listdir(self._snapshots_path):
+            if not entry.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self._snapshots_path, entry), 'r', encoding="utf-8") as f:
+                    manifest = json.load(f)
+                if not all(key in manifest for key in ("id", "file", "time", "chunks")):
+                    raise ValueError("Manifest does not have required fields")
+            except Exception:
+                log.error(f"Backup manifest {entry} can not be read!", exc_info=True)
+                failed += 1
+                continue
+            result.append(manifest)
+        return result, failed
+
+    def snapshots(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get manifests of snapshots (of file with specified name) sorted by time"""
+        result = [manifest for manifest in self._manifests()[0] if name is None or manifest["file"] == name]
+        return sorted(result, key=lambda manifest: (manifest["time"], manifest["id"]))
+
+    def legacy_backups(self) -> List[Dict[str, Any]]:
+        """Get zip archives that were created before the store was introduced in the form of manifests.
+        Archive file name is used as id"""
+        if not os.path.isdir(self.path):
+            return []
+        result = []
+        for entry in os.listdir(self.path):
+            match = self._LEGACY_BACKUP_REGEX.match(entry)
+            if match is None or not os.path.isfile(os.path.join(self.path, entry)):
+                continue
+            name, time, ext = match.groups()
+            result.append({"id": entry, "file": name + (ext or ""), "time": time})
+        return sorted(result, key=lambda manifest: (manifest["time"], manifest["id"]))
+
+    def restore(self, snapshot_id: str, path: str) -> None:
+        """Restore file from snapshot. Content is verified before file at path is replaced"""
+        with open(self._snapshot_path(snapshot_id), 'r', encoding="utf-8") as f:
+            manifest = json.load(f)
+        file_hash = hashlib.sha256()
+        with Util.atomic_write(path) as f:
+            for digest in manifest["chunks"]:
+                chunk = self._read_chunk(digest)
+                file_hash.update(chunk)
+                f.write(chunk)
+            if file_hash.hexdigest() != manifest["sha256"]:
+                raise ValueError(f"Backup {snapshot_id} is corrupted")
+        log.info(f"Restored {path} from backup {snapshot_id}")
+
+    @classmethod
+    def retained(cls, snapshots: List[Dict[str, Any]], retention: Dict[str, int]) -> Set[str]:
+        """Get ids of snapshots that are kept by retention policy: the latest snapshot of a file and the latest
+        snapshot in each of N last hours/days/weeks that have snapshots"""
+        result = set()
+        files: Dict[str, List[Dict[str, Any]]] = dict()
+        for manifest in snapshots:
+            files.setdefault(manifest["file"], []).append(manifest)
+        for manifests in files.values():
+            manifests = sorted(manifests, key=lambda manifest: (manifest["time"], manifest["id"]), reverse=True)
+            result.add(manifests[0]["id"])
+            for period, get_period in cls.RETENTION_PERIODS.items():
+                periods: Set[Any] = set()
+                for manifest in manifests:
+                    if len(periods) >= retention.get(period, 0):
+                        break
+                    key = get_period(datetime.datetime.strptime(manifest["time"], cls.TIME_FORMAT))
+                    if key not in periods:
+                        periods.add(key)
+                        result.add(manifest["id"])
+        return result
+
+    def prune(self, retention: Dict[str, int]) -> List[str]:
+        """Remove snapshots and legacy zip backups that are not kept by retention policy and chunks that are
+        not used anymore. Chunks are not removed if some manifests can not be read, since they can refer to them.
+        Returns ids of removed snapshots"""
+        snapshots, failed = self._manifests()
+        legacy_backups = self.legacy_backups()
+        retained = self.retained(snapshots + legacy_backups, retention)
+        removed = [manifest["id"] for manifest in snapshots if manifest["id"] not in retained]
+        for snapshot_id in removed:
+            os.remove(self._snapshot_path(snapshot_id))
+        for manifest in legacy_backups:
+            if manifest["id"] not in retained:
+                os.remove(os.path.join(self.path, manifest["id"]))
+                removed.append(manifest["id"])
+        used = set(digest for manifest in snapshots if manifest["id"] in retained for digest in manifest["chunks"])
+        removed_chunks = 0
+        if failed:
+            log.warning(f"Unused backup chunks are not removed since {failed} backup manifests can not be read")
+        elif os.path.isdir(self._chunks_path):
+            for directory in os.listdir(self._chunks_path):
+                for digest in os.listdir(os.path.join(self._chunks_path, directory)):
+                    if digest not in used:
+                        os.remove(os.path.join(self._chunks_path, directory, digest))
+                        removed_chunks += 1
+        if removed:
+            log.info(f"Removed {len(removed)} backups and {removed_chunks} chunks that are not used anymore")
+        return removed
@@ -3,6 +3,7 @@ import itertools
 from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Union
 
 from src import const
+from src.command_index import CommandIndex
 from src.executor import Executor
 from src.log import log
 from src.message_cache import MessageCache
@@ -20,6 +21,8 @@ if TYPE_CHECKING:
     from src.backend.discord.commands import Commands
     from src.config import Config, SecretConfig
     from src.markov import Markov
+    from src.markov_ingest import MarkovIngestQueue
+    from src.markov_pool import MarkovResponsePool
 
 
 @enum.unique
@@ -46,6 +49,8 @@ class BotController:
         def __init__(self) -> None:
             self.bot_user: 'Optional[ClientUser]' = None
             self.commands: 'Commands' = None
+            # Names of commands and aliases of self.commands
+            self.command_index = CommandIndex()
             self.get_channel: Optional[Callable] = None
             self.get_user: Optional[Callable] = None
             self.background_loop: 'Optional[asyncio.AbstractEventLoop]' = None
@@ -86,6 +91,8 @@ class BotController:
         self.deployment_time = Time().now()
         self.config: 'Optional[Config]' = None
         self.markov: 'Optional[Markov]' = None
+        self.markov_ingest: 'Optional[MarkovIngestQueue]' = None
+        self.markov_pool: 'Optional[MarkovResponsePool]' = None
         self.secret_config: 'Optional[SecretConfig]' = None
         self.yaml_loader: 'Optional[Union[yaml.Loader, yaml.CLoader]]' = None
         self.yaml_dumper: 'Optional[Union[yaml.Dumper, yaml.CDumper]]' = None
@@ -33,9 +33,11 @@ class AuthCommands(BaseCmd):
         if execution_ctx.update.message.from_user.id not in bc.config.telegram.users.keys():
             bc.config.telegram.users[execution_ctx.update.message.from_user.id] = User(
                 execution_ctx.update.message.from_user.id)
+            bc.config.mark_dirty("telegram")
         passphrase = execution_ctx.context.args[0] if execution_ctx.context.args else ""
         if passphrase == bc.config.telegram.passphrase:
             bc.config.telegram.channel_whitelist.add(execution_ctx.update.effective_chat.id)
+            bc.config.mark_dirty("telegram")
             await Command.send_message(execution_ctx, "Channel has been added to whitelist")
         else:
             await Command.send_message(execution_ctx, "Wrong passphrase!")
@@ -46,5 +48,6 @@ class AuthCommands(BaseCmd):
         if not await Command.check_args_count(execution_ctx, cmd_line, min=1, max=1):
             return
         bc.config.telegram.passphrase = uuid.uuid4().hex
+        bc.config.mark_dirty("telegram")
         log.warning("Passphrase has been changed. New passphrase: " + bc.config.telegram.passphrase)
         await Command.send_message(execution_ctx, 'Passphrase has been reset!')
@@ -181,6 +181,10 @@ class BuiltinCommands(BaseCmd):
                         result += inspect.getdoc(bc.discord.commands.data[args.command_name].get_actor()) or ""
             if not result:
                 result = f"Unknown command '{args.command_name}'"
+                if execution_ctx.platform == const.BotBackend.DISCORD:
+                    completions = bc.discord.command_index.complete(args.command_name)
+                    if completions:
+                        result += f", commands that start with it: {', '.join(completions[:10])}"
             await Command.send_message(execution_ctx, result)
             return
         # !help
@@ -327,6 +331,7 @@ class BuiltinCommands(BaseCmd):
             return None
         command = ' '.join(cmd_line[1:])
         bc.config.on_mention_command = command
+        bc.config.mark_dirty()
         await Command.send_message(execution_ctx, f"Command '{command}' was set on bot mention")
 
     async def _profile(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -38,6 +38,7 @@ class CustomCmdsCommands(BaseCmd):
             subcommand=True, impl_message=external_cmd_line)
         bc.discord.commands.data[command_name] = LegacyDiscordCommand(
             command_name, cmd_line=external_cmd_line)
+        bc.discord.command_index.add(command_name)
         if execution_ctx.platform == const.BotBackend.DISCORD:
             bc.discord.commands.data[command_name].channels.append(execution_ctx.message.channel.id)
         if bc.be.is_running(const.BotBackend.TELEGRAM):
@@ -78,6 +79,7 @@ class CustomCmdsCommands(BaseCmd):
                 execution_ctx, f"WARN: Command '{command_name}' does not exist (on Discord backend")
         bc.executor.commands.pop(command_name, None)
         bc.discord.commands.data.pop(command_name, None)
+        bc.discord.command_index.remove(command_name)
         if bc.be.is_running(const.BotBackend.TELEGRAM) and command_name in bc.telegram.handlers.keys():
             remove_handler(bc.telegram.app, command_name)
         return await Command.send_message(execution_ctx, f"Command '{command_name}' successfully deleted")
@@ -5,6 +5,7 @@ from typing import List, Optional
 
 from src import const
 from src.api.command import BaseCmd, Command, Implementation
+from src.api.dispatcher import dispatcher
 from src.api.execution_context import ExecutionContext
 from src.bc import DoNotUpdateFlag
 from src.config import bc
@@ -27,6 +28,21 @@ class _DebugCommand:
     def diag_do_not_update(self) -> str:
         return json.dumps(dict(zip([member.name for member in DoNotUpdateFlag], bc.do_not_update)))
 
+    def diag_autosave(self) -> str:
+        return json.dumps({
+            "save_cycles": bc.config.save_cycles,
+            "save_stats": bc.config.save_stats,
+            "revisions": {
+                **bc.config.revisions,
+                "secret config": getattr(bc.secret_config, "revision", None),
+                "Markov model": getattr(bc.markov, "revision", None),
+            },
+            "saved_revisions": bc.config.saved_revisions,
+        })
+
+    def diag_latency(self) -> str:
+        return json.dumps(dispatcher.latency_summary(self._args))
+
 
 class DebugCommands(BaseCmd):
     def bind(self) -> None:
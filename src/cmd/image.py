@@ -7,8 +7,6 @@ import tempfile
 import urllib
 from typing import List
 
-import magic
-
 from src import const
 from src.algorithms import levenshtein_distance
 from src.api.command import BaseCmd, Command, Implementation
@@ -17,6 +15,8 @@ from src.config import bc
 from src.log import log
 from src.utils import Util
 
+magic = Util.lazy_import("magic")
+
 
 class _ImageInternals:
     @staticmethod
@@ -7,6 +7,9 @@ from src import const
 from src.api.command import BaseCmd, Command, Implementation
 from src.api.execution_context import ExecutionContext
 from src.config import bc
+from src.markov import collect_garbage_incrementally
+from src.markov_ngram import NgramMarkov
+from src.markov_pool import MarkovResponsePool
 from src.utils import Util, null
 
 
@@ -54,22 +57,41 @@ class MarkovCommands(BaseCmd):
         bc.executor.commands["delmarkovignoredprefix"] = Command(
             "markov", "delmarkovignoredprefix", const.Permission.MOD, Implementation.FUNCTION,
             subcommand=False, impl_func=self._delmarkovignoredprefix)
+        bc.executor.commands["setmarkovorder"] = Command(
+            "markov", "setmarkovorder", const.Permission.ADMIN, Implementation.FUNCTION,
+            subcommand=False, impl_func=self._setmarkovorder)
 
     async def _markov(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> Optional[str]:
-        """Generate message using Markov chain
-    Example: !markov"""
+        """Generate message using Markov chain. Use --order option to choose order of Markov chain
+    (number of previous words that next word depends on)
+    Examples:
+        !markov
+        !markov hello
+        !markov --order 2 hello"""
         if not await Command.check_args_count(execution_ctx, cmd_line, min=1):
             return None
-        if len(cmd_line) > 1:
-            result = ""
-            for _ in range(const.MAX_MARKOV_ATTEMPTS):
-                result = bc.markov.generate(word=cmd_line[-1])
-                if len(result.split()) > 1:
-                    break
-            if result != "<Empty message was generated>":
-                result = ' '.join(cmd_line[1:-1]) + ' ' + result
+        # Message text can start with '-', so only explicit --order option is parsed, other words are text
+        words = cmd_line[1:]
+        order = None
+        if words and words[0] == "--order":
+            if len(words) < 2:
+                return null(await Command.send_message(execution_ctx, "Order of Markov chain is not specified"))
+            order = await Util.parse_int(
+                execution_ctx, words[1], "Order of Markov chain should be an integer")
+            if order is None:
+                return None
+            if order not in (1, *NgramMarkov.STATE_SIZES):
+                return null(await Command.send_message(
+                    execution_ctx,
+                    f"Order of Markov chain should be one of: {', '.join(map(str, (1, *NgramMarkov.STATE_SIZES)))}"))
+            words = words[2:]
+        word = words[-1] if words else ""
+        if bc.markov_pool is not None:
+            result = bc.markov_pool.get(word, order)
         else:
-            result = bc.markov.generate()
+            result = MarkovResponsePool.generate(bc.markov, word, order)
+        if words and result != "<Empty message was generated>":
+            result = ' '.join(words[:-1]) + ' ' + result
         if execution_ctx.platform == const.BotBackend.DISCORD:
             if not bc.config.discord.guilds[execution_ctx.message.channel.guild.id].markov_pings:
                 result = await execution_ctx.disable_pings(result)
@@ -81,8 +103,8 @@ class MarkovCommands(BaseCmd):
     Example: !markovgc"""
         if not await Command.check_args_count(execution_ctx, cmd_line, min=1, max=1):
             return None
-        result = bc.markov.collect_garbage()
-        result = f"Garbage collected {len(result)} items: {', '.join(result)}"
+        removed = await collect_garbage_incrementally(bc.markov)
+        result = f"Garbage collected {len(removed)} items: {', '.join(removed)}"
         await Command.send_message(execution_ctx, result)
         return result
 
@@ -154,7 +176,7 @@ class MarkovCommands(BaseCmd):
     Example: !dropmarkov"""
         if not await Command.check_args_count(execution_ctx, cmd_line, min=1, max=1):
             return None
-        bc.markov.__init__()
+        bc.markov.drop()
         await Command.send_message(execution_ctx, "Markov database has been dropped!")
 
     async def _statmarkov(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -162,10 +184,10 @@ class MarkovCommands(BaseCmd):
     Example: !statmarkov"""
         if not await Command.check_args_count(execution_ctx, cmd_line, min=1, max=1):
             return None
-        pairs_count = sum(word.total_next for word in bc.markov.model.values())
-        markov_db_size = os.path.getsize(const.MARKOV_PATH)
+        pairs_count = bc.markov.pairs_count()
+        markov_db_size = os.path.getsize(bc.markov.STORAGE_PATH)
         while markov_db_size == 0:
-            markov_db_size = os.path.getsize(const.MARKOV_PATH)
+            markov_db_size = os.path.getsize(bc.markov.STORAGE_PATH)
             await asyncio.sleep(1)
         if markov_db_size > 1024 * 1024:
             markov_db_size = f"{(markov_db_size / (1024 * 1024)):.2f} MB"
@@ -173,9 +195,21 @@ class MarkovCommands(BaseCmd):
             markov_db_size = f"{markov_db_size / 1024:.2f} KB"
         result = (f"Markov module stats:\n"
                   f"Markov chains generated: {bc.markov.chains_generated}\n"
-                  f"Words count: {len(bc.markov.model)}\n"
-                  f"Pairs (word -> word) count: {pairs_count}\n"
-                  f"Markov database size: {markov_db_size}\n")
+                  f"Words count: {bc.markov.words_count()}\n"
+                  f"Pairs (word -> word) count: {pairs_count}\n")
+        if getattr(bc.markov, "ngram", None) is not None:
+            result += (f"Order of Markov chain: {bc.markov.ngram.state_size}\n"
+                       f"States count: {bc.markov.ngram.states_count()}\n"
+                       f"Transitions (state -> word) count: {bc.markov.ngram.pairs_count()}\n")
+        result += f"Markov database size: {markov_db_size}\n"
+        if bc.markov_ingest is not None:
+            stats = bc.markov_ingest.stats()
+            result += (f"Ingestion queue: {stats['pending']} pending, {stats['processed']} processed, "
+                       f"{stats['dropped']} dropped, {stats['backpressure']} pushes under backpressure\n")
+        if bc.markov_pool is not None:
+            stats = bc.markov_pool.stats()
+            result += (f"Response pool: {stats['hits']} hits, {stats['misses']} misses, {stats['pooled']} "
+                       f"pre-generated messages for begin node and {stats['start_words']} start words\n")
         await Command.send_message(execution_ctx, result)
 
     async def _inspectmarkov(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -202,6 +236,7 @@ class MarkovCommands(BaseCmd):
         if not await Command.check_args_count(execution_ctx, cmd_line, min=2, max=2):
             return None
         bc.markov.filters.append(re.compile(cmd_line[1], re.DOTALL))
+        bc.markov.mark_dirty()
         await Command.send_message(execution_ctx, f"Filter '{cmd_line[1]}' was successfully added for Markov model")
 
     async def _listmarkovfilter(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> Optional[str]:
@@ -227,6 +262,7 @@ class MarkovCommands(BaseCmd):
             return
         if 0 <= index < len(bc.markov.filters):
             bc.markov.filters.pop(index)
+            bc.markov.mark_dirty()
             await Command.send_message(execution_ctx, "Successfully deleted filter!")
         else:
             await Command.send_message(execution_ctx, "Invalid index of filter!")
@@ -240,6 +276,8 @@ class MarkovCommands(BaseCmd):
         index = bc.config.ids["markov_ignored_prefix"]
         bc.markov.ignored_prefixes[index] = ' '.join(cmd_line[1:])
         bc.config.ids["markov_ignored_prefix"] += 1
+        bc.config.mark_dirty()
+        bc.markov.mark_dirty()
         await Command.send_message(execution_ctx, f"Added '{prefix}' as ignored prefix for Markov model")
 
     async def _listmarkovignoredprefix(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -263,6 +301,26 @@ class MarkovCommands(BaseCmd):
             return
         if index in bc.markov.ignored_prefixes.keys():
             bc.markov.ignored_prefixes.pop(index)
+            bc.markov.mark_dirty()
             await Command.send_message(execution_ctx, "Successfully deleted ignored prefix!")
         else:
             await Command.send_message(execution_ctx, "Invalid index of ignored prefix!")
+
+    async def _setmarkovorder(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
+        """Set order of Markov chain (number of previous words that next word depends on) that is used by default.
+    Markov chain of order 2 or 3 is trained by new messages only
+    Example: !setmarkovorder 2"""
+        if not await Command.check_args_count(execution_ctx, cmd_line, min=2, max=2):
+            return None
+        if not hasattr(bc.markov, "set_state_size"):
+            return null(await Command.send_message(
+                execution_ctx, "Markov chains of higher order are not supported by this Markov model"))
+        order = await Util.parse_int(
+            execution_ctx, cmd_line[1], f"Second parameter for '{cmd_line[0]}' should be an order of Markov chain")
+        if order is None:
+            return None
+        if not 1 <= order <= max(NgramMarkov.STATE_SIZES):
+            return null(await Command.send_message(
+                execution_ctx, f"Order of Markov chain should be in range [1..{max(NgramMarkov.STATE_SIZES)}]"))
+        bc.markov.set_state_size(order, const.MARKOV_NGRAM_PATH)
+        await Command.send_message(execution_ctx, f"Order of Markov chain is set to {order}")
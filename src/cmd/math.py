@@ -142,7 +142,11 @@ class MathCommands(BaseCmd):
         execution_ctx.silent = True
         try:
             for _ in range(loop_count):
-                result += await bc.executor.commands[subcommand[0]].run(subcommand, execution_ctx) + ' '
+                iteration_result = await bc.executor.commands[subcommand[0]].run(subcommand, execution_ctx)
+                if iteration_result is None:
+                    # Command failed or limits of command message are reached
+                    break
+                result += iteration_result + ' '
         except KeyError:
             execution_ctx.silent = silent_state
             await Command.send_message(execution_ctx, f"Unknown command '{subcommand[0]}'")
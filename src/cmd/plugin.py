@@ -155,9 +155,11 @@ class PluginCommands(BaseCmd):
             cmd = cmd_line[2]
             if cmd == "enable":
                 bc.config.plugins[plugin_name]["autostart"] = True
+                bc.config.mark_dirty()
                 await Command.send_message(execution_ctx, f"Autostart for plugin '{plugin_name}' has been enabled")
             elif cmd == "disable":
                 bc.config.plugins[plugin_name]["autostart"] = False
+                bc.config.mark_dirty()
                 await Command.send_message(execution_ctx, f"Autostart for plugin '{plugin_name}' has been disabled")
             else:
                 await Command.send_message(
@@ -72,6 +72,7 @@ class RandomCommands(BaseCmd):
         index = bc.config.ids["quote"]
         bc.config.quotes[index] = Quote(quote, execution_ctx.message_author())
         bc.config.ids["quote"] += 1
+        bc.config.mark_dirty("quotes")
         await Command.send_message(
             execution_ctx, f"Quote '{quote}' was successfully added to quotes database with index {index}")
 
@@ -97,6 +98,7 @@ class RandomCommands(BaseCmd):
             return
         if index in bc.config.quotes.keys():
             bc.config.quotes.pop(index)
+            bc.config.mark_dirty("quotes")
             await Command.send_message(execution_ctx, f"Successfully deleted quote {index}!")
         else:
             await Command.send_message(execution_ctx, "Invalid index of quote!")
@@ -113,6 +115,7 @@ class RandomCommands(BaseCmd):
         if index in bc.config.quotes.keys():
             author = ' '.join(cmd_line[2:])
             bc.config.quotes[index].author = author
+            bc.config.mark_dirty("quotes")
             await Command.send_message(
                 execution_ctx, f"Successfully set author '{author}' for quote '{bc.config.quotes[index].quote()}'")
         else:
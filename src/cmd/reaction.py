@@ -32,11 +32,11 @@ class ReactionCommands(BaseCmd):
             supported_platforms=SupportedPlatforms.DISCORD)
         bc.executor.commands["addresponse"] = Command(
             "reaction", "addresponse", const.Permission.MOD, Implementation.FUNCTION,
-            subcommand=False, impl_func=self._addresponse,
+            subcommand=False, impl_func=self._addresponse, postpone_execution=True,
             supported_platforms=(SupportedPlatforms.DISCORD | SupportedPlatforms.TELEGRAM))
         bc.executor.commands["updresponse"] = Command(
             "reaction", "updresponse", const.Permission.MOD, Implementation.FUNCTION,
-            subcommand=False, impl_func=self._updresponse,
+            subcommand=False, impl_func=self._updresponse, postpone_execution=True,
             supported_platforms=(SupportedPlatforms.DISCORD | SupportedPlatforms.TELEGRAM))
         bc.executor.commands["delresponse"] = Command(
             "reaction", "delresponse", const.Permission.MOD, Implementation.FUNCTION,
@@ -54,6 +54,7 @@ class ReactionCommands(BaseCmd):
             return None
         bc.config.reactions[bc.config.ids["reaction"]] = Reaction(' '.join(cmd_line[2:]), cmd_line[1])
         bc.config.ids["reaction"] += 1
+        bc.config.mark_dirty("reactions")
         await Command.send_message(
             execution_ctx, f"Reaction '{cmd_line[1]}' on '{' '.join(cmd_line[2:])}' successfully added")
 
@@ -68,6 +69,7 @@ class ReactionCommands(BaseCmd):
             return
         if index in bc.config.reactions.keys():
             bc.config.reactions[index] = Reaction(' '.join(cmd_line[3:]), cmd_line[2])
+            bc.config.mark_dirty("reactions")
             await Command.send_message(
                 execution_ctx, f"Reaction '{cmd_line[1]}' on '{' '.join(cmd_line[2:])}' successfully updated")
         else:
@@ -85,6 +87,7 @@ class ReactionCommands(BaseCmd):
             return
         if index in bc.config.reactions.keys():
             bc.config.reactions.pop(index)
+            bc.config.mark_dirty("reactions")
             await Command.send_message(execution_ctx, "Successfully deleted reaction!")
         else:
             await Command.send_message(execution_ctx, "Invalid index of reaction!")
@@ -112,6 +115,7 @@ class ReactionCommands(BaseCmd):
         regex, text = parts
         bc.config.responses[bc.config.ids["response"]] = Response(regex, text)
         bc.config.ids["response"] += 1
+        bc.config.mark_dirty("responses")
         await Command.send_message(execution_ctx, f"Response '{text}' on '{regex}' successfully added")
 
     async def _updresponse(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -131,6 +135,7 @@ class ReactionCommands(BaseCmd):
                 execution_ctx, "You need to provide regex and text that are separated by semicolon (;)")
         regex, text = parts
         bc.config.responses[index] = Response(regex, text)
+        bc.config.mark_dirty("responses")
         await Command.send_message(execution_ctx, f"Response '{text}' on '{regex}' successfully updated")
 
     async def _delresponse(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -146,6 +151,7 @@ class ReactionCommands(BaseCmd):
         if index not in bc.config.responses.keys():
             return await Command.send_message(execution_ctx, "Invalid index of response!")
         bc.config.responses.pop(index)
+        bc.config.mark_dirty("responses")
         await Command.send_message(execution_ctx, "Successfully deleted response!")
 
     async def _listresponse(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> Optional[str]:
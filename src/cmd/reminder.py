@@ -17,6 +17,7 @@ from src.api.execution_context import ExecutionContext
 from src.api.reminder import Reminder
 from src.backend.discord.embed import DiscordEmbed
 from src.config import bc
+from src.db.repository import find
 from src.utils import Time, Util, null
 
 
@@ -138,9 +139,9 @@ class _ReminderInternals:
         else:
             reminders_count = len(bc.config.reminders)
         reminder_list = []
-        for index, reminder in bc.config.reminders.items():
-            if is_only_locals and reminder.channel_id != execution_ctx.channel_id():
-                continue
+        reminders = (
+            find(bc.config.reminders, channel_id=execution_ctx.channel_id()) if is_only_locals else bc.config.reminders)
+        for index, reminder in reminders.items():
             notes = "Notes: " + Util.cut_string(reminder.notes, 200) + "\n"
             channel = f'{reminder.backend}: <#{reminder.channel_id}>'
             props = list()
@@ -351,6 +352,7 @@ class ReminderCommands(BaseCmd):
                 current_time.astimezone(tz.gettz(None)).strftime(const.REMINDER_DATETIME_FORMAT),
                 const.BotBackend.DISCORD)
             bc.config.ids["reminder"] += 1
+            bc.config.mark_dirty("reminders")
             await Command.send_message(execution_ctx, f"Reminder '{text}' with id {id_} added at {time}")
         elif execution_ctx.platform == const.BotBackend.TELEGRAM:
             username = (
@@ -360,6 +362,7 @@ class ReminderCommands(BaseCmd):
                 current_time.astimezone(tz.gettz(None)).strftime(const.REMINDER_DATETIME_FORMAT),
                 const.BotBackend.TELEGRAM)
             bc.config.ids["reminder"] += 1
+            bc.config.mark_dirty("reminders")
             await Command.send_message(execution_ctx, f"Reminder '{text}' with id {id_} added at {time}")
         else:
             await Command.send_message(
@@ -410,6 +413,7 @@ class ReminderCommands(BaseCmd):
             bc.config.reminders[index].channel_id = execution_ctx.channel_id()
             bc.config.reminders[index].time_created = (
                 current_time.astimezone(tz.gettz(None)).strftime(const.REMINDER_DATETIME_FORMAT))
+            bc.config.mark_dirty("reminders")
             await Command.send_message(execution_ctx, f"Successfully updated reminder {index}: '{text}' at {time}")
         else:
             await Command.send_message(
@@ -447,6 +451,7 @@ class ReminderCommands(BaseCmd):
             if index in bc.config.reminders.keys():
                 passed.append(cmd_line[i])
                 bc.config.reminders.pop(index)
+                bc.config.mark_dirty("reminders")
             else:
                 errors.append(cmd_line[i])
         result = ""
@@ -476,6 +481,7 @@ class ReminderCommands(BaseCmd):
         if index not in bc.config.reminders.keys():
             return await Command.send_message(execution_ctx, f"Reminder with index {index} not found")
         bc.config.reminders[index].ping_users.append(execution_ctx.message_author())
+        bc.config.mark_dirty("reminders")
         await Command.send_message(execution_ctx, f"You will be mentioned when reminder {index} is sent")
 
     async def _remindwme(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -491,10 +497,12 @@ class ReminderCommands(BaseCmd):
             return await Command.check_args_count(execution_ctx, "Invalid index of reminder!")
         if execution_ctx.platform == const.BotBackend.DISCORD:
             bc.config.reminders[index].discord_whisper_users.append(execution_ctx.message_author_id())
+            bc.config.mark_dirty("reminders")
             await Command.send_message(
                 execution_ctx, f"You will be notified in direct messages when reminder {index} is sent")
         elif execution_ctx.platform == const.BotBackend.TELEGRAM:
             bc.config.reminders[index].telegram_whisper_users.append(execution_ctx.message_author_id())
+            bc.config.mark_dirty("reminders")
             await Command.send_message(
                 execution_ctx, f"You will be notified in direct messages when reminder {index} is sent")
         else:
@@ -515,6 +523,7 @@ class ReminderCommands(BaseCmd):
         if index not in bc.config.reminders.keys():
             return await Command.send_message(execution_ctx, "Invalid index of reminder!")
         bc.config.reminders[index].email_users.append(email)
+        bc.config.mark_dirty("reminders")
         await Command.send_message(execution_ctx, f"E-mail will be sent to '{email}' when reminder {index} is sent")
 
     async def _repeatreminder(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -598,6 +607,7 @@ class ReminderCommands(BaseCmd):
             return await Command.send_message(
                 execution_ctx, "Duration should be positive or zero (to disable repetition)!")
         bc.config.reminders[index].repeat_after = duration
+        bc.config.mark_dirty("reminders")
         if duration == 0:
             return await Command.send_message(execution_ctx, f"Repetition is disabled for reminder {index}")
         await Command.send_message(
@@ -643,6 +653,7 @@ class ReminderCommands(BaseCmd):
         bc.config.reminders[id_].limit_repetitions_time = rem.limit_repetitions_time
         bc.config.ids["reminder"] += 1
         bc.config.reminders.pop(index)
+        bc.config.mark_dirty("reminders")
         await Command.send_message(
             execution_ctx,
             f"Skipped reminder {index} at {rem.time}, next reminder {id_} "
@@ -696,6 +707,7 @@ class ReminderCommands(BaseCmd):
                 return await Command.send_message(execution_ctx, "Pre reminder time should be less than 1 day")
         rem.prereminders_list = prereminders_list
         rem.used_prereminders_list = [False] * len(prereminders_list)
+        bc.config.mark_dirty("reminders")
         result = f"Set prereminders list for reminder {index}: {', '.join([str(x) for x in rem.prereminders_list])}"
         await Command.send_message(execution_ctx, result)
 
@@ -712,6 +724,7 @@ class ReminderCommands(BaseCmd):
             return await Command.send_message(execution_ctx, "Invalid index of reminder!")
         rem = bc.config.reminders[index]
         rem.notes = ' '.join(cmd_line[2:])
+        bc.config.mark_dirty("reminders")
         await Command.send_message(execution_ctx, f"Set notes for reminder {index}: {rem.notes}")
 
     async def _delremindernotes(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -726,6 +739,7 @@ class ReminderCommands(BaseCmd):
         if index not in bc.config.reminders.keys():
             return await Command.send_message(execution_ctx, "Invalid index of reminder!")
         bc.config.reminders[index].notes = ""
+        bc.config.mark_dirty("reminders")
         await Command.send_message(execution_ctx, f"Notes for reminder {index} have been removed!")
 
     async def _setreminderchannel(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -745,6 +759,7 @@ class ReminderCommands(BaseCmd):
         if channel_id is None:
             return
         rem.channel_id = channel_id
+        bc.config.mark_dirty("reminders")
         await Command.send_message(execution_ctx, f"Set channel id {channel_id} for reminder {index}")
 
     async def _repeatreminderfor(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -764,6 +779,7 @@ class ReminderCommands(BaseCmd):
         if index not in bc.config.reminders.keys():
             return await Command.send_message(execution_ctx, "Invalid index of reminder!")
         bc.config.reminders[index].remaining_repetitions = times
+        bc.config.mark_dirty("reminders")
         await Command.send_message(execution_ctx, f"Max amount of repetitions for reminder {index} is set to {times}")
 
     async def _repeatreminderuntil(self, cmd_line: List[str], execution_ctx: ExecutionContext) -> None:
@@ -789,5 +805,6 @@ class ReminderCommands(BaseCmd):
         if index not in bc.config.reminders.keys():
             return await Command.send_message(execution_ctx, "Invalid index of reminder!")
         bc.config.reminders[index].limit_repetitions_time = str(limit_repetitions_time)
+        bc.config.mark_dirty("reminders")
         await Command.send_message(
             execution_ctx, f"Max repetitions date for reminder {index} is set to {limit_repetitions_time}")
@@ -4,8 +4,6 @@ import subprocess
 import sys
 from typing import List, Optional
 
-from aiogoogletrans import Translator  # type:ignore
-
 from src import const
 from src.api.command import BaseCmd, Command, Implementation
 from src.api.execution_context import ExecutionContext
@@ -13,6 +11,8 @@ from src.config import bc
 from src.exception import HTTPRequestException
 from src.utils import Util
 
+aiogoogletrans = Util.lazy_import("aiogoogletrans")
+
 
 class TimerCommands(BaseCmd):
     def bind(self):
@@ -77,7 +77,7 @@ class TimerCommands(BaseCmd):
     Usage: !translate <lang> <text>"""
         if not await Command.check_args_count(execution_ctx, cmd_line, min=3):
             return None
-        translator = Translator(proxy=Util.proxy.http() or None)
+        translator = aiogoogletrans.Translator(proxy=Util.proxy.http() or None)
         dst_language = cmd_line[1]
         text = " ".join(cmd_line[2:])
         try:
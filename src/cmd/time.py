@@ -71,6 +71,7 @@ class TimeCommands(BaseCmd):
                     "Incorrect timezone. "
                     "Full timezone database list: <https://en.wikipedia.org/wiki/List_of_tz_database_time_zones>")
         execution_ctx.user.data["tz"] = cmd_line[1] if timezone else None
+        bc.config.mark_dirty("telegram" if execution_ctx.platform == const.BotBackend.TELEGRAM else "discord")
         local_tz = Time().now().astimezone().tzinfo
         timezone_str = f"{cmd_line[1]}" if timezone else f"default ({local_tz})"
         await Command.send_message(
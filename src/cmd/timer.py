@@ -54,6 +54,7 @@ class TimerCommands(BaseCmd):
         finish = Time().now() + datetime.timedelta(seconds=duration)
         id_ = bc.config.ids["timer"]
         bc.config.ids["timer"] += 1
+        bc.config.mark_dirty()
         timer_msg = await Msg.response(execution_ctx.message, f"⏰ Timer #{id_}: {finish - start}", execution_ctx.silent)
         bc.do_not_update[DoNotUpdateFlag.TIMER] += 1
         bc.timers[id_] = True
@@ -97,6 +98,7 @@ class TimerCommands(BaseCmd):
         start = Time().now()
         id_ = bc.config.ids["stopwatch"]
         bc.config.ids["stopwatch"] += 1
+        bc.config.mark_dirty()
         stopwatch_msg = await Msg.response(
             execution_ctx.message, f"⏰ Stopwatch #{id_}: {start - start}", execution_ctx.silent)
         bc.do_not_update[DoNotUpdateFlag.STOPWATCH] += 1
@@ -0,0 +1,171 @@
+"""Index of command names and aliases: exact lookup, completion by prefix and suggestions for mistyped names"""
+
+import itertools
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.algorithms import levenshtein_distance
+
+
+class _TrieNode:
+    __slots__ = ("children", "terminal")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _TrieNode] = dict()
+        self.terminal = False
+
+
+class PrefixTrie:
+    """Set of strings that can be queried by prefix"""
+
+    def __init__(self) -> None:
+        self._root = _TrieNode()
+
+    def add(self, word: str) -> None:
+        node = self._root
+        for char in word:
+            node = node.children.setdefault(char, _TrieNode())
+        node.terminal = True
+
+    def remove(self, word: str) -> None:
+        path = [self._root]
+        for char in word:
+            if char not in path[-1].children:
+                return
+            path.append(path[-1].children[char])
+        path[-1].terminal = False
+        # Drop branches that do not lead to any word
+        for i in range(len(word), 0, -1):
+            if path[i].terminal or path[i].children:
+                break
+            del path[i - 1].children[word[i - 1]]
+
+    def complete(self, prefix: str) -> List[str]:
+        """Get words that start with prefix in lexicographic order"""
+        node = self._root
+        for char in prefix:
+            if char not in node.children:
+                return []
+            node = node.children[char]
+        result = []
+        stack = [(prefix, node)]
+        while stack:
+            word, node = stack.pop()
+            if node.terminal:
+                result.append(word)
+            stack.extend((word + char, child) for char, child in sorted(node.children.items(), reverse=True))
+        return result
+
+
+class _BKNode:
+    __slots__ = ("word", "order", "children")
+
+    def __init__(self, word: str, order: Tuple[int, int]) -> None:
+        self.word = word
+        self.order = order
+        self.children: Dict[int, _BKNode] = dict()
+
+
+class BKTree:
+    """Burkhard-Keller tree of words by Levenshtein distance. Nearest word is found without computing distance to
+    every word: subtrees that can't contain closer words are skipped by triangle inequality.
+    Removed words are only marked as removed, tree is rebuilt when most of its words are removed"""
+
+    def __init__(self) -> None:
+        self._root: Optional[_BKNode] = None
+        # Word -> (rank, order of insertion), nearest words with equal distance are resolved by it
+        self._words: Dict[str, Tuple[int, int]] = dict()
+        self._removed_count = 0
+        self._counter = itertools.count()
+
+    def add(self, word: str, rank: int = 0) -> None:
+        """Add word. Words with lower rank are preferred when nearest words have equal distance"""
+        if word in self._words:
+            return
+        order = (rank, next(self._counter))
+        self._words[word] = order
+        node = _BKNode(word, order)
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            if current.word == word:
+                # Word was removed and added again
+                self._removed_count -= 1
+                current.order = order
+                return
+            distance = int(levenshtein_distance(word, current.word))
+            if distance not in current.children:
+                current.children[distance] = node
+                return
+            current = current.children[distance]
+
+    def remove(self, word: str) -> None:
+        if self._words.pop(word, None) is None:
+            return
+        self._removed_count += 1
+        if self._removed_count > len(self._words):
+            words = sorted(self._words.items(), key=lambda item: item[1])
+            self._root = None
+            self._words.clear()
+            self._removed_count = 0
+            for word, (rank, _) in words:
+                self.add(word, rank)
+
+    def nearest(self, word: str) -> Optional[Tuple[str, int]]:
+        """Get the nearest word and distance to it"""
+        best: Optional[Tuple[int, Tuple[int, int], str]] = None
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = int(levenshtein_distance(word, node.word))
+            if node.word in self._words and (best is None or (distance, node.order) < best[:2]):
+                best = (distance, node.order, node.word)
+            for edge, child in node.children.items():
+                if best is None or abs(edge - distance) <= best[0]:
+                    stack.append(child)
+        return None if best is None else (best[2], best[0])
+
+
+class CommandIndex:
+    """Names of commands and aliases. Index is updated when commands and aliases are added or removed"""
+
+    def __init__(self) -> None:
+        # Command or alias name -> command name
+        self._targets: Dict[str, str] = dict()
+        self._trie = PrefixTrie()
+        self._bk_tree = BKTree()
+
+    def rebuild(self, commands: Iterable[str], aliases: Dict[str, str]) -> None:
+        self._targets.clear()
+        self._trie = PrefixTrie()
+        self._bk_tree = BKTree()
+        for name in commands:
+            self.add(name)
+        for alias, target in aliases.items():
+            self.add(alias, target)
+
+    def add(self, name: str, target: Optional[str] = None) -> None:
+        """Add command or alias (if target is set)"""
+        self._targets[name] = target or name
+        self._trie.add(name)
+        # Commands are suggested before aliases with equal distance
+        self._bk_tree.add(name, 0 if target is None else 1)
+
+    def remove(self, name: str) -> None:
+        if self._targets.pop(name, None) is None:
+            return
+        self._trie.remove(name)
+        self._bk_tree.remove(name)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Get command name by command or alias name"""
+        return self._targets.get(name)
+
+    def complete(self, prefix: str) -> List[str]:
+        return self._trie.complete(prefix)
+
+    def suggest(self, name: str) -> str:
+        """Get the most similar command or alias name"""
+        nearest = self._bk_tree.nearest(name)
+        return nearest[0] if nearest is not None else ""
@@ -1,29 +1,31 @@
 import importlib
-import inspect
 import os
 import sys
+import tempfile
 import threading
-import zipfile
-from typing import TYPE_CHECKING, Dict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-import discord
-import yaml
-
-from src import const
+from src import config_codec, const
 from src.api.quote import Quote
 from src.api.reminder import Reminder
 from src.backend.discord.config import DiscordConfig
 from src.backend.telegram.config import TelegramConfig
+from src.backup import BackupStore
 from src.bc import BotController, DoNotUpdateFlag
+from src.db.repository import Repository
+from src.db.sqlite_db import SqliteRepository, open_database, open_repository
 from src.log import log
+from src.markov import CompactMarkov
 from src.shell import Shell
-from src.utils import Time, Util, null
+from src.utils import Util
 
 if TYPE_CHECKING:
     from src.backend.discord.commands import Commands
 
 
 bc = BotController()
+# Serializes writing of config files, it is shared by all Config instances
+_save_lock = threading.Lock()
 
 
 class Command:
@@ -54,118 +56,48 @@ class Command:
         except (AttributeError, KeyError):
             return getattr(getattr(sys.modules["src.backend.discord.commands"], "DiscordCommandBinding"), self.perform)
 
-    @staticmethod
-    async def process_subcommands(content, message, user, safe=False):
-        command_indicators = {
-            ')': '(',
-            ']': '[',
-            '`': '`',
-            '}': '{',
-        }
-        while True:
-            updated = False
-            for i in range(len(content)):
-                if content[i] in command_indicators.keys():
-                    for j in range(i - 1, 0, -1):
-                        if content[j] == command_indicators[content[i]] and content[j - 1] == '$':
-                            updated = True
-                            message.content = content[j + 1:i]
-                            command = message.content.split()
-                            if not command:
-                                return
-                            if command[0] not in bc.config.commands.data.keys():
-                                if command[0] in bc.config.commands.aliases.keys():
-                                    command[0] = bc.config.commands.aliases[command[0]]
-                                else:
-                                    await message.channel.send(f"Unknown command '{command[0]}'")
-                            result = ""
-                            if command and command[0] in bc.discord.commands.data.keys():
-                                log.debug(f"Processing subcommand: {command[0]}: {message.content}")
-                                cmd = bc.discord.commands.data[command[0]]
-                                if cmd.can_be_subcommand():
-                                    result = await cmd.run(message, command, user, silent=True)
-                                    if result is None or (safe and not const.ALNUM_STRING_REGEX.match(content)):
-                                        result = ""
-                                else:
-                                    await message.channel.send(f"Command '{command[0]}' can not be used as subcommand")
-                            content = content[:j - 1] + result + content[i + 1:]
-                            log.debug2(f"Command (during processing subcommands): {content}")
-                            break
-                if updated:
-                    break
-            if not updated:
-                break
-        return content
-
-    async def run(self, message, command, user, silent=False):
-        if len(inspect.stack(0)) >= const.MAX_SUBCOMMAND_DEPTH:
-            return null(await message.channel.send("ERROR: Maximum subcommand depth is reached!"))
-        log.debug(f"Processing command: {message.content}")
-        channel_id = message.channel.id
-        if isinstance(message.channel, discord.Thread):  # Inherit command permissions for threads
-            channel_id = message.channel.parent_id
-        if not self.is_available(channel_id):
-            return null(await message.channel.send(f"Command '{command[0]}' is not available in this channel"))
-        if user is not None and self.permission > user.permission_level:
-            return null(await message.channel.send(f"You don't have permission to call command '{command[0]}'"))
-        self.times_called += 1
-        postpone_execution = [
-            "addcmd",
-            "updcmd",
-            "addextcmd",
-            "updextcmd",
-            "addresponse",
-            "updresponse",
-        ]
-        from src.api.command import Command as ApiCommand
-        from src.backend.discord.context import DiscordExecutionContext
-        if message.content.split(' ')[0][1:] not in postpone_execution:
-            log.debug2(f"Command (before processing): {message.content}")
-            message.content = await ApiCommand.process_variables(
-                DiscordExecutionContext(message), message.content, command)
-            log.debug2(f"Command (after processing variables): {message.content}")
-            message.content = await self.process_subcommands(message.content, message, user)
-            log.debug2(f"Command (after processing subcommands): {message.content}")
-        else:
-            log.debug2("Subcommands are not processed!")
-        if not message.content:
+    @property
+    def permission_level(self):
+        return self.permission
+
+    @property
+    def postpone_execution(self):
+        # Arguments of these commands are command templates, so they are not expanded
+        return self.perform in ("_addcmd", "_updcmd")
+
+    def template(self):
+        if self.message is not None:
+            return self.message, False
+        if self.cmd_line is not None:
+            return self.cmd_line, True
+        return None
+
+    async def execute(self, text, execution_ctx):
+        """Execute command with variables and subcommands already expanded"""
+        message = execution_ctx.message
+        if not text:
             return
-        command = message.content[1:].split(' ')
-        command = list(filter(None, command))
         if self.perform is not None:
-            return await self.get_actor()(message, command, silent)
+            message.content = bc.config.commands_prefix + text
+            return await self.get_actor()(message, list(filter(None, text.split(' '))), execution_ctx.silent)
         elif self.message is not None:
-            response = self.message
-            log.debug2(f"Command (before processing): {response}")
-            response = await ApiCommand.process_variables(DiscordExecutionContext(message), response, command)
-            log.debug2(f"Command (after processing variables): {response}")
-            response = await self.process_subcommands(response, message, user)
-            log.debug2(f"Command (after processing subcommands): {response}")
-            if response:
-                if not silent:
-                    if len(response) > const.DISCORD_MAX_MESSAGE_LENGTH * 5:
-                        await message.channel.send(
-                            "ERROR: Max message length exceeded "
-                            f"({len(response)} > {const.DISCORD_MAX_MESSAGE_LENGTH * 5})")
-                    elif len(const.UNICODE_EMOJI_REGEX.findall(response)) > 50:
-                        await message.channel.send(
-                            "ERROR: Max amount of Unicode emojis for one message exceeded "
-                            f"({len(const.UNICODE_EMOJI_REGEX.findall(response))} > {50})")
-                    else:
-                        for chunk in Util.split_by_chunks(response, const.DISCORD_MAX_MESSAGE_LENGTH):
-                            await message.channel.send(chunk)
-                return response
+            if not execution_ctx.silent:
+                if len(text) > const.DISCORD_MAX_MESSAGE_LENGTH * 5:
+                    await message.channel.send(
+                        "ERROR: Max message length exceeded "
+                        f"({len(text)} > {const.DISCORD_MAX_MESSAGE_LENGTH * 5})")
+                elif len(const.UNICODE_EMOJI_REGEX.findall(text)) > 50:
+                    await message.channel.send(
+                        "ERROR: Max amount of Unicode emojis for one message exceeded "
+                        f"({len(const.UNICODE_EMOJI_REGEX.findall(text))} > {50})")
+                else:
+                    for chunk in Util.split_by_chunks(text, const.DISCORD_MAX_MESSAGE_LENGTH):
+                        await message.channel.send(chunk)
+            return text
         elif self.cmd_line is not None:
-            cmd_line = bc.executor.commands[message.content.split(' ')[0][1:]].impl_message[:]
-            log.debug2(f"Command (before processing): {cmd_line}")
-            cmd_line = await ApiCommand.process_variables(
-                DiscordExecutionContext(message), cmd_line, message.content.split(' '), safe=True)
-            log.debug2(f"Command (after processing variables): {cmd_line}")
-            cmd_line = await self.process_subcommands(cmd_line, message, user, safe=True)
-            log.debug2(f"Command (after processing subcommands): {cmd_line}")
-            return await Shell.run_and_send_stdout(DiscordExecutionContext(message, silent), cmd_line)
+            return await Shell.run_and_send_stdout(execution_ctx, text)
         else:
-            await message.channel.send(f"Command '{command[0]}' is not callable")
+            await message.channel.send(f"Command '{text.split(' ')[0]}' is not callable")
 
 
 class Reaction:
@@ -202,16 +134,47 @@ class User:
         }
 
 
+class _ConfigDomain:
+    """Config attribute that is stored in its own file (see Config.domain_path) and is read on first access.
+    Loaded value is put to instance __dict__, so it shadows this descriptor and later accesses are plain
+    attribute lookups"""
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance: Optional["Config"], owner: Optional[type] = None) -> Any:
+        if instance is None:
+            return self
+        value = instance._load_domain(self.name)
+        instance.__dict__[self.name] = value
+        return value
+
+
 class Config:
+    # Domains are stored in separate files, so they are read only when they are used and written only
+    # when they are changed. Other attributes are stored in main config file
+    commands: "Commands" = _ConfigDomain()
+    reactions: Dict[int, Reaction] = _ConfigDomain()
+    reminders: Dict[int, Reminder] = _ConfigDomain()
+    responses: Dict[int, Response] = _ConfigDomain()
+    quotes: Dict[int, Quote] = _ConfigDomain()
+    discord: DiscordConfig = _ConfigDomain()
+    telegram: TelegramConfig = _ConfigDomain()
+    executor: Dict[str, Dict] = _ConfigDomain()
+    DOMAINS = ("commands", "reactions", "reminders", "responses", "quotes", "discord", "telegram", "executor")
+    # Data that can be stored in SQLite database: (domain, attribute of domain or None, table)
+    DATABASE_TABLES = (
+        ("quotes", None, "quotes"),
+        ("reminders", None, "reminders"),
+        ("discord", "users", "discord_users"),
+        ("discord", "guilds", "discord_guilds"),
+        ("telegram", "users", "telegram_users"),
+    )
+
     def __init__(self):
-        commands = importlib.import_module("src.backend.discord.commands")
-        self.commands: Commands = commands.Commands()
-        self.commands.update()
         self.version = const.CONFIG_VERSION
-        self.reactions: Dict[int, Reaction] = dict()
-        self.reminders: Dict[int, Reminder] = dict()
-        self.responses: Dict[int, Response] = dict()
-        self.quotes: Dict[int, Quote] = dict()
+        for domain in self.DOMAINS:
+            setattr(self, domain, self._new_domain(domain))
         self.plugins = dict()
         self.commands_prefix = "!"
         self.on_mention_command = "markov"
@@ -228,80 +191,263 @@ class Config:
             "backup": {
                 "compress": True,
                 "period": 10,
+                "retention": {
+                    "hourly": 24,
+                    "daily": 7,
+                    "weekly": 4,
+                },
             },
             "period": 10,
         }
         self.repl = {
             "port": 8080,
         }
-        self.discord = DiscordConfig()
-        self.telegram = TelegramConfig()
-        # Executor
-        self.executor = {
-            "commands_data": dict(),
-            "custom_commands": dict(),
-        }
+        # Path to SQLite database that stores DATABASE_TABLES or None if they are stored in config files
+        self.database_path = None
+        # Path to main config file, domain files are read from the directory next to it
+        self._config_file: Optional[str] = None
+        self._reset_save_tracking()
 
-    def backup(self, *files):
-        compress_type = zipfile.ZIP_DEFLATED if self.saving["backup"]["compress"] else zipfile.ZIP_STORED
-        for file in files:
-            path = os.path.dirname(file)
-            name, ext = os.path.splitext(os.path.basename(file))
-            name += "_" + Time().now().strftime("%Y-%m-%d_%H-%M-%S")
-            backup_file = name + ext
-            backup_archive = os.path.join(path, "backup", name + ext + ".zip")
-            try:
-                with zipfile.ZipFile(backup_archive, mode='w') as zf:
-                    zf.write(file, arcname=backup_file, compress_type=compress_type)
-            except Exception as e:
-                log.error(f"Unable to create backup {file} -> {backup_file}: {e}")
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        for attr in ("_config_file", "revisions", "saved_revisions", "_saved_cycles", "save_cycles", "save_stats",
+                     *self.DOMAINS):
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Config files of versions before 0.0.62 contain domains in main config file
+        self.__dict__.update(state)
+        self._config_file = None
+        self._reset_save_tracking()
+
+    @classmethod
+    def load(cls, config_file: str) -> Optional["Config"]:
+        """Read main config file. Domains are read from their files on first access"""
+        config = Util.read_config_file(config_file)
+        if config is not None:
+            config._config_file = config_file
+        return config
+
+    @staticmethod
+    def domain_path(config_file: str, domain: str) -> str:
+        """Get path of domain file: config.yaml -> config.d/<domain>.yaml"""
+        return os.path.join(os.path.splitext(config_file)[0] + ".d", domain + ".yaml")
+
+    def loaded_domains(self) -> List[str]:
+        return [domain for domain in self.DOMAINS if domain in self.__dict__]
+
+    @staticmethod
+    def _new_domain(domain: str) -> Any:
+        if domain == "commands":
+            commands = importlib.import_module("src.backend.discord.commands").Commands()
+            commands.update()
+            return commands
+        if domain == "discord":
+            return DiscordConfig()
+        if domain == "telegram":
+            return TelegramConfig()
+        if domain == "executor":
+            return {
+                "commands_data": dict(),
+                "custom_commands": dict(),
+            }
+        return dict()
+
+    def _load_domain(self, domain: str) -> Any:
+        if self._config_file is None:
+            return self._new_domain(domain)
+        path = self.domain_path(self._config_file, domain)
+        if not os.path.isfile(path):
+            log.warning(f"File '{path}' does not exist, {domain} config is empty")
+            return self._new_domain(domain)
+        value = Util.read_config_file(path)
+        if value is None:
+            return self._new_domain(domain)
+        log.debug(f"Loaded {domain} config from {path}")
+        return value
+
+    def select_storage(self, database_path: Optional[str]) -> None:
+        """Store quotes, reminders, users and guild settings in SQLite database at database_path or in config files
+        if database_path is None. Data is moved from the other storage if it is needed.
+        Domain files keep reference to database tables, so tables are opened when domains are loaded"""
+        if database_path is None and self.database_path is None:
+            # Data is stored in config files already, domains are not loaded to check it
+            return
+        for domain, attr, table in self.DATABASE_TABLES:
+            owner, name = (self, domain) if attr is None else (getattr(self, domain), attr)
+            items = getattr(owner, name)
+            if database_path is not None and not isinstance(items, SqliteRepository):
+                repository = open_repository(database_path, table)
+                repository.replace(items)
+                setattr(owner, name, repository)
+            elif database_path is None and isinstance(items, SqliteRepository):
+                setattr(owner, name, dict(items.items()))
+                log.info(f"Moved {len(getattr(owner, name))} objects from table {table} to config files")
             else:
-                log.info(f"Created backup for {file}: {backup_file}")
+                continue
+            self.mark_dirty(domain)
+        if self.database_path != database_path:
+            self.database_path = database_path
+            self.mark_dirty()
+
+    def _repositories(self, domain: str) -> List[Repository]:
+        # Domains that are not loaded yet do not have repositories with modified objects
+        value = self.__dict__.get(domain)
+        if isinstance(value, Repository):
+            return [value]
+        return [attr for attr in getattr(value, "__dict__", dict()).values() if isinstance(attr, Repository)]
+
+    def _reset_save_tracking(self) -> None:
+        # Incremented on every modification, so saving can be skipped if config is not changed:
+        # "config" (main config file) or domain -> revision
+        self.revisions: Dict[str, int] = {name: 0 for name in ("config", *self.DOMAINS)}
+        # Revisions of config files that are written to disk: file name -> revision
+        self.saved_revisions: Dict[str, int] = dict()
+        # Save cycles that wrote config files: file name -> cycle
+        self._saved_cycles: Dict[str, int] = dict()
+        self.save_cycles = 0
+        files = ("config", *self.DOMAINS, "secret config", "Markov model")
+        # "written"/"skipped" -> file name -> number of save cycles
+        self.save_stats: Dict[str, Dict[str, int]] = {
+            "written": {name: 0 for name in files},
+            "skipped": {name: 0 for name in files},
+        }
+
+    def mark_dirty(self, *domains: str) -> None:
+        """Notify that config should be saved. It should be called after every modification of config data
+        with names of modified domains. Main config file is small and keeps id counters for domains,
+        so it is marked on every call"""
+        self.revisions["config"] += 1
+        for domain in domains:
+            self.revisions[domain] += 1
+            for repository in self._repositories(domain):
+                repository.flush()
+
+    def _is_save_needed(self, name: str, revision: Optional[int], force: bool) -> bool:
+        """Check if file should be written. Objects that do not track revisions are always written"""
+        if force or revision is None or self.saved_revisions.get(name) != revision:
+            return True
+        self.save_stats["skipped"][name] += 1
+        log.debug(f"Saving of {name} is skipped since it is not changed")
+        return False
+
+    def _on_saved(self, name: str, revision: Optional[int], cycle: int) -> None:
+        self.save_stats["written"][name] += 1
+        self._saved_cycles[name] = cycle
+        if revision is not None:
+            self.saved_revisions[name] = revision
 
-    def save(self, config_file, markov_file, secret_config_file, wait=False):
-        config_mutex = threading.Lock()
-        with config_mutex:
-            log.info("Saving of config is started")
-            with open(config_file, 'wb') as f:
+    def backup(self, *files, markov_file=None, wait=False):
+        """Back up files to deduplicated backup store in worker thread and remove backups that are not kept
+        by retention policy. If markov_file is set, Markov model snapshot is backed up too. Write-ahead log of
+        compact Markov model is folded into the snapshot before it is backed up, so the backup contains
+        all modifications of the model. SQLite database is backed up if config data is stored in it"""
+        thread = threading.Thread(
+            target=self._backup_worker, args=(files, markov_file), name="ConfigBackup")
+        thread.start()
+        if wait:
+            thread.join()
+
+    def _backup_worker(self, files, markov_file) -> None:
+        store = BackupStore(const.BACKUP_DIRECTORY, compress=self.saving["backup"]["compress"])
+        with _save_lock:
+            if markov_file is not None and isinstance(bc.markov, CompactMarkov):
+                if bc.do_not_update[DoNotUpdateFlag.BUILTIN_PLUGIN_VQ]:
+                    # Compaction causes sound lags as saving of Markov model does
+                    log.info("Markov model backup does not include write-ahead log since bot is in voice channel")
+                else:
+                    try:
+                        bc.markov.write_snapshot(markov_file)
+                    except Exception:
+                        log.error("Unable to fold Markov write-ahead log into snapshot", exc_info=True)
+            if markov_file is not None:
+                files = (*files, markov_file)
+            for file in files:
                 try:
-                    f.write(yaml.dump(
-                        self,
-                        Dumper=bc.yaml_dumper,
-                        encoding='utf-8',
-                        allow_unicode=True))
-                    log.info("Saving of config is finished")
+                    store.backup(file)
                 except Exception:
-                    log.error("yaml.dump failed", exc_info=True)
-        secret_config_mutex = threading.Lock()
-        with secret_config_mutex:
-            log.info("Saving of secret config is started")
-            with open(secret_config_file, 'wb') as f:
+                    log.error(f"Unable to create backup for {file}", exc_info=True)
+            if self.database_path is not None:
                 try:
-                    f.write(yaml.dump(
-                        bc.secret_config,
-                        Dumper=bc.yaml_dumper,
-                        encoding='utf-8',
-                        allow_unicode=True))
-                    log.info("Saving of secret config is finished")
+                    with tempfile.TemporaryDirectory() as directory:
+                        # Database file can be modified while it is read, so its consistent copy is backed up
+                        path = os.path.join(directory, os.path.basename(self.database_path))
+                        open_database(self.database_path).copy(path)
+                        store.backup(path)
                 except Exception:
-                    log.error("yaml.dump failed", exc_info=True)
+                    log.error(f"Unable to create backup for {self.database_path}", exc_info=True)
+            try:
+                store.prune(self.saving["backup"]["retention"])
+            except Exception:
+                log.error("Unable to remove old backups", exc_info=True)
+
+    def save(self, config_file, markov_file, secret_config_file, wait=False, force=False):
+        """Save config, secret config and Markov model. Files that are not changed since previous save are skipped
+        unless force is set. Config domains are written to their own files (see domain_path).
+        Calling thread (usually it is event loop) selects changed files and takes their snapshots, so objects
+        can be modified while snapshots are serialized and written atomically in worker thread.
+        Saves are serialized by single lock, so file written by earlier save never replaces file written by later one"""
+        self.save_cycles += 1
+        cycle = self.save_cycles
+        log.info(f"Save cycle {cycle} is started")
+        files = []
+        # Domains that are not loaded can not be changed
+        for domain in self.loaded_domains():
+            for repository in self._repositories(domain):
+                repository.flush()
+            if self._is_save_needed(domain, self.revisions[domain], force):
+                files.append((
+                    domain, self.domain_path(config_file, domain), config_codec.snapshot(self.__dict__[domain]),
+                    self.revisions[domain]))
+        # Main config file is written after domains, so it never refers to domain files that are not written yet
+        if self._is_save_needed("config", self.revisions["config"], force):
+            files.append(("config", config_file, config_codec.snapshot(self), self.revisions["config"]))
+        secret_config = bc.secret_config
+        secret_revision = getattr(secret_config, "revision", None)
+        if self._is_save_needed("secret config", secret_revision, force):
+            files.append(("secret config", secret_config_file, config_codec.snapshot(secret_config), secret_revision))
+        markov_revision = getattr(bc.markov, "revision", None)
+        save_markov = False
         if bc.do_not_update[DoNotUpdateFlag.BUILTIN_PLUGIN_VQ]:
             # If bot is connected to voice channel, don't save markov data because it causes sound lags
-            return log.info("Markov module save is skipped since bot is in voice channel")
-        markov_mutex = threading.Lock()
-        with markov_mutex:
+            log.info("Markov module save is skipped since bot is in voice channel")
+        elif self._is_save_needed("Markov model", markov_revision, force):
+            save_markov = True
+        thread = threading.Thread(
+            target=self._save_worker, args=(cycle, files, markov_file if save_markov else None, markov_revision),
+            name="ConfigSave")
+        thread.start()
+        if wait:
+            log.info("Waiting for saving of config files...")
+            thread.join()
+
+    def _save_worker(self, cycle, files, markov_file, markov_revision) -> None:
+        with _save_lock:
+            for name, path, snapshot, revision in files:
+                if self._saved_cycles.get(name, 0) > cycle:
+                    log.info(f"Saving of {name} is skipped since it is already saved by later save cycle")
+                    continue
+                log.info(f"Saving of {name} is started")
+                try:
+                    data = config_codec.dump_snapshot(snapshot, bc.yaml_dumper)
+                    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                    with Util.atomic_write(path) as f:
+                        f.write(data)
+                except Exception:
+                    log.error(f"Saving of {name} is failed", exc_info=True)
+                    continue
+                self._on_saved(name, revision, cycle)
+                log.info(f"Saving of {name} is finished")
+            if markov_file is None:
+                return
             log.info("Saving of Markov module data is started")
             try:
-                thread = threading.Thread(
-                    target=bc.markov.serialize,
-                    args=(markov_file, bc.yaml_dumper))
-                thread.start()
-                if wait:
-                    log.info("Waiting for saving of Markov module data...")
-                    thread.join()
-                    log.info("Saving of Markov module data is finished")
+                bc.markov.serialize(markov_file, bc.yaml_dumper)
             except Exception:
-                log.error("Saving of Markov module data is failed", exc_info=True)
+                return log.error("Saving of Markov module data is failed", exc_info=True)
+            self._on_saved("Markov model", markov_revision, cycle)
+            log.info("Saving of Markov module data is finished")
 
 
 class SecretConfig:
@@ -321,3 +467,18 @@ class SecretConfig:
         self.plugins = {
         }
         self.admin_email_list = list()
+        # Incremented on every modification, so saving can be skipped if secret config is not changed
+        self.revision = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop("revision", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.revision = 0
+
+    def mark_dirty(self) -> None:
+        """Notify that secret config should be saved"""
+        self.revision += 1
@@ -0,0 +1,184 @@
+"""Schema-driven serialization of config files.
+
+Objects of classes from the schema are converted to plain mappings and stored in JSON, so loading of config files
+does not resolve Python object tags of YAML. Config files that contain objects of other classes are stored in YAML.
+Every JSON object is decoded by object hook while the file is parsed, so there is no separate pass over the data.
+Objects can be modified while files are written by worker thread, so their snapshots are serialized"""
+
+import copy
+import datetime
+import importlib
+import json
+from typing import IO, Any, Dict, Set, Tuple, cast
+
+import yaml
+
+from src.db.repository import Repository
+from src.log import log
+
+# Type name -> (class path, fields of class state)
+SCHEMA: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "Config": ("src.config.Config", (
+        "version", "plugins", "commands_prefix", "on_mention_command", "ids", "saving", "repl", "database_path")),
+    "SecretConfig": ("src.config.SecretConfig", (
+        "version", "mail", "telegram", "discord", "plugins", "admin_email_list")),
+    "Reaction": ("src.config.Reaction", ("regex", "emoji")),
+    "Response": ("src.config.Response", ("regex", "text")),
+    "User": ("src.config.User", ("id", "permission_level", "data")),
+    "GuildSettings": ("src.config.GuildSettings", (
+        "id", "is_whitelisted", "whitelist", "markov_logging_whitelist", "markov_responses_whitelist",
+        "responses_whitelist", "reactions_whitelist", "markov_pings", "ignored")),
+    "Reminder": ("src.api.reminder.Reminder", (
+        "time", "message", "channel_id", "backend", "ping_users", "discord_whisper_users", "telegram_whisper_users",
+        "email_users", "repeat_after", "repeat_interval_measure", "prereminders_list", "used_prereminders_list",
+        "author", "time_created", "notes", "remaining_repetitions", "limit_repetitions_time")),
+    "Quote": ("src.api.quote.Quote", ("message", "author", "added_by", "timestamp")),
+    "DiscordConfig": ("src.backend.discord.config.DiscordConfig", ("guilds", "users")),
+    "TelegramConfig": ("src.backend.telegram.config.TelegramConfig", ("channel_whitelist", "passphrase", "users")),
+}
+
+# Keys of JSON objects that encode values that are not supported by JSON
+_TYPE_KEY = "__type__"
+_SET_KEY = "__set__"
+_TUPLE_KEY = "__tuple__"
+_DICT_KEY = "__dict__"
+_DATETIME_KEY = "__datetime__"
+_REPOSITORY_KEY = "__repository__"
+_RESERVED_KEYS = frozenset((_TYPE_KEY, _SET_KEY, _TUPLE_KEY, _DICT_KEY, _DATETIME_KEY, _REPOSITORY_KEY))
+
+_classes: Dict[str, type] = dict()
+# Reasons of falling back to YAML that are already reported
+_yaml_fallbacks: Set[str] = set()
+
+
+class SchemaError(Exception):
+    """Object can not be encoded by schema"""
+
+
+def _get_class(name: str) -> type:
+    if name not in _classes:
+        module_name, _, class_name = SCHEMA[name][0].rpartition(".")
+        _classes[name] = getattr(importlib.import_module(module_name), class_name)
+    return _classes[name]
+
+
+def _type_name(obj: Any) -> str:
+    cls = type(obj)
+    name = cls.__name__
+    if name not in SCHEMA or _get_class(name) is not cls:
+        raise SchemaError(f"Class {cls.__module__}.{cls.__qualname__} is not described in config schema")
+    return name
+
+
+def encode(obj: Any) -> Any:
+    """Convert object to JSON-compatible value"""
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, list):
+        return [encode(item) for item in obj]
+    if isinstance(obj, dict):
+        if all(isinstance(key, str) for key in obj.keys()) and _RESERVED_KEYS.isdisjoint(obj.keys()):
+            return {key: encode(value) for key, value in obj.items()}
+        return {_DICT_KEY: [[encode(key), encode(value)] for key, value in obj.items()]}
+    if isinstance(obj, (set, frozenset)):
+        return {_SET_KEY: [encode(item) for item in obj]}
+    if isinstance(obj, tuple):
+        return {_TUPLE_KEY: [encode(item) for item in obj]}
+    if isinstance(obj, datetime.datetime):
+        return {_DATETIME_KEY: obj.isoformat()}
+    if isinstance(obj, Repository):
+        # Repository is stored as reference to database table that is used by pickle and YAML
+        _, args = cast(Tuple[Any, Tuple[Any, ...]], obj.__reduce__())
+        return {_REPOSITORY_KEY: list(args)}
+    name = _type_name(obj)
+    state = obj.__getstate__() if hasattr(obj, "__getstate__") else obj.__dict__
+    fields = SCHEMA[name][1]
+    if not isinstance(state, dict):
+        raise SchemaError(f"State of {name} is not a mapping")
+    if set(state.keys()) != set(fields):
+        raise SchemaError(
+            f"State of {name} does not match config schema: "
+            f"unknown fields {sorted(set(state.keys()) - set(fields))}, "
+            f"missing fields {sorted(set(fields) - set(state.keys()))}")
+    result = {_TYPE_KEY: name}
+    for field in fields:
+        result[field] = encode(state[field])
+    return result
+
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    """Object hook for JSON decoder. Nested values are already decoded"""
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if key == _SET_KEY:
+            return set(value)
+        if key == _TUPLE_KEY:
+            return tuple(value)
+        if key == _DICT_KEY:
+            return {k: v for k, v in value}
+        if key == _DATETIME_KEY:
+            return datetime.datetime.fromisoformat(value)
+        if key == _REPOSITORY_KEY:
+            from src.db.sqlite_db import open_repository
+            return open_repository(*value)
+    name = obj.pop(_TYPE_KEY, None)
+    if name is None:
+        return obj
+    cls = _get_class(name)
+    result: Any = object.__new__(cls)
+    if hasattr(cls, "__setstate__"):
+        result.__setstate__(obj)
+    else:
+        result.__dict__.update(obj)
+    return result
+
+
+def is_json(f: IO[str]) -> bool:
+    """Check if config file is stored in JSON. File position is not changed"""
+    position = f.tell()
+    head = f.read(64).lstrip()
+    f.seek(position)
+    return head.startswith("{")
+
+
+def load(f: IO[str], yaml_loader: Any) -> Any:
+    """Load config file of any format"""
+    if is_json(f):
+        return json.load(f, object_hook=_decode_object)
+    # Loader reads the stream by chunks
+    return yaml.load(f, Loader=yaml_loader)
+
+
+class Snapshot:
+    """Copy of object that is not changed when the object is modified"""
+
+    __slots__ = ("data", "is_json")
+
+    def __init__(self, data: Any, is_json: bool) -> None:
+        # JSON-compatible value if is_json is set, otherwise deep copy of the object
+        self.data = data
+        self.is_json = is_json
+
+
+def snapshot(obj: Any) -> Snapshot:
+    """Take snapshot of object that can be serialized in other thread.
+    Objects that are described by schema are encoded, other objects are copied to be stored in YAML"""
+    try:
+        return Snapshot(encode(obj), True)
+    except SchemaError as e:
+        if str(e) not in _yaml_fallbacks:
+            _yaml_fallbacks.add(str(e))
+            log.warning(f"{e}, {type(obj).__name__} is stored in YAML")
+        return Snapshot(copy.deepcopy(obj), False)
+
+
+def dump_snapshot(snapshot: Snapshot, yaml_dumper: Any) -> bytes:
+    """Serialize snapshot of config file"""
+    if snapshot.is_json:
+        return json.dumps(snapshot.data, ensure_ascii=False, indent=1).encode("utf-8")
+    return yaml.dump(snapshot.data, Dumper=yaml_dumper, encoding='utf-8', allow_unicode=True)
+
+
+def dump(obj: Any, yaml_dumper: Any) -> bytes:
+    """Serialize config file. Objects that are not described by schema are stored in YAML"""
+    return dump_snapshot(snapshot(obj), yaml_dumper)
@@ -13,18 +13,25 @@ INSTANCE_NAME = os.path.basename(WALBOT_DIR)
 
 BOT_CACHE_FILE_PATH = ".bot_cache"
 MINIBOT_CACHE_FILE_PATH = ".minibot_cache"
+COMMANDS_CACHE_FILE_PATH = ".commands_cache"
 NOHUP_FILE_PATH = "nohup.out"
 
 GIT_REPO_LINK = "https://github.com/aobolensk/walbot"
 
 CONFIG_PATH = "config.yaml"
 MARKOV_PATH = "markov.yaml"
+MARKOV_SNAPSHOT_PATH = "markov.bin"
+MARKOV_WAL_PATH = "markov.wal"
+MARKOV_NGRAM_PATH = "markov_ngram.npz"
 SECRET_CONFIG_PATH = "secret.yaml"
+SQLITE_DATABASE_PATH = "walbot.db"
+MESSAGE_HISTORY_DIRECTORY = "message_history"
 DISCORD_COMMANDS_DOC_PATH = os.path.join("docs", "DiscordCommands.md")
 TELEGRAM_COMMANDS_DOC_PATH = os.path.join("docs", "TelegramCommands.md")
 LOGS_DIRECTORY = "logs"
 IMAGES_DIRECTORY = "images"
 BACKUP_DIRECTORY = "backup"
+NUMBA_CACHE_DIRECTORY = ".numba_cache"
 BOT_BACKENDS_PATH = os.path.join("src", "backend")
 
 MAX_RANGE_ITERATIONS = 500
@@ -33,7 +40,15 @@ DISCORD_MAX_EMBED_FIELDS_COUNT = 25
 DISCORD_MAX_MESSAGE_LENGTH = 2000
 MAX_MESSAGE_HISTORY_DEPTH = 1000
 MAX_MARKOV_ATTEMPTS = 64
+MARKOV_GC_STEP_BUDGET = 10000
+MARKOV_INGEST_QUEUE_SIZE = 10000
+MARKOV_INGEST_BATCH_SIZE = 256
+MARKOV_POOL_SIZE = 8
+MARKOV_POOL_WORDS = 16
+# Limits of one command message: depth of nested command runs, number of command runs and size of their output
 MAX_SUBCOMMAND_DEPTH = 256
+MAX_COMMAND_CALLS = 1000
+MAX_COMMAND_OUTPUT_SIZE = 1024 * 1024
 MAX_BOT_RESPONSES_ON_ONE_MESSAGE = 3
 MAX_TIMER_DURATION_IN_SECONDS = 24 * 60 * 60
 MAX_IMAGES_AMOUNT_FOR_IMG_COMMAND = 5
@@ -44,6 +59,8 @@ REMINDER_POLLING_INTERVAL = 30  # seconds
 AUTOUPDATE_CHECK_INTERVAL = 10 * 60  # seconds
 AUTOUPDATE_CHECK_INTERVAL_TEST = 10  # seconds
 MAX_MESSAGE_TIMEDELTA_FOR_RECALCULATION = 60  # seconds
+MARKOV_GC_INTERVAL = 10 * 60  # seconds
+MARKOV_POOL_REFILL_INTERVAL = 1  # seconds
 
 ALNUM_STRING_REGEX = re.compile('^[A-Za-zА-Яа-яЁё0-9 ]+$')
 FILENAME_REGEX = re.compile('^[A-Za-zА-Яа-яЁё0-9_-]+$')
@@ -54,7 +71,7 @@ REMINDER_DATETIME_FORMAT = "%Y-%m-%d %H:%M"
 TIMESTAMP_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 EMBED_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 INTEGER_NUMBER = re.compile(r'[-+]?\d+')
-ARGS_REGEX = re.compile(r'@args(\d*)-(\d*)@')
+VARIABLES_REGEX = re.compile(r'@(server|channelid|channel|authorid|author|command|args|args(\d*)-(\d*)|arg(\d+))@')
 REMINDER_IN_REGEX = re.compile(r'(([0-9]*)w)?(([0-9]*)d)?(([0-9]*)h)?(([0-9]*)m)?')
 
 # Discord
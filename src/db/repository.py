@@ -0,0 +1,57 @@
+import operator
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Mapping,
+    MutableMapping,
+    Tuple
+)
+
+# Suffixes of conditions for find(): time__le=... means "time <= ..."
+_OPERATORS: Dict[str, Tuple[str, Callable[[Any, Any], bool]]] = {
+    "lt": ("<", operator.lt),
+    "le": ("<=", operator.le),
+    "gt": (">", operator.gt),
+    "ge": (">=", operator.ge),
+}
+
+
+def parse_condition(condition: str) -> Tuple[str, str, Callable[[Any, Any], bool]]:
+    """Split condition to attribute name, SQL operator and Python operator"""
+    name, _, suffix = condition.partition("__")
+    if not suffix:
+        return name, "=", operator.eq
+    if suffix not in _OPERATORS:
+        raise ValueError(f"Unknown condition: {condition}")
+    return (name, *_OPERATORS[suffix])
+
+
+def _scan(items: Iterable[Tuple[int, Any]], conditions: Dict[str, Any]) -> Dict[int, Any]:
+    checks = []
+    for condition, value in conditions.items():
+        name, _, op = parse_condition(condition)
+        checks.append((name, op, value))
+    return {key: item for key, item in items if all(op(getattr(item, name), value) for name, op, value in checks)}
+
+
+class Repository(MutableMapping[int, Any]):
+    """Storage of objects by integer id. It behaves like dict, so config data can be stored either in config files
+    (as plain dicts) or in database (see src/db/sqlite_db.py)"""
+
+    def find(self, **conditions: Any) -> Dict[int, Any]:
+        """Get objects which attributes satisfy all conditions"""
+        return _scan(self.items(), conditions)
+
+    def flush(self) -> int:
+        """Write objects that were modified in place to storage. Returns number of written objects"""
+        return 0
+
+
+def find(items: Mapping[int, Any], **conditions: Any) -> Dict[int, Any]:
+    """Get objects which attributes satisfy all conditions: attr=value or attr__lt/__le/__gt/__ge=value.
+    Repositories use their indexes, plain dicts are scanned"""
+    if isinstance(items, Repository):
+        return items.find(**conditions)
+    return _scan(items.items(), conditions)
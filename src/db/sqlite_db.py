@@ -0,0 +1,217 @@
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Mapping, Set, Tuple
+
+import yaml
+
+from src.db.repository import Repository, parse_condition
+from src.log import log
+from src.utils import Util
+
+
+class SqliteDatabase:
+    """Embedded SQLite database for config data that grows over time: quotes, reminders, users and guild settings.
+    Every object is stored as YAML document in its own row, attributes that are used for search are stored in
+    indexed columns"""
+
+    # Table -> columns that are copied from object attributes
+    TABLES: Dict[str, Tuple[str, ...]] = {
+        "quotes": (),
+        "reminders": ("time", "channel_id", "author", "backend"),
+        "discord_users": (),
+        "discord_guilds": (),
+        "telegram_users": (),
+    }
+    INDEXES: Dict[str, Tuple[str, ...]] = {
+        "reminders": ("time", "channel_id", "author"),
+    }
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.yaml_loader, self.yaml_dumper = Util.get_yaml()
+        # Connection is shared by event loop and worker threads, so access to it is serialized by the lock
+        self.lock = threading.RLock()
+        # sqlite3 caches prepared statements by SQL text, repositories use the same statements all the time
+        self.connection = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            for table, columns in self.TABLES.items():
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} "
+                    f"(id INTEGER PRIMARY KEY, {''.join(column + ', ' for column in columns)}data BLOB NOT NULL)")
+            for table, columns in self.INDEXES.items():
+                for column in columns:
+                    self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+        self._repositories: Dict[str, SqliteRepository] = dict()
+        log.debug(f"Opened SQLite database {path}")
+
+    def repository(self, table: str) -> "SqliteRepository":
+        """Get repository for table. There is one repository per table, so objects are shared by all users"""
+        if table not in self._repositories:
+            self._repositories[table] = SqliteRepository(self, table)
+        return self._repositories[table]
+
+    def copy(self, path: str) -> None:
+        """Write consistent copy of the database to path (e.g. to back it up while it is modified)"""
+        target = sqlite3.connect(path)
+        try:
+            with self.lock:
+                self.connection.backup(target)
+        finally:
+            target.close()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+_databases: Dict[str, SqliteDatabase] = dict()
+
+
+def open_database(path: str) -> SqliteDatabase:
+    """Get database at path. Database is opened once and shared by all its repositories"""
+    if path not in _databases:
+        _databases[path] = SqliteDatabase(path)
+    return _databases[path]
+
+
+def open_repository(path: str, table: str) -> "SqliteRepository":
+    """Get repository for table of database at path. Repositories are stored in config files by this reference"""
+    return open_database(path).repository(table)
+
+
+class SqliteRepository(Repository):
+    """Repository that stores objects in SQLite table.
+    Assignments and deletions are written immediately. Objects that are read from the table are kept in identity map,
+    so every read returns the same object, and objects that are modified in place are written by flush()"""
+
+    def __init__(self, database: SqliteDatabase, table: str) -> None:
+        self._db = database
+        self.table = table
+        self.columns = database.TABLES[table]
+        # Loaded objects and their serialized state that is stored in the table: id -> object/data
+        self._objects: Dict[int, Any] = dict()
+        self._data: Dict[int, bytes] = dict()
+        # Ids of objects that were returned since the last flush, only they can be modified in place
+        self._touched: Set[int] = set()
+        columns = ("id", *self.columns, "data")
+        self._select_sql = f"SELECT id, data FROM {table}"
+        self._select_one_sql = f"SELECT data FROM {table} WHERE id = ?"
+        self._contains_sql = f"SELECT 1 FROM {table} WHERE id = ?"
+        self._upsert_sql = (
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})")
+        self._delete_sql = f"DELETE FROM {table} WHERE id = ?"
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return open_repository, (self._db.path, self.table)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "SqliteRepository":
+        # Config snapshots refer to the same table
+        return self
+
+    def _dump(self, obj: Any) -> bytes:
+        return yaml.dump(obj, Dumper=self._db.yaml_dumper, encoding='utf-8', allow_unicode=True)
+
+    def _row(self, key: int, obj: Any, data: bytes) -> Tuple[Any, ...]:
+        return (key, *(getattr(obj, column) for column in self.columns), data)
+
+    def _get(self, key: int, data: bytes) -> Any:
+        if key not in self._objects:
+            self._objects[key] = yaml.load(data, Loader=self._db.yaml_loader)
+            self._data[key] = data
+        self._touched.add(key)
+        return self._objects[key]
+
+    def _fetch(self, where: str = "", params: Tuple[Any, ...] = ()) -> Dict[int, Any]:
+        with self._db.lock:
+            rows = self._db.connection.execute(f"{self._select_sql}{where} ORDER BY id", params).fetchall()
+        return {key: self._get(key, data) for key, data in rows}
+
+    def __getitem__(self, key: int) -> Any:
+        if key in self._objects:
+            self._touched.add(key)
+            return self._objects[key]
+        with self._db.lock:
+            row = self._db.connection.execute(self._select_one_sql, (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._get(key, row[0])
+
+    def __setitem__(self, key: int, value: Any) -> None:
+        data = self._dump(value)
+        with self._db.lock, self._db.connection:
+            self._db.connection.execute(self._upsert_sql, self._row(key, value, data))
+        self._objects[key] = value
+        self._data[key] = data
+        self._touched.add(key)
+
+    def __delitem__(self, key: int) -> None:
+        with self._db.lock, self._db.connection:
+            deleted = self._db.connection.execute(self._delete_sql, (key,)).rowcount
+        self._objects.pop(key, None)
+        self._data.pop(key, None)
+        self._touched.discard(key)
+        if not deleted:
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._objects:
+            return True
+        with self._db.lock:
+            return self._db.connection.execute(self._contains_sql, (key,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[int]:
+        with self._db.lock:
+            keys = [row[0] for row in self._db.connection.execute(f"SELECT id FROM {self.table} ORDER BY id")]
+        return iter(keys)
+
+    def __len__(self) -> int:
+        with self._db.lock:
+            return self._db.connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def items(self) -> Any:
+        # Single query instead of query per key
+        return self._fetch().items()
+
+    def values(self) -> Any:
+        return self._fetch().values()
+
+    def find(self, **conditions: Any) -> Dict[int, Any]:
+        """Get objects which attributes satisfy all conditions. Only indexed columns can be used"""
+        clauses: List[str] = []
+        for condition in conditions.keys():
+            name, sql_operator, _ = parse_condition(condition)
+            if name not in self.columns:
+                raise ValueError(f"Column {name} is not stored in table {self.table}")
+            clauses.append(f"{name} {sql_operator} ?")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._fetch(where, tuple(conditions.values()))
+
+    def replace(self, items: Mapping[int, Any]) -> None:
+        """Replace all objects in the table"""
+        rows = []
+        for key, value in items.items():
+            rows.append(self._row(key, value, self._dump(value)))
+        with self._db.lock, self._db.connection:
+            self._db.connection.execute(f"DELETE FROM {self.table}")
+            self._db.connection.executemany(self._upsert_sql, rows)
+        self._objects.clear()
+        self._data.clear()
+        self._touched.clear()
+        log.info(f"Stored {len(rows)} objects in table {self.table} of {self._db.path}")
+
+    def flush(self) -> int:
+        rows = []
+        for key in self._touched:
+            if key not in self._objects:
+                continue
+            data = self._dump(self._objects[key])
+            if data != self._data[key]:
+                rows.append(self._row(key, self._objects[key], data))
+                self._data[key] = data
+        self._touched.clear()
+        if rows:
+            with self._db.lock, self._db.connection:
+                self._db.connection.executemany(self._upsert_sql, rows)
+        return len(rows)
@@ -1,23 +1,32 @@
+import hashlib
 import importlib
 import inspect
+import json
 import os
+import threading
 from collections import defaultdict
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Type
 
 from src import const
 from src.api.command import (
     BaseCmd,
     Command,
     CommandBinding,
+    Implementation,
     SupportedPlatforms
 )
+from src.ff import FF
 from src.log import log
+from src.utils import Util
 
 
 class Executor:
     def __init__(self) -> None:
         self.commands: Dict[str, Any] = {}
         self.binders: Dict[const.BotBackend, CommandBinding] = {}
+        # Command modules that are not imported yet: module -> command name -> command that imports it
+        self._lazy_modules: Dict[str, Dict[str, Command]] = {}
+        self._lazy_lock = threading.Lock()
 
     def register_command(self, cmd_name: str, command: Command) -> None:
         for binder in self.binders.values():
@@ -28,27 +37,131 @@ class Executor:
             binder.unbind(cmd_name)
 
     def load_commands(self) -> None:
+        """Bind commands of src/cmd modules. If WALBOT_FEATURE_LAZY_COMMANDS is enabled, commands of modules that
+        are not changed since previous start are bound from commands cache and their module is imported
+        on first invocation of any of its commands"""
         cmd_directory = os.path.join(const.WALBOT_DIR, "src", "cmd")
         cmd_modules = [
             "src.cmd." + os.path.splitext(path)[0] for path in os.listdir(cmd_directory)
             if os.path.isfile(os.path.join(cmd_directory, path)) and path.endswith(".py")]
+        lazy = FF.is_enabled("WALBOT_FEATURE_LAZY_COMMANDS")
+        cache = self._read_commands_cache() if lazy else dict()
+        updated_cache = dict()
         for module in cmd_modules:
             log.debug2(f"Processing commands from module: {module}")
-            commands_file = importlib.import_module(module)
-            commands = [
-                obj[1] for obj in inspect.getmembers(commands_file, inspect.isclass)
-                if (obj[1].__module__ == module) and issubclass(obj[1], BaseCmd)]
-            if len(commands) == 1:
-                commands_class = commands[0]
-                if "bind" in [func[0] for func in inspect.getmembers(commands_class, inspect.isfunction)
-                              if not func[0].startswith('_')]:
-                    self.add_module(commands_class())
-                else:
-                    log.error(f"Class '{commands.__name__}' does not have bind() function")
-            elif len(commands) > 1:
-                log.error(f"Module '{module}' have more than 1 class in it")
-            else:
-                log.error(f"Module '{module}' have no classes in it")
+            if lazy:
+                with open(os.path.join(cmd_directory, module.split('.')[-1] + ".py"), 'rb') as f:
+                    source_hash = hashlib.sha256(f.read()).hexdigest()
+                if cache.get(module, dict()).get("sha256") == source_hash:
+                    self._add_lazy_module(module, cache[module]["commands"])
+                    updated_cache[module] = cache[module]
+                    continue
+            commands_class = self._get_commands_class(module)
+            if commands_class is None:
+                continue
+            commands_before = dict(self.commands)
+            self.add_module(commands_class())
+            if lazy:
+                updated_cache[module] = {
+                    "sha256": source_hash,
+                    "commands": {
+                        name: self._command_metadata(command) for name, command in self.commands.items()
+                        if commands_before.get(name) is not command
+                    },
+                }
+        if lazy and updated_cache != cache:
+            with Util.atomic_write(const.COMMANDS_CACHE_FILE_PATH) as f:
+                f.write(json.dumps(updated_cache, indent=1).encode("utf-8"))
+
+    @staticmethod
+    def _get_commands_class(module: str) -> Optional[Type[BaseCmd]]:
+        commands_file = importlib.import_module(module)
+        commands = [
+            obj[1] for obj in inspect.getmembers(commands_file, inspect.isclass)
+            if (obj[1].__module__ == module) and issubclass(obj[1], BaseCmd)]
+        if len(commands) == 1:
+            commands_class = commands[0]
+            if "bind" in [func[0] for func in inspect.getmembers(commands_class, inspect.isfunction)
+                          if not func[0].startswith('_')]:
+                return commands_class
+            log.error(f"Class '{commands_class.__name__}' does not have bind() function")
+        elif len(commands) > 1:
+            log.error(f"Module '{module}' have more than 1 class in it")
+        else:
+            log.error(f"Module '{module}' have no classes in it")
+        return None
+
+    @staticmethod
+    def _read_commands_cache() -> Dict[str, Any]:
+        if not os.path.isfile(const.COMMANDS_CACHE_FILE_PATH):
+            return dict()
+        try:
+            with open(const.COMMANDS_CACHE_FILE_PATH, 'r', encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            log.error(f"File '{const.COMMANDS_CACHE_FILE_PATH}' can not be read!", exc_info=True)
+            return dict()
+
+    @staticmethod
+    def _command_metadata(command: Command) -> Dict[str, Any]:
+        """Get attributes of command that are set by bind()"""
+        return {
+            "module_name": command.module_name,
+            "permission_level": int(command.permission_level),
+            "impl_type": int(command.impl_type),
+            "subcommand": command.subcommand,
+            "impl_message": getattr(command, "impl_message", None),
+            "supported_platforms": int(command.supported_platforms),
+            "postpone_execution": command.postpone_execution,
+            "max_execution_time": command.max_execution_time,
+            "description": command.description,
+        }
+
+    def _add_lazy_module(self, module: str, commands: Dict[str, Dict[str, Any]]) -> None:
+        """Bind commands from metadata. Implementations of commands are imported on first invocation"""
+        self._lazy_modules[module] = dict()
+        for name, metadata in commands.items():
+            impl_func = None
+            if metadata["impl_type"] == Implementation.FUNCTION:
+                impl_func = self._lazy_implementation(module, name, metadata["description"])
+            command = Command(
+                metadata["module_name"], name, const.Permission(metadata["permission_level"]),
+                Implementation(metadata["impl_type"]), subcommand=metadata["subcommand"], impl_func=impl_func,
+                impl_message=metadata["impl_message"],
+                supported_platforms=metadata["supported_platforms"],
+                postpone_execution=metadata["postpone_execution"], max_execution_time=metadata["max_execution_time"])
+            self.commands[name] = command
+            self._lazy_modules[module][name] = command
+
+    def _lazy_implementation(self, module: str, name: str, description: str) -> Any:
+        async def load_and_execute(cmd_line, execution_ctx):
+            self._import_lazy_module(module)
+            impl_func = self.commands[name]._exec
+            if impl_func is load_and_execute:
+                raise RuntimeError(f"Command '{name}' is not bound by module '{module}'")
+            return await impl_func(cmd_line, execution_ctx)
+
+        load_and_execute.__doc__ = description
+        return load_and_execute
+
+    def _import_lazy_module(self, module: str) -> None:
+        """Import module of lazily bound commands and replace their implementations by implementations from it.
+        Bound commands are kept, so their state (e.g. times_called) is preserved"""
+        with self._lazy_lock:
+            commands = self._lazy_modules.get(module)
+            if commands is None:
+                return
+            log.debug(f"Importing commands module on first invocation: {module}")
+            commands_class = self._get_commands_class(module)
+            if commands_class is None:
+                raise RuntimeError(f"Commands module '{module}' can not be loaded")
+            commands_class().bind()
+            for name, command in commands.items():
+                bound = self.commands.get(name)
+                if bound is not None and bound is not command:
+                    command._exec = bound._exec
+                    self.commands[name] = command
+            del self._lazy_modules[module]
 
     def add_module(self, module: BaseCmd) -> None:
         module.bind()
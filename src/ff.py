@@ -8,6 +8,11 @@ class FF:
     _feature_flag_list = [
         "WALBOT_TEST_AUTO_UPDATE",
         "WALBOT_FEATURE_MARKOV_MONGO",
+        "WALBOT_FEATURE_MARKOV_COMPACT",
+        "WALBOT_FEATURE_MARKOV_BACKGROUND_GC",
+        "WALBOT_FEATURE_CONFIG_SQLITE",
+        "WALBOT_FEATURE_MESSAGE_HISTORY",
+        "WALBOT_FEATURE_LAZY_COMMANDS",
     ]
 
     @staticmethod
@@ -2,20 +2,23 @@ import importlib
 import os
 import platform
 import sys
-from typing import Dict, Optional
-
-import git
+from typing import TYPE_CHECKING, Dict, Optional
 
 from src import const
 from src.config import bc
 from src.shell import Shell
 from src.utils import Time, Util
 
+if TYPE_CHECKING:
+    import git
+else:
+    git = Util.lazy_import("git")
+
 
 class BotInfo:
     """Get info about walbot instance"""
 
-    def _get_repo(self) -> Optional[git.Repo]:
+    def _get_repo(self) -> Optional["git.Repo"]:
         try:
             return git.Repo(search_parent_directories=True)
         except git.exc.InvalidGitRepositoryError:
@@ -14,7 +14,7 @@ import threading
 import time
 import zipfile
 from types import FrameType
-from typing import List
+from typing import List, Optional, Union
 
 import nest_asyncio  # type:ignore
 import psutil
@@ -23,12 +23,19 @@ from src import const
 from src.algorithms import precompile_algs
 from src.api.bot_instance import BotInstance
 from src.api.command import SupportedPlatforms
+from src.backup import BackupStore
 from src.bot_cache import BotCache
 from src.config import Config, SecretConfig, bc
 from src.ff import FF
 from src.info import BotInfo
 from src.log import log
-from src.markov import Markov, MarkovV2
+from src.markov import CompactMarkov, Markov, MarkovV2
+from src.markov_ingest import MarkovIngestQueue
+from src.markov_pool import MarkovResponsePool
+from src.markov_wal import MarkovWriteAheadLog
+from src.message_cache import MessageCache
+from src.message_history import MessageHistoryStore
+from src.startup_profiler import profiler
 from src.utils import Util
 
 
@@ -60,6 +67,9 @@ class Launcher:
                 help=("Make bot start faster by disabling some optional checks:\n"
                       "- Disable Markov model check on start\n"
                       ))
+            subparsers[option].add_argument(
+                "--profile-startup", action="store_true",
+                help="Print durations of startup phases and the slowest imports")
             if sys.platform in ("linux", "darwin"):
                 subparsers[option].add_argument(
                     "--nohup", action="store_true",
@@ -77,7 +87,9 @@ class Launcher:
         ]
         subparsers["patch"].add_argument(
             "file", nargs='?', default="all",
-            help='Config file to patch', choices=["all", *self.config_files])
+            help=("Config file to patch\n"
+                  f"{const.MARKOV_SNAPSHOT_PATH}: convert {const.MARKOV_PATH} to binary snapshot"),
+            choices=["all", *self.config_files, const.MARKOV_SNAPSHOT_PATH])
         # Test
         subparsers["test"].add_argument(
             "-v", "--verbose", action="store_true", help="Verbose", default=False)
@@ -86,6 +98,11 @@ class Launcher:
         subparsers["test"].add_argument(
             "--cov", action="store_true", help="Collect coverage report", default=False)
         subparsers["hooks"].add_argument("command", type=str, choices=["setup", "remove"])
+        # Benchmarks
+        subparsers["bench"].add_argument(
+            "name", nargs='?', default="all", help="Benchmark to run (default: all)")
+        subparsers["bench"].add_argument(
+            "--scale", type=float, default=1.0, help="Multiplier for size of benchmark data sets")
         # Autocomplete
         subparsers["autocomplete"].add_argument("type", type=str, help="Shell type", choices=["bash"])
         return parser
@@ -135,7 +152,11 @@ class Launcher:
         BotCache(True).remove()
         self._loop.run_until_complete(bc.plugin_manager.unload_plugins())
         bc.executor.store_persistent_state(bc.config.executor)
-        bc.config.save(const.CONFIG_PATH, const.MARKOV_PATH, const.SECRET_CONFIG_PATH, wait=True)
+        bc.markov_pool.stop()
+        bc.markov_ingest.stop()
+        if bc.message_cache.history is not None:
+            bc.message_cache.history.close()
+        bc.config.save(const.CONFIG_PATH, bc.markov.STORAGE_PATH, const.SECRET_CONFIG_PATH, wait=True, force=True)
         log.info('Stopped the bot!')
         sys.exit(const.ExitStatus.NO_ERROR)
 
@@ -157,30 +178,94 @@ class Launcher:
         os.makedirs(const.BACKUP_DIRECTORY, exist_ok=True)
         os.makedirs(Util.tmp_dir(), exist_ok=True)
 
+    def _read_markov(self) -> Optional[Union[Markov, CompactMarkov]]:
+        if not os.path.isfile(const.MARKOV_SNAPSHOT_PATH):
+            return Util.read_config_file(const.MARKOV_PATH)
+        try:
+            markov = CompactMarkov.read_snapshot(const.MARKOV_SNAPSHOT_PATH)
+        except Exception:
+            log.error(f"File '{const.MARKOV_SNAPSHOT_PATH}' can not be read!", exc_info=True)
+            return None
+        log.info(f"Loaded Markov model snapshot from {const.MARKOV_SNAPSHOT_PATH}")
+        return markov
+
+    @staticmethod
+    def _discard_markov_wal(generation: int) -> None:
+        """Keep write-ahead log only if it continues snapshot of generation. Log file of snapshot generation is
+        removed after later snapshot is written, so the rest of the log can not be replayed on top of this one"""
+        generations = MarkovWriteAheadLog.list_generations(const.MARKOV_WAL_PATH)
+        if not generations or generation in generations:
+            return
+        for wal_generation in generations:
+            path = MarkovWriteAheadLog.get_path(const.MARKOV_WAL_PATH, wal_generation)
+            # Keep log for investigation
+            shutil.move(path, path + ".broken")
+        log.warning(
+            f"Markov write-ahead log does not continue restored snapshot of generation {generation}, "
+            f"log files of generations {generations} are discarded")
+
+    def _restore_markov_backup(self) -> bool:
+        """Restore the latest backup of Markov model. Returns False if there are no backups"""
+        store = BackupStore(const.BACKUP_DIRECTORY)
+        snapshot_name = os.path.basename(const.MARKOV_SNAPSHOT_PATH)
+        backups = store.snapshots(snapshot_name) + store.snapshots(os.path.basename(const.MARKOV_PATH))
+        # Backups that were created before backup store was introduced
+        markov_backups = sorted(
+            [x for x in os.listdir(const.BACKUP_DIRECTORY) if x.startswith("markov_") and x.endswith(".zip")])
+        if not backups and not markov_backups:
+            return False
+        if os.path.isfile(const.MARKOV_SNAPSHOT_PATH):
+            # Snapshot is broken, keep it for investigation
+            shutil.move(const.MARKOV_SNAPSHOT_PATH, const.MARKOV_SNAPSHOT_PATH + ".broken")
+        if backups:
+            backup = max(backups, key=lambda manifest: (manifest["time"], manifest["id"]))
+            log.info(f"Restoring Markov model from backup {backup['id']}")
+            try:
+                store.restore(
+                    backup["id"],
+                    const.MARKOV_SNAPSHOT_PATH if backup["file"] == snapshot_name else const.MARKOV_PATH)
+                if backup["file"] == snapshot_name:
+                    self._discard_markov_wal(CompactMarkov.read_snapshot(const.MARKOV_SNAPSHOT_PATH).generation)
+            except Exception:
+                log.error(f"Failed to restore backup {backup['id']}", exc_info=True)
+            return True
+        with zipfile.ZipFile(os.path.join(const.BACKUP_DIRECTORY, markov_backups[-1]), 'r') as zip_ref:
+            zip_ref.extractall(".")
+        log.info(f"Restoring Markov model from {const.BACKUP_DIRECTORY}/{markov_backups[-1]}")
+        if markov_backups[-1].endswith(".bin.zip"):
+            shutil.move(markov_backups[-1][:-4], const.MARKOV_SNAPSHOT_PATH)
+        else:
+            shutil.move(markov_backups[-1][:-4], const.MARKOV_PATH)
+        return True
+
     def _read_configs(self, main_bot: bool = True) -> None:
         # Read configuration files
-        bc.config = Util.read_config_file(const.CONFIG_PATH) or Config()
+        bc.config = Config.load(const.CONFIG_PATH) or Config()
         bc.secret_config = Util.read_config_file(const.SECRET_CONFIG_PATH) or SecretConfig()
         if main_bot:
             if not FF.is_enabled("WALBOT_FEATURE_MARKOV_MONGO"):
-                bc.markov = Util.read_config_file(const.MARKOV_PATH)
-                if bc.markov is None:
-                    # Check available backups
-                    markov_backups = sorted(
-                        [x for x in os.listdir("backup") if x.startswith("markov_") and x.endswith(".zip")])
-                    if markov_backups:
-                        # Restore Markov model from backup
-                        with zipfile.ZipFile("backup/" + markov_backups[-1], 'r') as zip_ref:
-                            zip_ref.extractall(".")
-                        log.info(f"Restoring Markov model from backup/{markov_backups[-1]}")
-                        shutil.move(markov_backups[-1][:-4], "markov.yaml")
-                        bc.markov = Util.read_config_file(const.MARKOV_PATH)
-                        if bc.markov is None:
-                            bc.markov = Markov()
-                            log.warning("Failed to restore Markov model from backup. Creating new Markov model...")
+                bc.markov = self._read_markov()
+                if bc.markov is None and self._restore_markov_backup():
+                    bc.markov = self._read_markov()
+                    if bc.markov is None:
+                        bc.markov = Markov()
+                        log.warning("Failed to restore Markov model from backup. Creating new Markov model...")
                 if bc.markov is None:
                     bc.markov = Markov()
                     log.info("Created empty Markov model")
+                # Markov config of older version does not have state_size until it is patched
+                if getattr(bc.markov, "state_size", 1) > 1:
+                    bc.markov.attach_ngram(const.MARKOV_NGRAM_PATH)
+                    log.info(f"Loaded Markov chain of order {bc.markov.state_size} from {const.MARKOV_NGRAM_PATH}")
+                if FF.is_enabled("WALBOT_FEATURE_MARKOV_COMPACT") and isinstance(bc.markov, Markov):
+                    bc.markov = CompactMarkov.from_markov(bc.markov)
+                    # Write-ahead log files that are left from previous snapshots do not belong to converted model
+                    bc.markov.generation = MarkovWriteAheadLog.next_generation(const.MARKOV_WAL_PATH)
+                    bc.markov.write_snapshot(const.MARKOV_SNAPSHOT_PATH)
+                    log.info("Converted Markov model to compact representation")
+                if isinstance(bc.markov, CompactMarkov):
+                    replayed = bc.markov.open_wal(const.MARKOV_WAL_PATH)
+                    log.info(f"Replayed {replayed} records of Markov write-ahead log")
             else:
                 from src.db.walbot_db import WalbotDatabase
                 db = WalbotDatabase()
@@ -208,6 +293,12 @@ class Launcher:
                 ])
             if not ok and not self.args.ignore_version_check:
                 sys.exit(const.ExitStatus.CONFIG_FILE_ERROR)
+        bc.config.select_storage(
+            const.SQLITE_DATABASE_PATH if FF.is_enabled("WALBOT_FEATURE_CONFIG_SQLITE") else None)
+        if main_bot and FF.is_enabled("WALBOT_FEATURE_MESSAGE_HISTORY"):
+            bc.message_cache.attach_history(
+                MessageHistoryStore(const.MESSAGE_HISTORY_DIRECTORY, MessageCache.BUFFER_CAPACITY))
+            bc.message_cache.history.start()
 
     def _append_backend(self, backend: str) -> None:
         module = importlib.import_module(f"src.backend.{backend}.instance")
@@ -224,12 +315,21 @@ class Launcher:
         if main_bot and self.args.autoupdate:
             return self.autoupdate()
         self.backends: List[BotInstance] = []
-        self._read_configs(main_bot)
-        bc.executor.load_commands()
+        with profiler.phase("Read configs"):
+            self._read_configs(main_bot)
+        if main_bot:
+            bc.markov_ingest = MarkovIngestQueue(bc.markov)
+            bc.markov_ingest.start()
+            bc.markov_pool = MarkovResponsePool(bc.markov)
+            bc.markov_pool.start()
+        with profiler.phase("Load commands"):
+            bc.executor.load_commands()
         if not self.args.fast_start:
-            bc.executor.export_help(SupportedPlatforms.TELEGRAM)
-        bc.executor.load_persistent_state(bc.config.executor)
-        bc.config.commands.update()
+            with profiler.phase("Export help"):
+                bc.executor.export_help(SupportedPlatforms.TELEGRAM)
+        with profiler.phase("Load persistent state of commands"):
+            bc.executor.load_persistent_state(bc.config.executor)
+            bc.config.commands.update()
         nest_asyncio.apply()
 
         # Saving bot_cache to safely stop it later
@@ -241,14 +341,15 @@ class Launcher:
                 return const.ExitStatus.GENERAL_ERROR
         BotCache(main_bot).dump_to_file()
 
-        for backend in os.listdir(const.BOT_BACKENDS_PATH):
-            if (os.path.isdir(os.path.join(const.BOT_BACKENDS_PATH, backend)) and
-                    os.path.exists(os.path.join(const.BOT_BACKENDS_PATH, backend, "instance.py"))):
-                if main_bot:
-                    self._append_backend(backend)
-                else:
-                    if backend == "discord":
+        with profiler.phase("Import backends"):
+            for backend in os.listdir(const.BOT_BACKENDS_PATH):
+                if (os.path.isdir(os.path.join(const.BOT_BACKENDS_PATH, backend)) and
+                        os.path.exists(os.path.join(const.BOT_BACKENDS_PATH, backend, "instance.py"))):
+                    if main_bot:
                         self._append_backend(backend)
+                    else:
+                        if backend == "discord":
+                            self._append_backend(backend)
         for backend in self.backends:
             thread = threading.Thread(target=backend.start, args=(self.args, main_bot))
             thread.setDaemon(True)
@@ -260,9 +361,14 @@ class Launcher:
                 "No active backends found! "
                 "Please setup config.yaml and secret.yaml to configure desired backends.")
             return const.ExitStatus.GENERAL_ERROR
-        bc.plugin_manager.register()
+        with profiler.phase("Register plugins"):
+            bc.plugin_manager.register()
         self._loop.create_task(bc.plugin_manager.load_plugins())
-        precompile_algs()
+        with profiler.phase("Precompile algorithms"):
+            precompile_algs()
+        if profiler.enabled:
+            log.info(profiler.report())
+            profiler.stop_measuring_imports()
         self._loop.run_forever()
         if not sys.platform == "win32":
             signal.pause()
@@ -350,6 +456,10 @@ class Launcher:
         """Start autoupdate process for bot"""
         return importlib.import_module("src.autoupdate").start(self.args)
 
+    def bench(self) -> const.ExitStatus:
+        """Run performance benchmarks"""
+        return importlib.import_module("tools.bench").main(self.args)
+
     def mexplorer(self) -> const.ExitStatus:
         """Markov model explorer"""
         return importlib.import_module("tools.mexplorer").main(self.args)
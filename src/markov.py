@@ -1,12 +1,37 @@
+import asyncio
+import bisect
+import collections
+import itertools
+import json
+import mmap
 import random
 import re
+import struct
+import sys
+import threading
+import time
 from enum import IntEnum
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Pattern,
+    Set,
+    Tuple,
+    cast
+)
 
+import numpy as np
 import yaml  # type:ignore
 
 from src import const
 from src.ff import FF
+from src.markov_index import WordIndex
+from src.markov_ngram import NgramMarkov
+from src.markov_wal import MarkovWriteAheadLog
+from src.utils import Util
 
 
 class MarkovNode:
@@ -19,6 +44,19 @@ class MarkovNode:
         else:
             self.next = {"__markov_null": 0}
         self.total_next = 0
+        self._cumulative: Optional[Tuple[List[Any], List[int]]] = None
+        self._gc_mark = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop("_cumulative", None)
+        state.pop("_gc_mark", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._cumulative = None
+        self._gc_mark = 0
 
     def add_next(self, word: str) -> None:
         if word in self.next.keys():
@@ -26,11 +64,25 @@ class MarkovNode:
         else:
             self.next[word] = 1
         self.total_next += 1
+        self._cumulative = None
 
     def del_next(self, word: str) -> None:
         if word in self.next.keys():
             self.total_next -= self.next[word]
             del self.next[word]
+            self._cumulative = None
+
+    def choose_next(self, index: int) -> Any:
+        """Get next word that covers index in [0, total_next) using binary search over cumulative counts.
+        Cumulative counts table is rebuilt lazily after node is modified.
+        Raises IndexError if index is out of range"""
+        if self._cumulative is None:
+            self._cumulative = (list(self.next.keys()), list(itertools.accumulate(self.next.values())))
+        words, cumulative = self._cumulative
+        pos = bisect.bisect_right(cumulative, index)
+        if pos == len(words):
+            raise IndexError(f"Index {index} is out of range of next words")
+        return words[pos]
 
     def get_next(self, model: 'Markov', word: str) -> 'MarkovNode':
         if not FF.is_enabled("WALBOT_FEATURE_MARKOV_MONGO"):
@@ -43,6 +95,8 @@ class MarkovNode:
 
 
 class Markov:
+    STORAGE_PATH = const.MARKOV_PATH
+
     class NodeType:
         begin = 0
         word = 1
@@ -59,91 +113,273 @@ class Markov:
         self.max_words = 500
         self.chains_generated = 0
         self.ignored_prefixes = dict()
+        self.state_size = 1
+        self.ngram: Optional[NgramMarkov] = None
+        self._ngram_path: Optional[str] = None
+        self._index: Optional[WordIndex] = None
+        self._predecessors: Optional[Dict[str, Set[str]]] = None
+        self._gc_epoch = 0
+        self._reset_gc()
+        self._lock = threading.Lock()
+        # Incremented when words are removed, so generated messages that are cached can become outdated
+        self.removal_epoch = 0
+        # Incremented on every modification, so saving can be skipped if the model is not changed
+        self.revision = 0
 
-    def add_string(self, text: str) -> None:
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        for attr in (
+                "_lock", "removal_epoch", "revision", "ngram", "_ngram_path", "_index", "_predecessors", "_gc_epoch",
+                "_gc_stack", "_gc_sweep", "_gc_sweep_pos", "_gc_removed"):
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.ngram = None
+        self._ngram_path = None
+        self._index = None
+        self._predecessors = None
+        self._gc_epoch = 0
+        self._reset_gc()
+        self._lock = threading.Lock()
+        self.removal_epoch = 0
+        self.revision = 0
+
+    def mark_dirty(self) -> None:
+        """Notify that the model should be saved (e.g. after modification of filters)"""
+        self.revision += 1
+
+    def _word_index(self) -> WordIndex:
+        """Get word index. It is built on first use and updated by model modifications"""
+        if self._index is None:
+            self._index = WordIndex(word for word in self.model.keys() if word)
+        return self._index
+
+    def _predecessors_index(self) -> Dict[str, Set[str]]:
+        """Get reverse edges index: word -> words that have it as next word"""
+        if self._predecessors is None:
+            self._predecessors = dict()
+            for word, node in self.model.items():
+                for next_word in node.next.keys():
+                    if next_word is not None:
+                        self._predecessors.setdefault(next_word, set()).add(word)
+        return self._predecessors
+
+    def _remove_word(self, word: str) -> None:
+        node = self.model.pop(word)
+        if self._index is not None:
+            self._index.remove(word)
+        predecessors = self._predecessors_index()
+        for prev_word in predecessors.pop(word, set()):
+            prev_node = self.model.get(prev_word)
+            if prev_node is not None:
+                prev_node.del_next(word)
+        for next_word in node.next.keys():
+            if next_word in predecessors.keys():
+                predecessors[next_word].discard(word)
+
+    def _tokenize(self, text: str) -> Optional[List[str]]:
+        """Split message to words that are added to the model. Returns None if message should be skipped"""
         if len(text) < self.min_chars or len(text) > self.max_chars:
-            return
+            return None
         for prefix in self.ignored_prefixes.values():
             if text.startswith(prefix):
-                return
+                return None
         words = [word for word in filter(None, text.split(' ')) if not any(regex.match(word) for regex in self.filters)]
         if len(words) < self.min_words or len(words) > self.max_words:
-            return
+            return None
+        return words
+
+    def add_string(self, text: str) -> None:
+        self.add_strings([text])
+
+    def add_strings(self, texts: Iterable[str]) -> None:
+        """Add batch of messages. Messages are filtered and split to words before the model is locked"""
+        messages = [words for words in map(self._tokenize, texts) if words is not None]
+        with self._lock:
+            for words in messages:
+                self._add_words(words)
+
+    def _add_words(self, words: List[str]) -> None:
         current_node = self.model[""]
         for word in words:
             current_node.add_next(word)
+            if self._predecessors is not None:
+                self._predecessors.setdefault(word, set()).add(current_node.word or "")
             if word in self.model.keys():
                 current_node = current_node.get_next(self, word)
             else:
                 current_node = self.model[word] = MarkovNode(self.NodeType.word, word=word)
+                if self._index is not None:
+                    self._index.add(word)
+            if self._gc_stack is not None:
+                self._gc_shade(current_node)
         if current_node != self.model[""]:
             current_node.add_next(None)
+        if self.ngram is not None:
+            self.ngram.add_words(words)
+        self.revision += 1
 
     def del_words(self, regex: str) -> List[str]:
-        removed = []
-        for word in [word for word in self.model if re.search(regex, word)]:
-            removed.append(self.model[word].word)
-            del self.model[word]
-        for _, node in self.model.items():
-            for word in [word for word in node.next if word is not None and re.search(regex, word)]:
-                node.del_next(word)
-        return removed
+        with self._lock:
+            removed = self._word_index().search(regex)
+            for word in removed:
+                self._remove_word(word)
+            if self.ngram is not None:
+                self.ngram.remove_words(removed)
+            if removed:
+                self.removal_epoch += 1
+                self.revision += 1
+            return removed
 
     def find_words(self, regex: str) -> List[str]:
-        return [self.model[word].word for word in self.model if re.search(regex, word)]
+        with self._lock:
+            return self._word_index().search(regex)
+
+    def words_count(self) -> int:
+        return len(self.model)
+
+    def pairs_count(self) -> int:
+        return sum(node.total_next for node in self.model.values())
 
     def get_next_words_list(self, word: str) -> List[Tuple[str, int]]:
         if word not in self.model.keys():
             return []
         return sorted(self.model[word].next.items(), key=lambda x: -x[1])
 
-    def generate(self, word: str = "") -> str:
+    def attach_ngram(self, path: str) -> None:
+        """Load Markov chain of order state_size from path. The chain is trained along with the model
+        and it is saved to path when the model is saved"""
+        self._ngram_path = path
+        self.ngram = NgramMarkov.load(path, self.state_size) if self.state_size > 1 else None
+
+    def set_state_size(self, state_size: int, path: str) -> None:
+        """Set order of Markov chain that is used for generation. Chain of higher order is empty at first
+        and it is trained by new messages"""
+        with self._lock:
+            if state_size != 1 and (self.ngram is None or self.ngram.state_size != state_size):
+                self.ngram = NgramMarkov(state_size)
+            elif state_size == 1:
+                self.ngram = None
+            self.state_size = state_size
+            self._ngram_path = path
+            self.removal_epoch += 1
+            self.revision += 1
+
+    def generate(self, word: str = "", order: Optional[int] = None, count: bool = True) -> str:
+        """Generate chain. If count is False, the chain is not added to chains_generated (see count_chain())"""
+        with self._lock:
+            return self._generate(word, order, count)
+
+    def count_chain(self) -> None:
+        """Add chain that was generated with count=False to chains_generated"""
+        with self._lock:
+            self.chains_generated += 1
+
+    def _generate(self, word: str, order: Optional[int], count: bool) -> str:
+        result = _generate_higher_order(self, word, order, count)
+        if result is not None:
+            return result
         if word not in self.model.keys():
             return "<Empty message was generated>"
         current_node = self.model[word]
         result = word + ' '
         while current_node != self.end_node:
-            index = random.randint(0, max(0, current_node.total_next - 1))
-            count = 0
-            for word, next_count in current_node.next.items():
-                count += next_count
-                if count > index:
-                    result += (word if word is not None else "") + ' '
-                    next_node = current_node.get_next(self, word)
-                    if current_node == self.model[""] and next_node == self.end_node:
-                        continue
-                    current_node = next_node
-                    break
-            else:
+            try:
+                word = current_node.choose_next(random.randint(0, max(0, current_node.total_next - 1)))
+            except IndexError:
                 if current_node == self.model[""] and len(current_node.next.items()) == 1:
                     return "<Markov database is empty>"
                 break
+            result += (word if word is not None else "") + ' '
+            next_node = current_node.get_next(self, word)
+            if current_node == self.model[""] and next_node == self.end_node:
+                continue
+            current_node = next_node
         result = result.strip()
         if not result:
             return "<Empty message was generated>"
-        self.chains_generated += 1
+        if count:
+            self.chains_generated += 1
         return result
 
-    def collect_garbage(self, node: Optional[MarkovNode] = None) -> Set[Any]:
-        if not node:
-            node = self.model[""]
-        was = {node}
-        for key in node.next.keys():
-            next_node = node.get_next(self, key)
-            if next_node not in was:
-                was |= self.collect_garbage(next_node)
-        if node == self.model[""]:
-            result = []
-            for node in set(self.model.values()).difference(was):
-                if hasattr(node, "word"):
-                    result.append(node.word)
-                    del self.model[node.word]
-            return set(result)
-        return was
+    def _reset_gc(self) -> None:
+        self._gc_stack: Optional[List[MarkovNode]] = None
+        self._gc_sweep: List[str] = []
+        self._gc_sweep_pos = 0
+        self._gc_removed: Set[str] = set()
+
+    def _gc_shade(self, node: MarkovNode) -> None:
+        """Mark node as reachable and schedule scan of its next words"""
+        if node._gc_mark == self._gc_epoch:
+            return
+        node._gc_mark = self._gc_epoch
+        self._gc_stack.append(node)
+
+    def gc_step(self, budget: int) -> Optional[Set[str]]:
+        """Do bounded amount of mark-and-sweep garbage collection work.
+        Model can be modified between steps: nodes that are touched by add_string() are considered reachable.
+        Returns set of removed words when collection cycle is finished, otherwise None"""
+        with self._lock:
+            return self._gc_step(budget)
+
+    def _gc_step(self, budget: int) -> Optional[Set[str]]:
+        if self._gc_stack is None:
+            self._gc_epoch += 1
+            self._gc_stack = []
+            self._gc_shade(self.model[""])
+        while self._gc_stack and budget > 0:
+            node = self._gc_stack.pop()
+            for word in node.next.keys():
+                next_node = self.model.get(word) if word is not None else None
+                if next_node is not None:
+                    self._gc_shade(next_node)
+            budget -= len(node.next)
+        if self._gc_stack:
+            return None
+        if not self._gc_sweep:
+            self._gc_sweep = list(self.model.keys())
+        while self._gc_sweep_pos < len(self._gc_sweep) and budget > 0:
+            word = self._gc_sweep[self._gc_sweep_pos]
+            self._gc_sweep_pos += 1
+            budget -= 1
+            node = self.model.get(word)
+            if node is not None and node._gc_mark != self._gc_epoch:
+                self._remove_word(word)
+                self._gc_removed.add(word)
+        if self._gc_sweep_pos < len(self._gc_sweep):
+            return None
+        removed = {word for word in self._gc_removed if word not in self.model.keys()}
+        self._reset_gc()
+        if self.ngram is not None:
+            self.ngram.remove_words(removed)
+        if removed:
+            self.removal_epoch += 1
+            self.revision += 1
+        return removed
+
+    def collect_garbage(self) -> Set[str]:
+        removed = None
+        while removed is None:
+            removed = self.gc_step(sys.maxsize)
+        return removed
+
+    def drop(self) -> None:
+        with self._lock:
+            lock, removal_epoch, revision = self._lock, self.removal_epoch, self.revision
+            self.__init__()
+            self._lock, self.removal_epoch, self.revision = lock, removal_epoch + 1, revision + 1
 
     def serialize(self, filename: str, dumper: type = yaml.Dumper) -> None:
-        with open(filename, 'wb') as markov_file:
-            markov_file.write(yaml.dump(self, Dumper=dumper, encoding='utf-8', allow_unicode=True))
+        # Model is changed by ingestion thread, so it is dumped under the lock and written to disk without it
+        with self._lock:
+            data = yaml.dump(self, Dumper=dumper, encoding='utf-8', allow_unicode=True)
+            ngram_data = self.ngram.data() if self.ngram is not None and self._ngram_path is not None else None
+        with Util.atomic_write(filename) as markov_file:
+            markov_file.write(data)
+        if ngram_data is not None:
+            NgramMarkov.write_data(self._ngram_path, ngram_data)
 
     def check(self) -> bool:
         for node in self.model.values():
@@ -153,62 +389,809 @@ class Markov:
         return True
 
 
+class CompactMarkov:
+    """Markov model that stores words interned to integer ids and transitions in CSR-style arrays.
+    Row i of (_indptr, _next_ids, _counts) holds sorted (next_id, count) pairs of node i.
+    Edges that are not present in CSR arrays yet are accumulated in _delta and merged by _compact().
+    Modifications can be appended to write-ahead log (see open_wal()) that is folded into snapshot by serialize()"""
+
+    STORAGE_PATH = const.MARKOV_SNAPSHOT_PATH
+    BEGIN_ID = 0
+    END_ID = -1
+    DELTA_COMPACTION_THRESHOLD = 1 << 16
+    CUMULATIVE_CACHE_MIN_DEGREE = 16
+    WAL_COMPACTION_THRESHOLD = 16 << 20
+
+    # Binary snapshot layout (little-endian):
+    # - header: magic, format version, reserved, metadata offset and size, (offset, count) of every array
+    # - metadata: UTF-8 encoded JSON with model settings
+    # - arrays (8-byte aligned): listed in _SNAPSHOT_ARRAYS
+    SNAPSHOT_MAGIC = b"WBMARKOV"
+    SNAPSHOT_FORMAT_VERSION = 1
+    _SNAPSHOT_ARRAYS = (
+        ("word_offsets", '<i8'),
+        ("word_blob", 'u1'),
+        ("word_alive", 'u1'),
+        ("totals", '<i8'),
+        ("indptr", '<i8'),
+        ("next_ids", '<i4'),
+        ("counts", '<u4'),
+    )
+    _SNAPSHOT_HEADER = struct.Struct("<8sIIQQ" + "QQ" * len(_SNAPSHOT_ARRAYS))
+
+    def __init__(self):
+        self._reset()
+        self.generation = 0
+        self._ngram_path: Optional[str] = None
+        self._wal: Optional[MarkovWriteAheadLog] = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._logged_chains_generated = self.chains_generated
+        self._snapshot_settings = self._settings()
+        # Incremented when words are removed, so generated messages that are cached can become outdated
+        self.removal_epoch = 0
+        # Incremented on every modification, so saving can be skipped if the model is not changed
+        self.revision = 0
+
+    def _reset(self) -> None:
+        self.words: List[Optional[str]] = [""]
+        self.word_ids: Dict[str, int] = {"": self.BEGIN_ID}
+        self._indptr = np.zeros(1, dtype='<i8')
+        self._next_ids = np.zeros(0, dtype='<i4')
+        self._counts = np.zeros(0, dtype='<u4')
+        self._totals = np.zeros(16, dtype='<i8')
+        self._delta: Dict[int, Dict[int, int]] = dict()
+        self._delta_size = 0
+        self._cumulative: Dict[int, Tuple[np.ndarray, np.ndarray]] = dict()
+        self.filters: List[Pattern[str]] = []
+        self.version = const.MARKOV_CONFIG_VERSION
+        self.min_chars = 10
+        self.min_words = 2
+        self.max_chars = 2000
+        self.max_words = 500
+        self.chains_generated = 0
+        self.ignored_prefixes: Dict[int, str] = dict()
+        self.state_size = 1
+        self.ngram: Optional[NgramMarkov] = None
+        self._gc_visited = np.zeros(0, dtype=np.bool_)
+        self._gc_stack: Optional[List[int]] = None
+        self._index: Optional[WordIndex] = None
+
+    @classmethod
+    def from_markov(cls, markov: Markov) -> 'CompactMarkov':
+        """Convert object graph Markov model to compact representation"""
+        compact = cls()
+        for attr in ("filters", "min_chars", "min_words", "max_chars", "max_words", "chains_generated", "state_size"):
+            setattr(compact, attr, getattr(markov, attr))
+        compact.ignored_prefixes = dict(markov.ignored_prefixes)
+        compact.ngram = markov.ngram
+        compact._ngram_path = markov._ngram_path
+        for word in markov.model.keys():
+            compact._intern(word)
+        for word, node in markov.model.items():
+            node_id = compact.word_ids[word]
+            for next_word, count in node.next.items():
+                if count > 0:
+                    next_id = compact.END_ID if next_word is None else compact._intern(next_word)
+                    compact._delta.setdefault(node_id, dict())[next_id] = count
+                    compact._delta_size += 1
+                    compact._totals[node_id] += count
+        compact._compact()
+        return compact
+
+    def to_markov(self) -> Markov:
+        """Convert compact Markov model to object graph representation"""
+        markov = Markov()
+        for attr in ("filters", "min_chars", "min_words", "max_chars", "max_words", "chains_generated", "state_size"):
+            setattr(markov, attr, getattr(self, attr))
+        markov.ignored_prefixes = dict(self.ignored_prefixes)
+        for node_id, word in enumerate(self.words):
+            if word is not None and node_id != self.BEGIN_ID:
+                markov.model[word] = MarkovNode(Markov.NodeType.word, word=word)
+        for node_id, word in enumerate(self.words):
+            if word is None:
+                continue
+            node = markov.model[word]
+            for next_id, count in self._successors(node_id):
+                node.next[None if next_id == self.END_ID else self.words[next_id]] = count
+            node.total_next = int(self._totals[node_id])
+        return markov
+
+    def _intern(self, word: str) -> int:
+        node_id = self.word_ids.get(word)
+        if node_id is None:
+            node_id = len(self.words)
+            self.words.append(word)
+            self.word_ids[word] = node_id
+            if self._index is not None and node_id != self.BEGIN_ID:
+                self._index.add(word)
+            if node_id >= len(self._totals):
+                self._totals = np.concatenate((self._totals, np.zeros(len(self._totals), dtype='<i8')))
+        return node_id
+
+    def _row(self, node_id: int) -> Tuple[int, int]:
+        if node_id + 1 < len(self._indptr):
+            return int(self._indptr[node_id]), int(self._indptr[node_id + 1])
+        return 0, 0
+
+    def _add_edge(self, node_id: int, next_id: int) -> None:
+        self._totals[node_id] += 1
+        self._cumulative.pop(node_id, None)
+        lo, hi = self._row(node_id)
+        if lo != hi:
+            pos = lo + int(np.searchsorted(self._next_ids[lo:hi], next_id))
+            if pos < hi and self._next_ids[pos] == next_id:
+                self._counts[pos] += 1
+                return
+        delta = self._delta.setdefault(node_id, dict())
+        if next_id not in delta:
+            delta[next_id] = 0
+            self._delta_size += 1
+        delta[next_id] += 1
+
+    def _successors(self, node_id: int) -> List[Tuple[int, int]]:
+        lo, hi = self._row(node_id)
+        result = [(int(next_id), int(count)) for next_id, count in zip(self._next_ids[lo:hi], self._counts[lo:hi])]
+        result.extend(self._delta.get(node_id, dict()).items())
+        return [(next_id, count) for next_id, count in result if count > 0]
+
+    def _csr_sources(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self._indptr) - 1, dtype='<i4'), np.diff(self._indptr))
+
+    def _compacted_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Merge CSR arrays with pending edges and drop zeroed edges without modifying the model"""
+        delta_items = [(node_id, next_id, count)
+                       for node_id, row in list(self._delta.items()) for next_id, count in list(row.items())]
+        sources = np.concatenate((
+            self._csr_sources(), np.array([x[0] for x in delta_items], dtype='<i4')))
+        next_ids = np.concatenate((self._next_ids, np.array([x[1] for x in delta_items], dtype='<i4')))
+        counts = np.concatenate((self._counts, np.array([x[2] for x in delta_items], dtype='<u4')))
+        alive = counts > 0
+        sources, next_ids, counts = sources[alive], next_ids[alive], counts[alive]
+        order = np.lexsort((next_ids, sources))
+        indptr = np.zeros(len(self.words) + 1, dtype='<i8')
+        np.cumsum(np.bincount(sources, minlength=len(self.words)), out=indptr[1:])
+        return indptr, next_ids[order], counts[order]
+
+    def _compact(self) -> None:
+        self._indptr, self._next_ids, self._counts = self._compacted_arrays()
+        self._delta = dict()
+        self._delta_size = 0
+
+    def _remove_nodes(self, node_ids: List[int]) -> List[str]:
+        removed = []
+        self._cumulative = dict()
+        for node_id in node_ids:
+            word = cast(str, self.words[node_id])
+            removed.append(word)
+            del self.word_ids[word]
+            if self._index is not None:
+                self._index.remove(word)
+            self.words[node_id] = None
+            self._totals[node_id] = 0
+            lo, hi = self._row(node_id)
+            self._counts[lo:hi] = 0
+            self._delta_size -= len(self._delta.pop(node_id, dict()))
+        if not node_ids:
+            return removed
+        self.removal_epoch += 1
+        self.revision += 1
+        if self.ngram is not None:
+            self.ngram.remove_words(removed)
+        incoming = np.isin(self._next_ids, np.array(node_ids, dtype='<i4')) & (self._counts > 0)
+        np.subtract.at(self._totals, self._csr_sources()[incoming], self._counts[incoming].astype('<i8'))
+        self._counts[incoming] = 0
+        node_ids_set = set(node_ids)
+        for node_id, row in self._delta.items():
+            for next_id in node_ids_set.intersection(row.keys()):
+                self._totals[node_id] -= row.pop(next_id)
+                self._delta_size -= 1
+        return removed
+
+    def _tokenize(self, text: str) -> Optional[List[str]]:
+        """Split message to words that are added to the model. Returns None if message should be skipped"""
+        if len(text) < self.min_chars or len(text) > self.max_chars:
+            return None
+        for prefix in self.ignored_prefixes.values():
+            if text.startswith(prefix):
+                return None
+        words = [word for word in filter(None, text.split(' ')) if not any(regex.match(word) for regex in self.filters)]
+        if len(words) < self.min_words or len(words) > self.max_words:
+            return None
+        return words
+
+    def add_string(self, text: str) -> None:
+        self.add_strings([text])
+
+    def add_strings(self, texts: Iterable[str]) -> None:
+        """Add batch of messages. Messages are filtered and split to words before the model is locked"""
+        messages = [words for words in map(self._tokenize, texts) if words is not None]
+        with self._lock:
+            for words in messages:
+                self._log(MarkovWriteAheadLog.Op.ADD_WORDS, ' '.join(words))
+                self._add_words(words)
+
+    def _add_words(self, words: List[str]) -> None:
+        current_id = self.BEGIN_ID
+        for word in words:
+            next_id = self._intern(word)
+            self._add_edge(current_id, next_id)
+            current_id = next_id
+            if self._gc_stack is not None:
+                self._gc_shade(next_id)
+        if current_id != self.BEGIN_ID:
+            self._add_edge(current_id, self.END_ID)
+        if self._delta_size > self.DELTA_COMPACTION_THRESHOLD:
+            self._compact()
+        if self.ngram is not None:
+            self.ngram.add_words(words)
+        self.revision += 1
+
+    def del_words(self, regex: str) -> List[str]:
+        re.compile(regex)
+        with self._lock:
+            self._log(MarkovWriteAheadLog.Op.DEL_WORDS, regex)
+            return self._del_words(regex)
+
+    def _del_words(self, regex: str) -> List[str]:
+        return self._remove_nodes([self.word_ids[word] for word in self._word_index().search(regex)])
+
+    def find_words(self, regex: str) -> List[str]:
+        with self._lock:
+            return self._word_index().search(regex)
+
+    def mark_dirty(self) -> None:
+        """Notify that the model should be saved (e.g. after modification of filters)"""
+        self.revision += 1
+
+    def _word_index(self) -> WordIndex:
+        """Get word index. It is built on first use and updated by model modifications"""
+        if self._index is None:
+            self._index = WordIndex(word for word in self.words[1:] if word is not None)
+        return self._index
+
+    def words_count(self) -> int:
+        return len(self.word_ids)
+
+    def pairs_count(self) -> int:
+        return int(self._totals[:len(self.words)].sum())
+
+    def get_next_words_list(self, word: str) -> List[Tuple[str, int]]:
+        if word not in self.word_ids.keys():
+            return []
+        with self._lock:
+            successors = self._successors(self.word_ids[word])
+        result = [(None, sum(count for next_id, count in successors if next_id == self.END_ID))]
+        result.extend((self.words[next_id], count) for next_id, count in successors if next_id != self.END_ID)
+        return sorted(result, key=lambda x: -x[1])
+
+    def _cumulative_table(self, node_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get (next_ids, cumulative counts) table for node. Tables of high degree nodes are cached
+        until the node is modified"""
+        table = self._cumulative.get(node_id)
+        if table is not None:
+            return table
+        lo, hi = self._row(node_id)
+        delta = self._delta.get(node_id, dict())
+        next_ids = np.concatenate((self._next_ids[lo:hi], np.fromiter(delta.keys(), dtype='<i4', count=len(delta))))
+        counts = np.concatenate((self._counts[lo:hi], np.fromiter(delta.values(), dtype='<u4', count=len(delta))))
+        table = next_ids, np.cumsum(counts, dtype='<i8')
+        if len(next_ids) >= self.CUMULATIVE_CACHE_MIN_DEGREE:
+            self._cumulative[node_id] = table
+        return table
+
+    def _choose_next(self, node_id: int, index: int) -> int:
+        next_ids, cumulative = self._cumulative_table(node_id)
+        pos = int(np.searchsorted(cumulative, index, side='right'))
+        if pos == len(next_ids):
+            return self.END_ID
+        return int(next_ids[pos])
+
+    def attach_ngram(self, path: str) -> None:
+        """Load Markov chain of order state_size from path. The chain is trained along with the model
+        and it is saved to path together with snapshot, so it must be attached before write-ahead log is replayed"""
+        self._ngram_path = path
+        self.ngram = NgramMarkov.load(path, self.state_size, self.generation) if self.state_size > 1 else None
+
+    def set_state_size(self, state_size: int, path: str) -> None:
+        """Set order of Markov chain that is used for generation. Chain of higher order is empty at first
+        and it is trained by new messages"""
+        with self._lock:
+            if state_size != 1 and (self.ngram is None or self.ngram.state_size != state_size):
+                self.ngram = NgramMarkov(state_size)
+            elif state_size == 1:
+                self.ngram = None
+            self.state_size = state_size
+            self._ngram_path = path
+            self.removal_epoch += 1
+            self.revision += 1
+
+    def generate(self, word: str = "", order: Optional[int] = None, count: bool = True) -> str:
+        """Generate chain. If count is False, the chain is not added to chains_generated (see count_chain())"""
+        with self._lock:
+            return self._generate(word, order, count)
+
+    def count_chain(self) -> None:
+        """Add chain that was generated with count=False to chains_generated"""
+        with self._lock:
+            self.chains_generated += 1
+
+    def _generate(self, word: str, order: Optional[int], count: bool) -> str:
+        result = _generate_higher_order(self, word, order, count)
+        if result is not None:
+            return result
+        if word not in self.word_ids.keys():
+            return "<Empty message was generated>"
+        node_id = self.word_ids[word]
+        result = word + ' '
+        while True:
+            total_next = int(self._totals[node_id])
+            if total_next <= 0:
+                if node_id == self.BEGIN_ID:
+                    return "<Markov database is empty>"
+                break
+            next_id = self._choose_next(node_id, random.randint(0, total_next - 1))
+            if next_id == self.END_ID:
+                if node_id == self.BEGIN_ID:
+                    continue
+                break
+            result += cast(str, self.words[next_id]) + ' '
+            node_id = next_id
+        result = result.strip()
+        if not result:
+            return "<Empty message was generated>"
+        if count:
+            self.chains_generated += 1
+        return result
+
+    def _gc_shade(self, node_id: int) -> None:
+        """Mark node as reachable and schedule scan of its next words.
+        Nodes that are created after collection cycle is started are not collected in this cycle"""
+        if node_id < self._gc_limit and not self._gc_visited[node_id]:
+            self._gc_visited[node_id] = True
+            self._gc_stack.append(node_id)
+
+    def gc_step(self, budget: int) -> Optional[Set[str]]:
+        """Do bounded amount of mark-and-sweep garbage collection work.
+        Model can be modified between steps: nodes that are touched by add_string() are considered reachable.
+        Garbage nodes are removed at once in the end of collection cycle.
+        Returns set of removed words when collection cycle is finished, otherwise None"""
+        with self._lock:
+            return self._gc_step(budget)
+
+    def _gc_step(self, budget: int) -> Optional[Set[str]]:
+        if self._gc_stack is None:
+            self._gc_limit = len(self.words)
+            if len(self._gc_visited) < self._gc_limit:
+                self._gc_visited = np.zeros(2 * self._gc_limit, dtype=np.bool_)
+            else:
+                self._gc_visited[:self._gc_limit] = False
+            self._gc_stack = []
+            self._gc_sweep_pos = 0
+            self._gc_shade(self.BEGIN_ID)
+        while self._gc_stack and budget > 0:
+            successors = self._successors(self._gc_stack.pop())
+            for next_id, _ in successors:
+                if next_id != self.END_ID:
+                    self._gc_shade(next_id)
+            budget -= len(successors) + 1
+        if self._gc_stack:
+            return None
+        # Sweep only checks bitmap, so it is done in chunks of budget size
+        self._gc_sweep_pos = min(self._gc_limit, self._gc_sweep_pos + max(budget, 0))
+        if self._gc_sweep_pos < self._gc_limit:
+            return None
+        garbage = [
+            int(node_id) for node_id in np.flatnonzero(~self._gc_visited[:self._gc_limit])
+            if self.words[node_id] is not None]
+        self._gc_stack = None
+        self._log(MarkovWriteAheadLog.Op.REMOVE_WORDS, json.dumps([self.words[node_id] for node_id in garbage]))
+        return set(self._remove_nodes(garbage))
+
+    def collect_garbage(self) -> Set[str]:
+        removed = None
+        while removed is None:
+            removed = self.gc_step(sys.maxsize)
+        return removed
+
+    def drop(self) -> None:
+        """Remove all words and reset settings of the model"""
+        with self._lock:
+            self._log(MarkovWriteAheadLog.Op.DROP)
+            self._reset()
+            self.removal_epoch += 1
+            self.revision += 1
+
+    def _log(self, op: MarkovWriteAheadLog.Op, payload: str = "") -> None:
+        if self._wal is not None:
+            self._wal.append(op, payload)
+
+    def _replay(self, op: MarkovWriteAheadLog.Op, payload: str) -> None:
+        if op == MarkovWriteAheadLog.Op.ADD_WORDS:
+            self._add_words(payload.split(' ') if payload else [])
+        elif op == MarkovWriteAheadLog.Op.DEL_WORDS:
+            self._del_words(payload)
+        elif op == MarkovWriteAheadLog.Op.COLLECT_GARBAGE:
+            self.collect_garbage()
+        elif op == MarkovWriteAheadLog.Op.REMOVE_WORDS:
+            self._remove_nodes([self.word_ids[word] for word in json.loads(payload) if word in self.word_ids.keys()])
+        elif op == MarkovWriteAheadLog.Op.DROP:
+            self._reset()
+        elif op == MarkovWriteAheadLog.Op.CHAINS_GENERATED:
+            self.chains_generated = int(payload)
+
+    def replay_wal(self, prefix: str) -> int:
+        """Apply write-ahead log records that are not folded into the model yet.
+        Returns number of applied records"""
+        replayed = 0
+        for generation in MarkovWriteAheadLog.list_generations(prefix):
+            if generation < self.generation:
+                continue
+            for op, payload in MarkovWriteAheadLog.read(MarkovWriteAheadLog.get_path(prefix, generation)):
+                self._replay(op, payload)
+                replayed += 1
+            self.generation = generation
+        return replayed
+
+    def open_wal(self, prefix: str) -> int:
+        """Replay write-ahead log and append all following modifications of the model to it.
+        Returns number of replayed records"""
+        MarkovWriteAheadLog.remove_older(prefix, self.generation)
+        replayed = self.replay_wal(prefix)
+        self._logged_chains_generated = self.chains_generated
+        self._wal = MarkovWriteAheadLog(prefix, self.generation)
+        return replayed
+
+    def serialize(self, filename: str, dumper: type = None) -> None:
+        """Save the model. If write-ahead log is open, only the log is flushed to disk until it exceeds
+        WAL_COMPACTION_THRESHOLD or model settings are changed. Then the log is folded into snapshot"""
+        if self._wal is None:
+            self.write_snapshot(filename)
+            return
+        with self._save_lock:
+            with self._lock:
+                if self.chains_generated != self._logged_chains_generated:
+                    self._log(MarkovWriteAheadLog.Op.CHAINS_GENERATED, str(self.chains_generated))
+                    self._logged_chains_generated = self.chains_generated
+                self._wal.flush()
+            if self._wal.size() < self.WAL_COMPACTION_THRESHOLD and self._settings() == self._snapshot_settings:
+                self._wal.sync()
+                return
+            self._compact_wal(filename)
+
+    def _compact_wal(self, filename: str) -> None:
+        with self._lock:
+            self._wal.rotate()
+            self.generation = self._wal.generation
+            data = self._snapshot_data()
+            ngram_data = self._ngram_data()
+            settings = self._settings()
+        self._write_snapshot_data(filename, *data)
+        if ngram_data is not None:
+            NgramMarkov.write_data(self._ngram_path, ngram_data)
+        MarkovWriteAheadLog.remove_older(self._wal.prefix, self.generation)
+        self._snapshot_settings = settings
+
+    def export_yaml(self, filename: str, dumper: type = yaml.Dumper) -> None:
+        """Export model to markov.yaml format that is used by object graph Markov model"""
+        self.to_markov().serialize(filename, dumper)
+
+    def _settings(self) -> Dict[str, Any]:
+        return {
+            "filters": [[regex.pattern, regex.flags] for regex in self.filters],
+            "ignored_prefixes": {str(key): value for key, value in self.ignored_prefixes.items()},
+            "min_chars": self.min_chars,
+            "min_words": self.min_words,
+            "max_chars": self.max_chars,
+            "max_words": self.max_words,
+            "state_size": self.state_size,
+        }
+
+    def _ngram_data(self) -> Optional[Dict[str, np.ndarray]]:
+        """Capture copy of higher order Markov chain that is saved together with snapshot"""
+        if self.ngram is None or self._ngram_path is None:
+            return None
+        self.ngram.generation = self.generation
+        return self.ngram.data()
+
+    def _snapshot_data(self) -> Tuple[List[Optional[str]], Dict[str, np.ndarray], Dict[str, Any]]:
+        """Capture copy of the model state that is written to snapshot"""
+        indptr, next_ids, counts = self._compacted_arrays()
+        arrays = {
+            "totals": self._totals[:len(self.words)].copy(),
+            "indptr": indptr,
+            "next_ids": next_ids,
+            "counts": counts,
+        }
+        metadata = {
+            "version": self.version,
+            **self._settings(),
+            "chains_generated": self.chains_generated,
+            "generation": self.generation,
+        }
+        return list(self.words), arrays, metadata
+
+    def write_snapshot(self, filename: str) -> None:
+        """Atomically write binary snapshot of the model. If write-ahead log is open, it is folded into snapshot"""
+        if self._wal is not None:
+            with self._save_lock:
+                return self._compact_wal(filename)
+        self._write_snapshot_data(filename, *self._snapshot_data())
+        ngram_data = self._ngram_data()
+        if ngram_data is not None:
+            NgramMarkov.write_data(self._ngram_path, ngram_data)
+        self._snapshot_settings = self._settings()
+
+    def _write_snapshot_data(
+            self, filename: str, words: List[Optional[str]], arrays: Dict[str, np.ndarray],
+            metadata: Dict[str, Any]) -> None:
+        encoded_words = [word.encode("utf-8") if word is not None else b"" for word in words]
+        word_offsets = np.zeros(len(words) + 1, dtype='<i8')
+        np.cumsum([len(word) for word in encoded_words], out=word_offsets[1:])
+        arrays = dict(arrays)
+        arrays["word_offsets"] = word_offsets
+        arrays["word_blob"] = np.frombuffer(b"".join(encoded_words), dtype='u1')
+        arrays["word_alive"] = np.array([word is not None for word in words], dtype='u1')
+        metadata_json = json.dumps(metadata).encode("utf-8")
+        offset = self._SNAPSHOT_HEADER.size + len(metadata_json)
+        layout = []
+        for name, dtype in self._SNAPSHOT_ARRAYS:
+            offset += -offset % 8
+            layout.append((offset, len(arrays[name])))
+            offset += arrays[name].nbytes
+        with Util.atomic_write(filename) as f:
+            f.write(self._SNAPSHOT_HEADER.pack(
+                self.SNAPSHOT_MAGIC, self.SNAPSHOT_FORMAT_VERSION, 0,
+                self._SNAPSHOT_HEADER.size, len(metadata_json), *itertools.chain(*layout)))
+            f.write(metadata_json)
+            for (name, dtype), (offset, _) in zip(self._SNAPSHOT_ARRAYS, layout):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(arrays[name].astype(dtype, copy=False).tobytes())
+
+    @classmethod
+    def read_snapshot(cls, filename: str) -> 'CompactMarkov':
+        """Read binary snapshot of the model. Transition arrays are memory-mapped in copy-on-write mode,
+        so the snapshot file is never modified by the model"""
+        with open(filename, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        if len(buffer) < cls._SNAPSHOT_HEADER.size:
+            raise ValueError(f"'{filename}' is too small to be a Markov model snapshot")
+        magic, format_version, _, metadata_offset, metadata_size, *layout = cls._SNAPSHOT_HEADER.unpack_from(buffer)
+        if magic != cls.SNAPSHOT_MAGIC:
+            raise ValueError(f"'{filename}' is not a Markov model snapshot")
+        if format_version != cls.SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported Markov model snapshot format version: {format_version}")
+        metadata = json.loads(buffer[metadata_offset:metadata_offset + metadata_size].decode("utf-8"))
+        arrays = {
+            name: np.frombuffer(buffer, dtype=dtype, count=layout[2 * i + 1], offset=layout[2 * i])
+            for i, (name, dtype) in enumerate(cls._SNAPSHOT_ARRAYS)
+        }
+        if sys.platform == "win32":
+            # Mapped file can not be replaced on Windows, so snapshot is loaded to memory
+            arrays = {name: array.copy() for name, array in arrays.items()}
+        markov = cls()
+        markov.version = metadata["version"]
+        markov.filters = [re.compile(pattern, flags) for pattern, flags in metadata["filters"]]
+        markov.ignored_prefixes = {int(key): value for key, value in metadata["ignored_prefixes"].items()}
+        for attr in ("min_chars", "min_words", "max_chars", "max_words", "chains_generated"):
+            setattr(markov, attr, metadata[attr])
+        markov.generation = metadata.get("generation", 0)
+        markov.state_size = metadata.get("state_size", 1)
+        markov._logged_chains_generated = markov.chains_generated
+        markov._snapshot_settings = markov._settings()
+        word_blob = arrays["word_blob"].tobytes()
+        word_offsets = arrays["word_offsets"].tolist()
+        markov.words = [
+            word_blob[word_offsets[i]:word_offsets[i + 1]].decode("utf-8") if alive else None
+            for i, alive in enumerate(arrays["word_alive"].tolist())
+        ]
+        markov.word_ids = {word: node_id for node_id, word in enumerate(markov.words) if word is not None}
+        markov._totals = arrays["totals"]
+        markov._indptr = arrays["indptr"]
+        markov._next_ids = arrays["next_ids"]
+        markov._counts = arrays["counts"]
+        return markov
+
+    def check(self) -> bool:
+        totals = np.bincount(
+            self._csr_sources(), weights=self._counts, minlength=len(self.words)).astype('<i8')
+        for node_id, row in self._delta.items():
+            totals[node_id] += sum(row.values())
+        if np.array_equal(totals, self._totals[:len(self.words)]):
+            return True
+        self._totals[:len(self.words)] = totals
+        return False
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        indptr, next_ids, counts = self._compacted_arrays()
+        state["_indptr"] = indptr.tobytes()
+        state["_next_ids"] = next_ids.tobytes()
+        state["_counts"] = counts.tobytes()
+        state["_totals"] = self._totals[:len(self.words)].tobytes()
+        del state["word_ids"]
+        del state["_delta"]
+        del state["_delta_size"]
+        del state["_cumulative"]
+        for attr in (
+                "removal_epoch", "revision", "ngram", "_ngram_path", "_wal", "_lock", "_save_lock",
+                "_logged_chains_generated", "_snapshot_settings", "_gc_visited", "_gc_stack", "_gc_limit",
+                "_gc_sweep_pos", "_index"):
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._indptr = np.frombuffer(state["_indptr"], dtype='<i8').copy()
+        self._next_ids = np.frombuffer(state["_next_ids"], dtype='<i4').copy()
+        self._counts = np.frombuffer(state["_counts"], dtype='<u4').copy()
+        self._totals = np.frombuffer(state["_totals"], dtype='<i8').copy()
+        self.word_ids = {word: node_id for node_id, word in enumerate(self.words) if word is not None}
+        self._delta = dict()
+        self._delta_size = 0
+        self._cumulative = dict()
+        self.generation = state.get("generation", 0)
+        self.state_size = state.get("state_size", 1)
+        self.ngram = None
+        self._ngram_path = None
+        self._wal = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._logged_chains_generated = self.chains_generated
+        self._snapshot_settings = self._settings()
+        self.removal_epoch = 0
+        self.revision = 0
+        self._gc_visited = np.zeros(0, dtype=np.bool_)
+        self._gc_stack = None
+        self._index = None
+
+
+def _generate_higher_order(markov: Any, word: str, order: Optional[int], count: bool) -> Optional[str]:
+    """Generate message by Markov chain of higher order. Order defaults to state_size of the model.
+    Returns None if the message should be generated by the first order Markov chain: requested order is 1 or
+    default chain of higher order can not generate the message (e.g. it is not trained yet)"""
+    if (order or markov.state_size) == 1:
+        return None
+    if markov.ngram is None or markov.ngram.state_size != (order or markov.state_size):
+        return None if order is None else f"<Markov chain of order {order} is not enabled>"
+    result = markov.ngram.generate(word)
+    if result is None:
+        return None if order is None else "<Empty message was generated>"
+    if count:
+        markov.chains_generated += 1
+    return result
+
+
+async def collect_garbage_incrementally(markov: Any, budget: int = const.MARKOV_GC_STEP_BUDGET) -> Set[str]:
+    """Run Markov model garbage collection cycle doing bounded amount of work per event loop iteration"""
+    while True:
+        removed = markov.gc_step(budget)
+        if removed is not None:
+            return removed
+        await asyncio.sleep(0)
+
+
 class MarkovV2:
+    """Markov model that is stored in MongoDB document.
+    Nodes that are used for generation are kept in LRU cache and settings are loaded once per SETTINGS_TTL.
+    New transitions are accumulated as pending increments that are written by bulk_write() on timer"""
+
     class NodeType(IntEnum):
         begin = 0
         word = 1
         end = 2
 
+    STORAGE_PATH = const.MARKOV_PATH
+    NODE_CACHE_SIZE = 4096
+    SETTINGS_TTL = 60  # seconds
+    FLUSH_INTERVAL = 5  # seconds
+    MAX_PENDING_INCREMENTS = 1 << 14
+    BULK_WRITE_BATCH_SIZE = 1000  # fields per update operation
+    _MODEL_FILTER = {"model": {'$exists': 1}}
+
     def __init__(self, col):
         self.version = const.MARKOV_CONFIG_VERSION
         self._collection = col
+        self._nodes: 'collections.OrderedDict[str, Dict[str, Any]]' = collections.OrderedDict()
+        self._end_node: Optional[Dict[str, Any]] = None
+        self._settings: Optional[Dict[str, Any]] = None
+        self._settings_loaded_at = 0.0
+        # Increments and created nodes that are not written to database yet (guarded by _lock)
+        self._pending: Dict[str, Dict[str, int]] = dict()
+        self._pending_count = 0
+        self._new_nodes: Dict[str, str] = dict()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        # Held while pending increments are written, so database reads do not miss in-flight increments
+        self._flush_lock = threading.Lock()
 
     def get(self, key: str):
-        return self._collection.find_one({})[key]
+        if self._settings is None or time.monotonic() - self._settings_loaded_at > self.SETTINGS_TTL:
+            settings = self._collection.find_one(self._MODEL_FILTER, {"model": 0, "end_node": 0})
+            # Filters are stored as BSON regular expressions
+            settings["filters"] = [re.compile(regex.pattern, regex.flags) for regex in settings["filters"]]
+            self._settings = settings
+            self._settings_loaded_at = time.monotonic()
+        return self._settings[key]
 
-    def add_next(self, node, word: str) -> None:
-        if word in node["next"].keys():
-            node["next"][word] += 1
-        else:
-            node["next"][word] = 1
-            if word != "__markov_terminate":
-                self._collection.update_one(
-                    {"model": {'$exists': 1}},
-                    {"$set": {f"model.{word}": {
-                        "word": word,
-                        "next": {
-                            "__markov_null": 0,
-                        },
-                        "total_next": 0,
-                        "type": self.NodeType.word,
-                    }
-                    }}
-                )
-        node["total_next"] += 1
-        self._collection.update_one(
-            {"model": {'$exists': 1}},
-            {"$set": {f"model.{node['word'] or '__markov_null'}": node}}
-        )
-
-    def del_next(self, node, word: str) -> None:
-        pass
+    def invalidate_settings(self) -> None:
+        """Reload settings from database on next access"""
+        self._settings = None
 
-    def get_next(self, word: str):
-        res = self._collection.find_one(
-            {f"model.{word}": {'$exists': 1}},
-            {f"model.{word}": 1}
-        )
-        if res is None:
-            res = self._collection.find_one(
+    def _increment(self, key: str, next_key: str) -> None:
+        row = self._pending.setdefault(key, dict())
+        row[next_key] = row.get(next_key, 0) + 1
+        self._pending_count += 1
+        node = self._nodes.get(key)
+        if node is not None:
+            node["next"][next_key] = node["next"].get(next_key, 0) + 1
+            node["total_next"] += 1
+
+    def flush(self) -> None:
+        """Write pending increments to database"""
+        from pymongo import UpdateOne  # type:ignore
+
+        with self._flush_lock:
+            with self._lock:
+                pending, new_nodes = self._pending, self._new_nodes
+                self._pending, self._new_nodes, self._pending_count = dict(), dict(), 0
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+            fields = [("$set", f"model.{key}.word", word) for key, word in new_nodes.items()]
+            fields.extend(("$set", f"model.{key}.type", int(self.NodeType.word)) for key in new_nodes.keys())
+            for key, row in pending.items():
+                fields.append(("$inc", f"model.{key}.total_next", sum(row.values())))
+                fields.extend(("$inc", f"model.{key}.next.{next_key}", count) for next_key, count in row.items())
+            requests = []
+            for i in range(0, len(fields), self.BULK_WRITE_BATCH_SIZE):
+                update: Dict[str, Dict[str, Any]] = dict()
+                for op, path, value in fields[i:i + self.BULK_WRITE_BATCH_SIZE]:
+                    update.setdefault(op, dict())[path] = value
+                requests.append(UpdateOne(self._MODEL_FILTER, update))
+            if requests:
+                self._collection.bulk_write(requests, ordered=True)
+
+    def _get_end_node(self) -> Dict[str, Any]:
+        if self._end_node is None:
+            self._end_node = self._collection.find_one(
                 {"end_node": {'$exists': 1}},
                 {"end_node": 1}
+            )["end_node"]
+        return self._end_node
+
+    def get_next(self, word: str):
+        if word == "__markov_terminate":
+            return self._get_end_node()
+        node = self._nodes.get(word)
+        if node is not None:
+            self._nodes.move_to_end(word)
+            return node
+        with self._flush_lock:
+            res = self._collection.find_one(
+                {f"model.{word}": {'$exists': 1}},
+                {f"model.{word}": 1}
             )
-            return res["end_node"]
-        return res["model"][word]
+            with self._lock:
+                if res is not None:
+                    node = res["model"][word]
+                elif word in self._new_nodes.keys():
+                    node = {"word": self._new_nodes[word], "next": dict(), "total_next": 0, "type": self.NodeType.word}
+                else:
+                    return self._get_end_node()
+                for next_key, count in self._pending.get(word, dict()).items():
+                    node["next"][next_key] = node["next"].get(next_key, 0) + count
+                    node["total_next"] += count
+                self._nodes[word] = node
+                if len(self._nodes) > self.NODE_CACHE_SIZE:
+                    self._nodes.popitem(last=False)
+        return node
 
+    @staticmethod
     def preprocess_key(key: str):
         return key.replace("$", "<__markov_dollar>").replace(".", "<__markov_dot>")
 
+    @staticmethod
     def postprocess_key(key: str):
         return key.replace("<__markov_dollar>", "$").replace("<__markov_dot>", ".")
 
@@ -222,12 +1205,27 @@ class MarkovV2:
         ]
         if len(words) < self.get("min_words") or len(words) > self.get("max_words"):
             return
-        current_node = self.get_next("__markov_null")
-        for word in words:
-            self.add_next(current_node, word)
-            current_node = self.get_next(word)
-        if current_node["word"] is not None:
-            self.add_next(current_node, "__markov_terminate")
+        with self._lock:
+            current_key = "__markov_null"
+            for word in words:
+                key = self.preprocess_key(word)
+                if key not in self._nodes.keys():
+                    self._new_nodes[key] = word
+                self._increment(current_key, key)
+                current_key = key
+            if current_key != "__markov_null":
+                self._increment(current_key, "__markov_terminate")
+            if self._flush_timer is None and self._pending_count < self.MAX_PENDING_INCREMENTS:
+                self._flush_timer = threading.Timer(self.FLUSH_INTERVAL, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+            flush_now = self._pending_count >= self.MAX_PENDING_INCREMENTS
+        if flush_now:
+            self.flush()
+
+    def add_strings(self, texts: Iterable[str]) -> None:
+        for text in texts:
+            self.add_string(text)
 
     def del_words(self, regex: str) -> List[str]:
         removed = []
@@ -242,18 +1240,20 @@ class MarkovV2:
     def find_words(self, regex: str) -> List[str]:
         return [self.model[word].word for word in self.model if re.search(regex, word)]
 
-    def generate(self, word: str = "__markov_null") -> str:
-        current_node = self.get_next(word)
+    def generate(self, word: str = "__markov_null", order: Optional[int] = None, count: bool = True) -> str:
+        if order is not None and order != 1:
+            return f"<Markov chain of order {order} is not enabled>"
+        current_node = self.get_next(self.preprocess_key(word))
         if current_node is None:
             return "<Empty message was generated>"
         result = ""
         while current_node["type"] != self.NodeType.end:
             index = random.randint(0, max(0, current_node["total_next"] - 1))
-            count = 0
+            steps = 0
             for word, next_count in current_node["next"].items():
-                count += next_count
-                if count > index:
-                    result += (word if word != "__markov_terminate" else "") + ' '
+                steps += next_count
+                if steps > index:
+                    result += (self.postprocess_key(word) if word != "__markov_terminate" else "") + ' '
                     next_node = self.get_next(word)
                     if current_node["word"] is None and next_node["type"] == self.NodeType.end:
                         continue
@@ -266,14 +1266,22 @@ class MarkovV2:
         result = result.strip()
         if not result:
             return "<Empty message was generated>"
-        # self.chains_generated += 1
+        if count:
+            self.count_chain()
         return result
 
+    def count_chain(self) -> None:
+        # self.chains_generated += 1
+        pass
+
     def collect_garbage(self, node: Optional[MarkovNode] = None) -> Set[str]:
         return set()
 
+    def gc_step(self, budget: int) -> Optional[Set[str]]:
+        return set()
+
     def serialize(self, filename: str, dumper: type = yaml.Dumper) -> None:
-        pass
+        self.flush()
 
     def check(self) -> bool:
         return True
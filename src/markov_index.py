@@ -0,0 +1,121 @@
+import bisect
+import re
+import sys
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from re import _parser as sre_parse  # type:ignore
+except ImportError:  # Python < 3.11
+    import sre_parse  # type:ignore
+
+
+class WordIndex:
+    """Index of Markov model vocabulary for regex search.
+    It contains sorted list of words (for anchored prefixes) and trigram inverted index.
+    Literal substrings that every match must contain are extracted from regex to narrow the candidates,
+    full regex is checked only for candidates"""
+
+    NGRAM = 3
+
+    def __init__(self, words: Iterable[str] = ()) -> None:
+        self._words: Set[str] = set(words)
+        self._sorted: List[str] = sorted(self._words)
+        # Changes of vocabulary that are not applied to sorted list yet. List is updated on the next query,
+        # so adding words while model is ingested does not shift the list on every new word
+        self._added: List[str] = []
+        self._removed = False
+        self._ngrams: Dict[str, Set[str]] = dict()
+        for word in self._sorted:
+            self._add_ngrams(word)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def _add_ngrams(self, word: str) -> None:
+        for i in range(len(word) - self.NGRAM + 1):
+            self._ngrams.setdefault(word[i:i + self.NGRAM], set()).add(word)
+
+    def add(self, word: str) -> None:
+        if word in self._words:
+            return
+        self._words.add(word)
+        self._added.append(word)
+        self._add_ngrams(word)
+
+    def remove(self, word: str) -> None:
+        if word not in self._words:
+            return
+        self._words.discard(word)
+        self._removed = True
+        for i in range(len(word) - self.NGRAM + 1):
+            postings = self._ngrams.get(word[i:i + self.NGRAM])
+            if postings is not None:
+                postings.discard(word)
+                if not postings:
+                    del self._ngrams[word[i:i + self.NGRAM]]
+
+    def _sorted_words(self) -> List[str]:
+        if self._removed:
+            self._sorted = [word for word in self._sorted if word in self._words]
+            self._removed = False
+        if self._added:
+            # Word could be added, removed and added again
+            self._sorted.extend(word for word in dict.fromkeys(self._added) if word in self._words)
+            self._added = []
+            # Timsort sorts only the tail of added words and merges it with already sorted run
+            self._sorted.sort()
+            if len(self._sorted) != len(self._words):
+                # Removed word was added again before the query and it is in the list twice
+                self._sorted = [word for i, word in enumerate(self._sorted) if i == 0 or self._sorted[i - 1] != word]
+        return self._sorted
+
+    @staticmethod
+    def required_literals(regex: str) -> Tuple[Optional[str], List[str]]:
+        """Get (prefix, literals): literal prefix of anchored regex (or None) and literal substrings that are
+        contained in every string that matches regex. Only top-level sequence of regex is analyzed"""
+        flags = re.compile(regex).flags
+        if flags & re.IGNORECASE:
+            return None, []
+        items = list(sre_parse.parse(regex, flags))
+        runs: List[Tuple[int, str]] = []
+        current: List[str] = []
+        for i, (op, av) in enumerate(items + [(None, None)]):
+            if op == sre_parse.LITERAL:
+                current.append(chr(av))
+                continue
+            if current:
+                runs.append((i - len(current), ''.join(current)))
+                current = []
+        prefix = None
+        if (items and items[0][0] == sre_parse.AT and not flags & re.MULTILINE and
+                items[0][1] in (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING) and runs and runs[0][0] == 1):
+            prefix = runs[0][1]
+        return prefix, [run for _, run in runs]
+
+    def _candidates(self, regex: str) -> Optional[List[str]]:
+        prefix, literals = self.required_literals(regex)
+        candidates: Optional[List[str]] = None
+        if prefix is not None and ord(prefix[-1]) < sys.maxunicode:
+            sorted_words = self._sorted_words()
+            lo = bisect.bisect_left(sorted_words, prefix)
+            hi = bisect.bisect_left(sorted_words, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo)
+            candidates = sorted_words[lo:hi]
+        postings = sorted((
+            self._ngrams.get(literal[i:i + self.NGRAM], set())
+            for literal in literals for i in range(len(literal) - self.NGRAM + 1)), key=len)
+        if not postings or (candidates is not None and len(candidates) <= len(postings[0])):
+            return candidates
+        # Intersection is started from the smallest posting list, so it takes O(len(postings[0])) time
+        words = postings[0]
+        for other in postings[1:]:
+            words = words.intersection(other)
+        if candidates is not None:
+            return [word for word in candidates if word in words]
+        return sorted(words)
+
+    def search(self, regex: str) -> List[str]:
+        """Get sorted list of words that match regex (re.search semantics)"""
+        pattern = re.compile(regex)
+        candidates = self._candidates(regex)
+        return [word for word in (self._sorted_words() if candidates is None else candidates)
+                if pattern.search(word)]
@@ -0,0 +1,119 @@
+import queue
+import threading
+from typing import Any, Dict, List, Optional
+
+from src import const
+from src.log import log
+
+
+class MarkovIngestQueue:
+    """Bounded queue of messages that should be added to Markov model.
+
+    Message handlers only push raw text, so they never wait for the model. Single consumer thread applies
+    filters, splits messages to words and adds them to the model in batches of up to batch_size messages.
+    If the queue is full, new messages are dropped instead of slowing down message handlers"""
+
+    BACKPRESSURE_RATIO = 0.75
+
+    def __init__(
+            self, markov: Any, maxsize: int = const.MARKOV_INGEST_QUEUE_SIZE,
+            batch_size: int = const.MARKOV_INGEST_BATCH_SIZE) -> None:
+        self.markov = markov
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self.pushed = 0
+        self.processed = 0
+        self.dropped = 0
+        self.backpressure = 0
+        self.batches = 0
+
+    def start(self) -> None:
+        """Start consumer thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="MarkovIngest", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Add all pushed messages to the model and stop consumer thread"""
+        if self._thread is None:
+            return self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def push(self, text: str) -> bool:
+        """Push message to the queue without blocking. Returns False if message is dropped"""
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            with self._stats_lock:
+                if not self.dropped:
+                    log.warning("Markov ingestion queue is full, new messages are dropped")
+                self.dropped += 1
+            return False
+        with self._stats_lock:
+            self.pushed += 1
+            if self._queue.qsize() >= self.maxsize * self.BACKPRESSURE_RATIO:
+                self.backpressure += 1
+        return True
+
+    def flush(self) -> None:
+        """Block until all pushed messages are added to the model.
+        If consumer thread is not started, messages are added in the calling thread"""
+        if self._thread is not None:
+            return self._queue.join()
+        while True:
+            batch = self._get_batch(block=False)
+            if not batch:
+                return
+            self._process(batch)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {
+                "pending": self.pending(),
+                "pushed": self.pushed,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "backpressure": self.backpressure,
+                "batches": self.batches,
+            }
+
+    def _get_batch(self, block: bool) -> List[Optional[str]]:
+        batch: List[Optional[str]] = []
+        try:
+            if block:
+                batch.append(self._queue.get())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _process(self, batch: List[Optional[str]]) -> None:
+        texts = [text for text in batch if text is not None]
+        try:
+            if texts:
+                self.markov.add_strings(texts)
+        except Exception:
+            log.error("Failed to add messages to Markov model", exc_info=True)
+        finally:
+            with self._stats_lock:
+                self.processed += len(texts)
+                self.batches += 1
+            for _ in batch:
+                self._queue.task_done()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._get_batch(block=True)
+            self._process(batch)
+            if None in batch:
+                return
@@ -0,0 +1,339 @@
+import os
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.log import log
+from src.utils import Util
+
+
+class NgramMarkov:
+    """Markov chain of higher order: next word is chosen by the last state_size words (state).
+
+    Words are interned to integer ids and state (tuple of word ids) is packed into int64 key, ID_BITS bits per id.
+    States are interned to state ids through open addressing hash table that is stored in numpy arrays
+    (_slot_keys -> _slot_states). Row i of CSR-style arrays (_indptr, _next_ids, _counts) holds sorted
+    (next_id, count) pairs of state i. Transitions that are not present in CSR arrays yet are accumulated in _delta.
+    Message start is represented by state that is filled with BEGIN_ID.
+    Vocabulary is limited by MAX_WORDS ids. Ids of removed words are reused: states that contain them have
+    no transitions after removal, so they are revived by new words as empty states"""
+
+    STATE_SIZES = (2, 3)
+    BEGIN_ID = 0
+    END_ID = -1
+    ID_BITS = 21
+    MAX_WORDS = 1 << ID_BITS
+    EMPTY_KEY = -1
+    DELTA_COMPACTION_THRESHOLD = 1 << 16
+    _HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+    def __init__(self, state_size: int) -> None:
+        if state_size not in self.STATE_SIZES:
+            raise ValueError(f"Unsupported Markov chain state size: {state_size}")
+        self.state_size = state_size
+        self.generation = 0
+        self.words: List[Optional[str]] = [""]
+        self.word_ids: Dict[str, int] = dict()
+        # Ids of removed words that can be assigned to new words
+        self._free_ids: List[int] = []
+        self._vocabulary_full = False
+        self._states_count = 0
+        self._state_keys = np.zeros(16, dtype='<i8')
+        self._totals = np.zeros(16, dtype='<i8')
+        self._rehash(16)
+        self._indptr = np.zeros(1, dtype='<i8')
+        self._next_ids = np.zeros(0, dtype='<i4')
+        self._counts = np.zeros(0, dtype='<u4')
+        self._delta: Dict[int, Dict[int, int]] = dict()
+        self._delta_size = 0
+
+    def _pack(self, ids: Iterable[int]) -> int:
+        key = 0
+        for word_id in ids:
+            key = (key << self.ID_BITS) | word_id
+        return key
+
+    def _unpack(self, key: int) -> List[int]:
+        mask = (1 << self.ID_BITS) - 1
+        return [(key >> (self.ID_BITS * i)) & mask for i in reversed(range(self.state_size))]
+
+    def _home_slot(self, key: int) -> int:
+        return ((key * self._HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - self._slot_bits)
+
+    def _home_slots(self, keys: np.ndarray) -> np.ndarray:
+        """Vectorized _home_slot(). Multiplication of uint64 wraps around as in _home_slot()"""
+        with np.errstate(over='ignore'):
+            hashes = keys.astype(np.uint64) * np.uint64(self._HASH_MULTIPLIER)
+        return (hashes >> np.uint64(64 - self._slot_bits)).astype(np.int64)
+
+    def _probe(self, key: int) -> int:
+        """Get slot that holds key or empty slot where key should be inserted"""
+        mask = len(self._slot_keys) - 1
+        slot = self._home_slot(key)
+        while True:
+            slot_key = int(self._slot_keys[slot])
+            if slot_key == key or slot_key == self.EMPTY_KEY:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _rehash(self, capacity: int) -> None:
+        """Rebuild hash table with given capacity (power of 2). Keys are inserted by rounds of linear probing:
+        every free slot is taken by one of the keys that probe it, other keys move to the next slot"""
+        self._slot_bits = capacity.bit_length() - 1
+        self._slot_keys = np.full(capacity, self.EMPTY_KEY, dtype='<i8')
+        self._slot_states = np.zeros(capacity, dtype='<i4')
+        pending = np.arange(self._states_count)
+        keys = self._state_keys[:self._states_count]
+        slots = self._home_slots(keys)
+        while len(pending):
+            free = np.flatnonzero(self._slot_keys[slots] == self.EMPTY_KEY)
+            _, first = np.unique(slots[free], return_index=True)
+            placed = free[first]
+            self._slot_keys[slots[placed]] = keys[pending[placed]]
+            self._slot_states[slots[placed]] = pending[placed]
+            left = np.ones(len(pending), dtype=np.bool_)
+            left[placed] = False
+            pending = pending[left]
+            slots = (slots[left] + 1) & (capacity - 1)
+
+    def _find_state(self, key: int) -> int:
+        slot = self._probe(key)
+        return int(self._slot_states[slot]) if self._slot_keys[slot] == key else -1
+
+    def _intern_state(self, key: int) -> int:
+        slot = self._probe(key)
+        if self._slot_keys[slot] == key:
+            return int(self._slot_states[slot])
+        state_id = self._states_count
+        if state_id >= len(self._state_keys):
+            self._state_keys = np.concatenate((self._state_keys, np.zeros(len(self._state_keys), dtype='<i8')))
+            self._totals = np.concatenate((self._totals, np.zeros(len(self._totals), dtype='<i8')))
+        self._state_keys[state_id] = key
+        self._states_count += 1
+        self._slot_keys[slot] = key
+        self._slot_states[slot] = state_id
+        if 2 * self._states_count > len(self._slot_keys):
+            self._rehash(2 * len(self._slot_keys))
+        return state_id
+
+    def _intern(self, word: str) -> int:
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            if self._free_ids:
+                word_id = self._free_ids.pop()
+                self.words[word_id] = word
+            else:
+                word_id = len(self.words)
+                self.words.append(word)
+            self.word_ids[word] = word_id
+        return word_id
+
+    def _row(self, state_id: int) -> Tuple[int, int]:
+        if state_id + 1 < len(self._indptr):
+            return int(self._indptr[state_id]), int(self._indptr[state_id + 1])
+        return 0, 0
+
+    def _add_transition(self, state_id: int, next_id: int) -> None:
+        self._totals[state_id] += 1
+        lo, hi = self._row(state_id)
+        if lo != hi:
+            pos = lo + int(np.searchsorted(self._next_ids[lo:hi], next_id))
+            if pos < hi and self._next_ids[pos] == next_id:
+                self._counts[pos] += 1
+                return
+        delta = self._delta.setdefault(state_id, dict())
+        if next_id not in delta:
+            delta[next_id] = 0
+            self._delta_size += 1
+        delta[next_id] += 1
+
+    def _csr_sources(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self._indptr) - 1, dtype='<i4'), np.diff(self._indptr))
+
+    def _compacted_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Merge CSR arrays with pending transitions and drop zeroed transitions without modifying the chain"""
+        delta_items = [(state_id, next_id, count)
+                       for state_id, row in list(self._delta.items()) for next_id, count in list(row.items())]
+        sources = np.concatenate((self._csr_sources(), np.array([x[0] for x in delta_items], dtype='<i4')))
+        next_ids = np.concatenate((self._next_ids, np.array([x[1] for x in delta_items], dtype='<i4')))
+        counts = np.concatenate((self._counts, np.array([x[2] for x in delta_items], dtype='<u4')))
+        alive = counts > 0
+        sources, next_ids, counts = sources[alive], next_ids[alive], counts[alive]
+        order = np.lexsort((next_ids, sources))
+        indptr = np.zeros(self._states_count + 1, dtype='<i8')
+        np.cumsum(np.bincount(sources, minlength=self._states_count), out=indptr[1:])
+        return indptr, next_ids[order], counts[order]
+
+    def _compact(self) -> None:
+        self._indptr, self._next_ids, self._counts = self._compacted_arrays()
+        self._delta = dict()
+        self._delta_size = 0
+
+    def add_words(self, words: List[str]) -> None:
+        """Add message (list of words) to the chain"""
+        new_words = len(set(word for word in words if word not in self.word_ids.keys()))
+        if len(self.words) - len(self._free_ids) + new_words > self.MAX_WORDS:
+            if not self._vocabulary_full:
+                log.warning(
+                    f"Vocabulary of Markov chain of order {self.state_size} is full ({self.MAX_WORDS} words), "
+                    f"messages with new words are not added until words are removed")
+                self._vocabulary_full = True
+            return
+        ids = [self.BEGIN_ID] * self.state_size
+        for word in words:
+            next_id = self._intern(word)
+            self._add_transition(self._intern_state(self._pack(ids)), next_id)
+            ids = ids[1:] + [next_id]
+        if words:
+            self._add_transition(self._intern_state(self._pack(ids)), self.END_ID)
+        if self._delta_size > self.DELTA_COMPACTION_THRESHOLD:
+            self._compact()
+
+    def remove_words(self, words: Iterable[str]) -> None:
+        """Remove words, states that contain them and transitions to them"""
+        removed = [self.word_ids.pop(word) for word in words if word in self.word_ids.keys()]
+        if not removed:
+            return
+        for word_id in removed:
+            self.words[word_id] = None
+        self._free_ids.extend(removed)
+        self._vocabulary_full = False
+        self._compact()
+        removed_ids = np.array(removed, dtype='<i8')
+        keys = self._state_keys[:self._states_count]
+        dead = np.zeros(self._states_count, dtype=np.bool_)
+        for i in range(self.state_size):
+            dead |= np.isin((keys >> (self.ID_BITS * i)) & ((1 << self.ID_BITS) - 1), removed_ids)
+        sources = self._csr_sources()
+        self._counts[dead[sources] | np.isin(self._next_ids, removed_ids)] = 0
+        self._totals[:self._states_count] = np.bincount(
+            sources, weights=self._counts, minlength=self._states_count).astype('<i8')
+        # Dead states are kept in hash table with no transitions
+        self._compact()
+
+    def words_count(self) -> int:
+        return len(self.word_ids)
+
+    def states_count(self) -> int:
+        return int(np.count_nonzero(self._totals[:self._states_count]))
+
+    def pairs_count(self) -> int:
+        return int(self._totals[:self._states_count].sum())
+
+    def is_empty(self) -> bool:
+        return self.pairs_count() == 0
+
+    def _choose(self, ids: np.ndarray, counts: np.ndarray) -> int:
+        cumulative = np.cumsum(counts, dtype='<i8')
+        return int(ids[int(np.searchsorted(cumulative, random.randint(0, int(cumulative[-1]) - 1), side='right'))])
+
+    def _choose_next(self, state_id: int) -> int:
+        lo, hi = self._row(state_id)
+        delta = self._delta.get(state_id, dict())
+        next_ids = np.concatenate((self._next_ids[lo:hi], np.fromiter(delta.keys(), dtype='<i4', count=len(delta))))
+        counts = np.concatenate((self._counts[lo:hi], np.fromiter(delta.values(), dtype='<u4', count=len(delta))))
+        return self._choose(next_ids, counts)
+
+    def _choose_state_ending_with(self, word_id: int) -> int:
+        """Choose state that ends with word weighted by number of its transitions"""
+        keys = self._state_keys[:self._states_count]
+        candidates = np.flatnonzero((keys & ((1 << self.ID_BITS) - 1)) == word_id)
+        weights = self._totals[candidates]
+        if not weights.sum():
+            return -1
+        return self._choose(candidates, weights)
+
+    def generate(self, word: str = "") -> Optional[str]:
+        """Generate message. If word is set, message is started from random state that ends with this word.
+        Returns None if the message can not be generated"""
+        if word:
+            if word not in self.word_ids.keys():
+                return None
+            state_id = self._choose_state_ending_with(self.word_ids[word])
+            if state_id < 0:
+                return None
+            ids = self._unpack(int(self._state_keys[state_id]))
+            result = [word]
+        else:
+            ids = [self.BEGIN_ID] * self.state_size
+            state_id = self._find_state(self._pack(ids))
+            result = []
+        while state_id >= 0 and self._totals[state_id] > 0:
+            next_id = self._choose_next(state_id)
+            if next_id == self.END_ID:
+                break
+            result.append(self.words[next_id])
+            ids = ids[1:] + [next_id]
+            state_id = self._find_state(self._pack(ids))
+        return ' '.join(result) or None
+
+    def data(self) -> Dict[str, np.ndarray]:
+        """Capture copy of the chain state that is written to file"""
+        indptr, next_ids, counts = self._compacted_arrays()
+        encoded_words = [word.encode("utf-8") if word is not None else b"" for word in self.words]
+        word_offsets = np.zeros(len(encoded_words) + 1, dtype='<i8')
+        np.cumsum([len(word) for word in encoded_words], out=word_offsets[1:])
+        return {
+            "header": np.array([self.state_size, self.generation], dtype='<i8'),
+            "word_offsets": word_offsets,
+            "word_blob": np.frombuffer(b"".join(encoded_words), dtype='u1'),
+            "word_alive": np.array([word is not None for word in self.words], dtype='u1'),
+            "state_keys": self._state_keys[:self._states_count].copy(),
+            "totals": self._totals[:self._states_count].copy(),
+            "indptr": indptr,
+            "next_ids": next_ids,
+            "counts": counts,
+        }
+
+    @staticmethod
+    def write_data(filename: str, data: Dict[str, np.ndarray]) -> None:
+        with Util.atomic_write(filename) as f:
+            np.savez(f, **data)
+
+    def write(self, filename: str) -> None:
+        """Atomically write the chain to file"""
+        self.write_data(filename, self.data())
+
+    @classmethod
+    def read(cls, filename: str) -> 'NgramMarkov':
+        with np.load(filename) as data:
+            state_size, generation = data["header"].tolist()
+            chain = cls(state_size)
+            chain.generation = generation
+            word_blob = data["word_blob"].tobytes()
+            word_offsets = data["word_offsets"].tolist()
+            chain.words = [
+                word_blob[word_offsets[i]:word_offsets[i + 1]].decode("utf-8") if alive else None
+                for i, alive in enumerate(data["word_alive"].tolist())
+            ]
+            chain.word_ids = {word: word_id for word_id, word in enumerate(chain.words) if word}
+            chain._free_ids = [word_id for word_id, word in enumerate(chain.words) if word is None]
+            chain._states_count = len(data["state_keys"])
+            chain._state_keys = np.concatenate((data["state_keys"], np.zeros(16, dtype='<i8')))
+            chain._totals = np.concatenate((data["totals"], np.zeros(16, dtype='<i8')))
+            chain._indptr = data["indptr"]
+            chain._next_ids = data["next_ids"]
+            chain._counts = data["counts"]
+        capacity = 16
+        while capacity < 2 * chain._states_count:
+            capacity *= 2
+        chain._rehash(capacity)
+        return chain
+
+    @classmethod
+    def load(cls, filename: str, state_size: int, generation: int = 0) -> 'NgramMarkov':
+        """Read the chain from file. Empty chain is created if file does not exist or it does not match
+        Markov model (state size or generation are different)"""
+        if os.path.isfile(filename):
+            try:
+                chain = cls.read(filename)
+            except Exception:
+                log.error(f"File '{filename}' can not be read!", exc_info=True)
+            else:
+                if chain.state_size == state_size and chain.generation == generation:
+                    return chain
+                log.warning(f"Markov chain in '{filename}' does not match Markov model and is discarded")
+        chain = cls(state_size)
+        chain.generation = generation
+        return chain
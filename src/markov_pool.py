@@ -0,0 +1,151 @@
+import collections
+import threading
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src import const
+from src.log import log
+
+_PoolKey = Tuple[str, Optional[int]]
+
+
+class MarkovResponsePool:
+    """Pool of pre-generated Markov chains that are used to answer without waiting for generation.
+
+    Background producer thread keeps up to size chains for the begin node and for words_count most frequently
+    requested start words. Requests pop chains from the pool and wake up the producer to refill it.
+    All pooled chains are discarded when the model reports that words were removed (removal_epoch is changed),
+    so the pool never returns words that are not present in the model"""
+
+    REQUESTS_LIMIT_RATIO = 64
+
+    def __init__(
+            self, markov: Any, size: int = const.MARKOV_POOL_SIZE,
+            words_count: int = const.MARKOV_POOL_WORDS) -> None:
+        self.markov = markov
+        self.size = size
+        self.words_count = words_count
+        self._pools: Dict[_PoolKey, Deque[str]] = dict()
+        self._requests: collections.Counter = collections.Counter()
+        self._epoch = self._model_epoch()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def generate(markov: Any, word: str = "", order: Optional[int] = None, count: bool = True) -> str:
+        """Generate chain. If start word is set, generation is retried until the chain is longer than the word.
+        If count is True, returned chain (but not retried attempts) is added to chains_generated of the model"""
+        if not word:
+            result = markov.generate(order=order, count=False)
+        else:
+            result = ""
+            for _ in range(const.MAX_MARKOV_ATTEMPTS):
+                result = markov.generate(word=word, order=order, count=False)
+                if len(result.split()) > 1:
+                    break
+        if count and not MarkovResponsePool._is_error(result):
+            markov.count_chain()
+        return result
+
+    @staticmethod
+    def _is_error(result: str) -> bool:
+        """Check if result is generation error message (e.g. empty model)"""
+        return result.startswith("<") and result.endswith(">")
+
+    def _model_epoch(self) -> int:
+        return getattr(self.markov, "removal_epoch", 0)
+
+    def _check_epoch(self) -> None:
+        epoch = self._model_epoch()
+        if epoch != self._epoch:
+            self._pools = dict()
+            self._epoch = epoch
+
+    def get(self, word: str = "", order: Optional[int] = None) -> str:
+        """Pop pre-generated chain from the pool or generate it if the pool is empty"""
+        key = (word, order)
+        with self._lock:
+            self._check_epoch()
+            self._requests[key] += 1
+            if len(self._requests) > self.REQUESTS_LIMIT_RATIO * self.words_count:
+                # Forget rarely requested start words
+                self._requests = collections.Counter(dict(self._requests.most_common(self.words_count)))
+            pool = self._pools.get(key)
+            result = pool.popleft() if pool else None
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self._wakeup.set()
+        if result is None:
+            return self.generate(self.markov, word, order)
+        # Pooled chains are counted when they are handed out, not when the producer generates them
+        self.markov.count_chain()
+        return result
+
+    def _tracked_keys(self) -> List[_PoolKey]:
+        keys: List[_PoolKey] = [("", None)]
+        for key, _ in self._requests.most_common():
+            if len(keys) > self.words_count:
+                break
+            if key != ("", None):
+                keys.append(key)
+        return keys
+
+    def refill(self) -> int:
+        """Generate chains for pools that are not full. Returns number of added chains"""
+        with self._lock:
+            self._check_epoch()
+            keys = self._tracked_keys()
+            self._pools = {key: self._pools.get(key, collections.deque()) for key in keys}
+            epoch = self._epoch
+        added = 0
+        for key in keys:
+            while not self._stopped and len(self._pools.get(key, ())) < self.size:
+                result = self.generate(self.markov, *key, count=False)
+                if self._is_error(result):
+                    break  # Generation error messages (e.g. empty model) are not pooled
+                with self._lock:
+                    if epoch != self._model_epoch() or epoch != self._epoch:
+                        return added
+                    self._pools[key].append(result)
+                added += 1
+        return added
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "pooled": sum(len(pool) for pool in self._pools.values()),
+                "start_words": len([key for key in self._pools.keys() if key != ("", None)]),
+            }
+
+    def start(self) -> None:
+        """Start producer thread"""
+        if self._thread is not None:
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="MarkovPool", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped:
+            # Timeout is used to notice model modifications when there are no requests
+            self._wakeup.wait(const.MARKOV_POOL_REFILL_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.refill()
+            except Exception:
+                log.error("Failed to refill Markov response pool", exc_info=True)
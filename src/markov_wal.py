@@ -0,0 +1,135 @@
+import enum
+import os
+import struct
+import zlib
+from typing import BinaryIO, Iterator, List, Tuple
+
+from src.log import log
+
+
+class MarkovWriteAheadLog:
+    """Append-only log of Markov model mutations that are not folded into model snapshot yet.
+
+    Log is split into files `<prefix>.<generation>`. Snapshot with generation G contains all records
+    from log files with generation < G, so log files with generation >= G are replayed on top of it.
+
+    File layout (little-endian): header (magic, format version, generation), then records.
+    Every record is (operation, payload size, payload CRC32) followed by UTF-8 payload.
+    Incomplete or corrupted records at the end of file (e.g. after crash) are dropped"""
+
+    MAGIC = b"WBMKWAL\0"
+    FORMAT_VERSION = 1
+    _HEADER = struct.Struct("<8sIQ")
+    _RECORD_HEADER = struct.Struct("<BII")
+
+    class Op(enum.IntEnum):
+        ADD_WORDS = 1
+        DEL_WORDS = 2
+        COLLECT_GARBAGE = 3
+        DROP = 4
+        CHAINS_GENERATED = 5
+        REMOVE_WORDS = 6
+
+    def __init__(self, prefix: str, generation: int) -> None:
+        self.prefix = prefix
+        self.generation = generation
+        self._file = self._open(generation)
+
+    @staticmethod
+    def get_path(prefix: str, generation: int) -> str:
+        return f"{prefix}.{generation}"
+
+    @staticmethod
+    def list_generations(prefix: str) -> List[int]:
+        """Get sorted list of generations of log files that exist for prefix"""
+        directory = os.path.dirname(os.path.abspath(prefix))
+        name = os.path.basename(prefix) + "."
+        return sorted(
+            int(file[len(name):]) for file in os.listdir(directory)
+            if file.startswith(name) and file[len(name):].isdigit())
+
+    @staticmethod
+    def next_generation(prefix: str) -> int:
+        """Get generation that is newer than generations of all existing log files"""
+        generations = MarkovWriteAheadLog.list_generations(prefix)
+        return generations[-1] + 1 if generations else 0
+
+    @staticmethod
+    def remove_older(prefix: str, generation: int) -> None:
+        """Remove log files with generation < generation"""
+        for old_generation in MarkovWriteAheadLog.list_generations(prefix):
+            if old_generation < generation:
+                os.remove(MarkovWriteAheadLog.get_path(prefix, old_generation))
+
+    @classmethod
+    def _scan(cls, f: BinaryIO) -> Iterator[Tuple['MarkovWriteAheadLog.Op', str, int]]:
+        """Iterate over valid records: (operation, payload, end offset of record)"""
+        header = f.read(cls._HEADER.size)
+        if len(header) < cls._HEADER.size:
+            return
+        magic, format_version, _ = cls._HEADER.unpack(header)
+        if magic != cls.MAGIC or format_version != cls.FORMAT_VERSION:
+            raise ValueError(f"'{f.name}' is not a Markov write-ahead log")
+        while True:
+            record_header = f.read(cls._RECORD_HEADER.size)
+            if len(record_header) < cls._RECORD_HEADER.size:
+                return
+            op, size, crc = cls._RECORD_HEADER.unpack(record_header)
+            payload = f.read(size)
+            if len(payload) < size or zlib.crc32(payload) != crc or op not in cls.Op.__members__.values():
+                log.warning(f"Dropping corrupted tail of Markov write-ahead log '{f.name}' at offset {f.tell()}")
+                return
+            yield cls.Op(op), payload.decode("utf-8"), f.tell()
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[Tuple['MarkovWriteAheadLog.Op', str]]:
+        """Iterate over valid records of log file"""
+        with open(path, 'rb') as f:
+            for op, payload, _ in cls._scan(f):
+                yield op, payload
+
+    def _open(self, generation: int) -> BinaryIO:
+        path = self.get_path(self.prefix, generation)
+        if os.path.isfile(path):
+            f = open(path, 'r+b')
+            valid_size = self._HEADER.size
+            for _, _, valid_size in self._scan(f):
+                pass
+            f.truncate(valid_size)
+            f.seek(valid_size)
+            if valid_size == self._HEADER.size:
+                f.seek(0)
+                f.write(self._HEADER.pack(self.MAGIC, self.FORMAT_VERSION, generation))
+            return f
+        f = open(path, 'wb')
+        f.write(self._HEADER.pack(self.MAGIC, self.FORMAT_VERSION, generation))
+        f.flush()
+        os.fsync(f.fileno())
+        return f
+
+    def append(self, op: 'MarkovWriteAheadLog.Op', payload: str = "") -> None:
+        """Append record to the log. Record is durable only after sync()"""
+        data = payload.encode("utf-8")
+        self._file.write(self._RECORD_HEADER.pack(op, len(data), zlib.crc32(data)) + data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def sync(self) -> None:
+        """Flush appended records to disk"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def size(self) -> int:
+        return self._file.tell()
+
+    def rotate(self) -> None:
+        """Finish current log file and start appending to log file of the next generation"""
+        self.sync()
+        self._file.close()
+        self.generation += 1
+        self._file = self._open(self.generation)
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
@@ -1,19 +1,65 @@
-from collections import defaultdict
+import sys
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, List
+from typing import TYPE_CHECKING, Any, List, Optional
+
+if TYPE_CHECKING:
+    from src.message_history import MessageHistoryStore
 
 
 @dataclass
 class CachedMsg:
+    __slots__ = ("message", "author")
+
     message: str
     author: str
 
 
+class _ChannelBuffer:
+    """Ring buffer of channel messages. Messages are stored in the order of arrival, the oldest message is
+    overwritten when buffer is full"""
+
+    __slots__ = ("items", "start", "nbytes")
+
+    def __init__(self) -> None:
+        # List grows up to capacity, so channels with few messages do not take memory for the whole buffer
+        self.items: List[CachedMsg] = []
+        # Position of the oldest message
+        self.start = 0
+        # Estimated memory size of stored messages
+        self.nbytes = 0
+
+
 class MessageCache:
     BUFFER_CAPACITY = 1001
+    # Estimated memory size of messages of all channels. Channels that did not receive messages for the longest time
+    # are evicted above it
+    MEMORY_BUDGET = 64 * 1024 * 1024
 
-    def __init__(self) -> None:
-        self._data: Dict[str, List[CachedMsg]] = defaultdict(list)
+    def __init__(self, memory_budget: int = MEMORY_BUDGET) -> None:
+        self._data: "OrderedDict[Any, _ChannelBuffer]" = OrderedDict()
+        self.memory_budget = memory_budget
+        self.nbytes = 0
+        self.history: Optional["MessageHistoryStore"] = None
+        # Cache is shared by backends that run in their own threads
+        self._lock = threading.Lock()
+
+    def attach_history(self, history: "MessageHistoryStore") -> None:
+        """Restore messages from on-disk history and write all new messages to it"""
+        for channel_id, messages in history.load().items():
+            self.reset(channel_id, messages)
+        self.history = history
+
+    @staticmethod
+    def _message_size(message: CachedMsg) -> int:
+        return sys.getsizeof(message) + sys.getsizeof(message.message) + sys.getsizeof(message.author)
+
+    def _evict(self) -> None:
+        # Caller holds _lock. The most recently used channel is the last one and it is never evicted
+        while self.nbytes > self.memory_budget and len(self._data) > 1:
+            _, buffer = self._data.popitem(last=False)
+            self.nbytes -= buffer.nbytes
 
     def push(self, channel_id: str, message: CachedMsg):
         """Insert a new message to the beginning of the channel buffer.
@@ -25,8 +71,25 @@ class MessageCache:
         message:
             ``CachedMsg`` instance representing the message to store.
         """
-        self._data[channel_id].insert(0, message)
-        self._data[channel_id] = self._data[channel_id][:self.BUFFER_CAPACITY]
+        with self._lock:
+            buffer = self._data.get(channel_id)
+            if buffer is None:
+                buffer = self._data[channel_id] = _ChannelBuffer()
+            else:
+                self._data.move_to_end(channel_id)
+            size = self._message_size(message)
+            if len(buffer.items) < self.BUFFER_CAPACITY:
+                buffer.items.append(message)
+            else:
+                size -= self._message_size(buffer.items[buffer.start])
+                buffer.items[buffer.start] = message
+                buffer.start = (buffer.start + 1) % self.BUFFER_CAPACITY
+            buffer.nbytes += size
+            self.nbytes += size
+            self._evict()
+            # History is written under the lock, so it keeps the order of messages in the cache
+            if self.history is not None:
+                self.history.append(channel_id, message)
 
     def get(self, channel_id: str, index: int):
         """Return cached message by index or ``None`` if unavailable.
@@ -39,11 +102,14 @@ class MessageCache:
             Position of the message in the channel buffer. ``0`` is the most
             recent message.
         """
-        if channel_id not in self._data.keys():
-            return
-        if not 0 <= index < len(self._data[channel_id]):
-            return
-        return self._data[channel_id][index]
+        with self._lock:
+            buffer = self._data.get(channel_id)
+            if buffer is None:
+                return
+            items = buffer.items
+            if not 0 <= index < len(items):
+                return
+            return items[(buffer.start + len(items) - 1 - index) % len(items)]
 
     def reset(self, channel_id: str, new_data: List[CachedMsg]):
         """Replace stored messages for a channel.
@@ -54,5 +120,16 @@ class MessageCache:
             Identifier of the channel.
         new_data:
             List of ``CachedMsg`` objects that becomes the new buffer value.
+            ``0`` is the most recent message.
         """
-        self._data[channel_id] = new_data
+        with self._lock:
+            old_buffer: Optional[_ChannelBuffer] = self._data.pop(channel_id, None)
+            if old_buffer is not None:
+                self.nbytes -= old_buffer.nbytes
+            buffer = self._data[channel_id] = _ChannelBuffer()
+            buffer.items = new_data[self.BUFFER_CAPACITY - 1::-1]
+            buffer.nbytes = sum(self._message_size(message) for message in buffer.items)
+            self.nbytes += buffer.nbytes
+            self._evict()
+            if self.history is not None:
+                self.history.replace(channel_id, buffer.items[::-1])
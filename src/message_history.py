@@ -0,0 +1,257 @@
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from src.log import log
+from src.message_cache import CachedMsg
+
+
+class _Segment:
+    __slots__ = ("generation", "messages_count")
+
+    def __init__(self, generation: int, messages_count: int) -> None:
+        self.generation = generation
+        self.messages_count = messages_count
+
+
+class MessageHistoryStore:
+    """Append-only on-disk log of messages that are pushed to message cache, so the cache is restored after restart.
+
+    Every channel has its own directory with segment files `<generation>.log`. When active segment grows above
+    SEGMENT_SIZE, next segment is started and the oldest segments are removed if newer segments contain enough
+    messages to restore the whole channel buffer.
+
+    Segment layout (little-endian): magic and format version, then records.
+    Every record is (payload size, payload CRC32) followed by UTF-8 JSON payload [message, author].
+    Incomplete or corrupted records at the end of segment (e.g. after crash) are dropped.
+
+    Message handlers only put messages to the queue, disk I/O is done by single writer thread. If writer thread
+    is not started, queued messages are written by flush() in the calling thread"""
+
+    MAGIC = b"WBMSGLOG"
+    FORMAT_VERSION = 1
+    SEGMENT_SIZE = 256 * 1024
+    # Number of segment files that are kept open for appending
+    MAX_OPEN_FILES = 64
+    _HEADER = struct.Struct("<8sI")
+    _RECORD_HEADER = struct.Struct("<II")
+
+    def __init__(self, directory: str, messages_per_channel: int) -> None:
+        self.directory = directory
+        self.messages_per_channel = messages_per_channel
+        # Backends push messages from their own threads
+        self._lock = threading.Lock()
+        self._segments: Dict[Any, List[_Segment]] = dict()
+        self._files: "OrderedDict[Any, BinaryIO]" = OrderedDict()
+        self._queue: "queue.Queue[Optional[Tuple[str, Any, Any]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _parse_channel_id(name: str) -> Any:
+        return int(name) if name.lstrip("-").isdigit() else name
+
+    def _channel_directory(self, channel_id: Any) -> str:
+        return os.path.join(self.directory, str(channel_id))
+
+    def _segment_path(self, channel_id: Any, generation: int) -> str:
+        return os.path.join(self._channel_directory(channel_id), f"{generation}.log")
+
+    def _list_generations(self, channel_id: Any) -> List[int]:
+        directory = self._channel_directory(channel_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            int(file[:-len(".log")]) for file in os.listdir(directory)
+            if file.endswith(".log") and file[:-len(".log")].isdigit())
+
+    @classmethod
+    def _scan(cls, f: BinaryIO) -> Iterator[CachedMsg]:
+        header = f.read(cls._HEADER.size)
+        if len(header) < cls._HEADER.size:
+            return
+        magic, format_version = cls._HEADER.unpack(header)
+        if magic != cls.MAGIC or format_version != cls.FORMAT_VERSION:
+            raise ValueError(f"'{f.name}' is not a message history segment")
+        while True:
+            record_header = f.read(cls._RECORD_HEADER.size)
+            if len(record_header) < cls._RECORD_HEADER.size:
+                return
+            size, crc = cls._RECORD_HEADER.unpack(record_header)
+            payload = f.read(size)
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                f.seek(-len(record_header) - len(payload), os.SEEK_CUR)
+                log.warning(f"Dropping corrupted tail of message history segment '{f.name}' at offset {f.tell()}")
+                return
+            message, author = json.loads(payload)
+            yield CachedMsg(message, author)
+
+    def _read_segment(self, channel_id: Any, generation: int) -> List[CachedMsg]:
+        with open(self._segment_path(channel_id, generation), 'rb') as f:
+            return list(self._scan(f))
+
+    def load(self) -> Dict[Any, List[CachedMsg]]:
+        """Read the last messages of every channel. The most recent message is the first one"""
+        result = dict()
+        for name in os.listdir(self.directory):
+            channel_id = self._parse_channel_id(name)
+            messages: List[CachedMsg] = []
+            segments: List[_Segment] = []
+            for generation in reversed(self._list_generations(channel_id)):
+                try:
+                    segment_messages = self._read_segment(channel_id, generation)
+                except (OSError, ValueError) as e:
+                    log.warning(f"Failed to read message history of channel {channel_id}: {e}")
+                    break
+                segments.insert(0, _Segment(generation, len(segment_messages)))
+                if len(messages) < self.messages_per_channel:
+                    messages.extend(reversed(segment_messages))
+            with self._lock:
+                self._segments[channel_id] = segments
+            if messages:
+                result[channel_id] = messages[:self.messages_per_channel]
+        log.debug(f"Loaded message history of {len(result)} channels from {self.directory}")
+        return result
+
+    def _open(self, channel_id: Any) -> BinaryIO:
+        f = self._files.get(channel_id)
+        if f is not None:
+            self._files.move_to_end(channel_id)
+            return f
+        segments = self._segments.setdefault(channel_id, [])
+        if not segments:
+            generations = self._list_generations(channel_id)
+            for generation in generations:
+                segments.append(_Segment(generation, len(self._read_segment(channel_id, generation))))
+        if not segments:
+            os.makedirs(self._channel_directory(channel_id), exist_ok=True)
+            segments.append(_Segment(0, 0))
+        path = self._segment_path(channel_id, segments[-1].generation)
+        if os.path.isfile(path):
+            f = open(path, 'r+b')
+            valid_size = self._HEADER.size
+            try:
+                for _ in self._scan(f):
+                    valid_size = f.tell()
+            except ValueError as e:
+                log.warning(f"Message history segment is rewritten: {e}")
+                valid_size = 0
+            f.truncate(valid_size)
+            f.seek(valid_size)
+        else:
+            f = open(path, 'wb')
+        if f.tell() < self._HEADER.size:
+            f.seek(0)
+            f.write(self._HEADER.pack(self.MAGIC, self.FORMAT_VERSION))
+        self._files[channel_id] = f
+        if len(self._files) > self.MAX_OPEN_FILES:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+        return f
+
+    def _rotate(self, channel_id: Any) -> None:
+        self._files.pop(channel_id).close()
+        segments = self._segments[channel_id]
+        # Remove the oldest segments that are not needed to restore channel buffer
+        while sum(segment.messages_count for segment in segments[1:]) >= self.messages_per_channel:
+            os.remove(self._segment_path(channel_id, segments.pop(0).generation))
+        segments.append(_Segment(segments[-1].generation + 1, 0))
+
+    @classmethod
+    def _record(cls, message: CachedMsg) -> bytes:
+        data = json.dumps([message.message, message.author], ensure_ascii=False).encode("utf-8")
+        return cls._RECORD_HEADER.pack(len(data), zlib.crc32(data)) + data
+
+    def start(self) -> None:
+        """Start writer thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="MessageHistory", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write all queued messages and stop writer thread"""
+        if self._thread is None:
+            return self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def append(self, channel_id: Any, message: CachedMsg) -> None:
+        """Queue message to be appended to the log of the channel"""
+        self._queue.put_nowait(("append", channel_id, message))
+
+    def replace(self, channel_id: Any, messages: List[CachedMsg]) -> None:
+        """Queue replacement of log of the channel with messages. The most recent message is the first one"""
+        self._queue.put_nowait(("replace", channel_id, messages))
+
+    def flush(self) -> None:
+        """Block until all queued messages are written.
+        If writer thread is not started, messages are written in the calling thread"""
+        if self._thread is not None:
+            return self._queue.join()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._process(item)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _process(self, item: Optional[Tuple[str, Any, Any]]) -> None:
+        try:
+            if item is None:
+                return
+            operation, channel_id, data = item
+            if operation == "append":
+                self._append(channel_id, data)
+            else:
+                self._replace(channel_id, data)
+        except Exception:
+            log.error("Failed to write message history", exc_info=True)
+        finally:
+            self._queue.task_done()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            self._process(item)
+            if item is None:
+                return
+
+    def _append(self, channel_id: Any, message: CachedMsg) -> None:
+        with self._lock:
+            f = self._open(channel_id)
+            f.write(self._record(message))
+            f.flush()
+            self._segments[channel_id][-1].messages_count += 1
+            if f.tell() >= self.SEGMENT_SIZE:
+                self._rotate(channel_id)
+
+    def _replace(self, channel_id: Any, messages: List[CachedMsg]) -> None:
+        with self._lock:
+            self._open(channel_id)
+            self._rotate(channel_id)
+            f = self._open(channel_id)
+            f.write(b"".join(self._record(message) for message in reversed(messages)))
+            f.flush()
+            segments = self._segments[channel_id]
+            segments[-1].messages_count = len(messages)
+            for segment in segments[:-1]:
+                os.remove(self._segment_path(channel_id, segment.generation))
+            del segments[:-1]
+
+    def close(self) -> None:
+        """Write all queued messages and close segment files"""
+        self.stop()
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
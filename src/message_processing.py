@@ -13,7 +13,7 @@ class MessageProcessing:
             if responses_count >= const.MAX_BOT_RESPONSES_ON_ONE_MESSAGE:
                 break
             if re.search(response.regex, message):
-                result = await Command.process_subcommands(execution_ctx, bc.executor, response.text)
+                result = await Command.process_subcommands(execution_ctx, response.text)
                 await execution_ctx.reply(result)
                 responses_count += 1
 
@@ -10,8 +10,11 @@ from src import const
 from src.api.command import Command, Implementation
 from src.backend.discord.config import DiscordConfig
 from src.backend.telegram.config import TelegramConfig
+from src.config import Config
 from src.ff import FF
 from src.log import log
+from src.markov import CompactMarkov, Markov
+from src.markov_wal import MarkovWriteAheadLog
 from src.utils import Util
 
 
@@ -29,15 +32,34 @@ class Updater:
     def update(self):
         """Perform update"""
         yaml_path = self.config_name + '.yaml'
+        if self.config_name == "markov" and os.path.isfile(const.MARKOV_SNAPSHOT_PATH):
+            log.info(f"Markov model is stored in {const.MARKOV_SNAPSHOT_PATH}, {yaml_path} is not patched")
+            log.info(f"Сhecking {const.MARKOV_SNAPSHOT_PATH} version...")
+            config = CompactMarkov.read_snapshot(const.MARKOV_SNAPSHOT_PATH)
+            self.markov_yaml(config)
+            if self.modified:
+                # Snapshot keeps its generation, so write-ahead log is still replayed on top of it
+                config.write_snapshot(const.MARKOV_SNAPSHOT_PATH)
+            return
         if os.path.isfile(yaml_path):
             # .yaml file path
             log.info(f"Сhecking {self.config_name} version...")
-            config = Util.read_config_file(yaml_path)
+            if self.config_name == "config":
+                config = Config.load(yaml_path)
+            else:
+                config = Util.read_config_file(yaml_path)
             getattr(self, self.config_name + "_yaml")(config)
         else:
             log.error(f"File '{self.config_name}.yaml' does not exist")
             sys.exit(const.ExitStatus.CONFIG_FILE_ERROR)
         if self.modified:
+            if self.config_name == "config":
+                # Domains that are loaded by patches (or are stored in config.yaml of old version) are written
+                # to their own files before config.yaml, so config.yaml never refers to files that are not written
+                for domain in config.loaded_domains():
+                    domain_path = Config.domain_path(yaml_path, domain)
+                    os.makedirs(os.path.dirname(domain_path), exist_ok=True)
+                    self._save_yaml_file(domain_path, getattr(config, domain))
             self._save_yaml_file(yaml_path, config)
 
     def result(self):
@@ -339,6 +361,26 @@ class Updater:
             del config.commands.__dict__["module_help"]
             self._bump_version(config, "0.0.60")
         if config.version == "0.0.60":
+            config.saving["backup"]["retention"] = {
+                "hourly": 24,
+                "daily": 7,
+                "weekly": 4,
+            }
+            self._bump_version(config, "0.0.61")
+        if config.version == "0.0.61":
+            # Domains are moved from config.yaml to config.d/<domain>.yaml when patched config is saved
+            self._bump_version(config, "0.0.62")
+        if config.version == "0.0.62":
+            # Command that is run by !silent has its own time limit
+            if "silent" in config.commands.data.keys():
+                config.commands.data["silent"].max_execution_time = -1
+            self._bump_version(config, "0.0.63")
+        if config.version == "0.0.63":
+            # Data is moved back from database to config files on start if database is disabled
+            config.__dict__["database_path"] = (
+                const.SQLITE_DATABASE_PATH if os.path.isfile(const.SQLITE_DATABASE_PATH) else None)
+            self._bump_version(config, "0.0.64")
+        if config.version == "0.0.64":
             log.info(f"Version of {self.config_name} is up to date!")
         else:
             log.error(f"Unknown version {config.version} for {self.config_name}!")
@@ -367,6 +409,9 @@ class Updater:
             config.__dict__["ignored_prefixes"] = dict()
             self._bump_version(config, "0.0.7")
         if config.version == "0.0.7":
+            config.__dict__["state_size"] = 1
+            self._bump_version(config, "0.0.8")
+        if config.version == "0.0.8":
             if FF.is_enabled("WALBOT_FEATURE_MARKOV_MONGO") == "1":
                 from src.db.walbot_db import WalbotDatabase
                 db = WalbotDatabase()
@@ -418,6 +463,29 @@ class Updater:
         else:
             log.error(f"Unknown version {config.version} for {self.config_name}!")
 
+    def markov_bin(self):
+        """Convert markov.yaml to binary snapshot"""
+        if os.path.isfile(const.MARKOV_SNAPSHOT_PATH):
+            log.info(f"Markov model snapshot {const.MARKOV_SNAPSHOT_PATH} already exists")
+            return
+        config = Util.read_config_file(const.MARKOV_PATH)
+        if config is None:
+            log.error(f"File '{const.MARKOV_PATH}' does not exist or can not be read")
+            sys.exit(const.ExitStatus.CONFIG_FILE_ERROR)
+        self.markov_yaml(config)
+        if config.version != const.MARKOV_CONFIG_VERSION:
+            log.error(f"Failed to convert {const.MARKOV_PATH}: unsupported version {config.version}")
+            sys.exit(const.ExitStatus.CONFIG_FILE_ERROR)
+        if isinstance(config, Markov):
+            config.attach_ngram(const.MARKOV_NGRAM_PATH)
+            config = CompactMarkov.from_markov(config)
+        config.generation = MarkovWriteAheadLog.next_generation(const.MARKOV_WAL_PATH)
+        config.write_snapshot(const.MARKOV_SNAPSHOT_PATH)
+        self.modified = True
+        log.info(
+            f"Markov model has been converted to {const.MARKOV_SNAPSHOT_PATH}. "
+            f"{const.MARKOV_PATH} is not used anymore and can be removed")
+
     def secret_yaml(self, config):
         """Update secret.yaml"""
         if config.version == "0.0.1":
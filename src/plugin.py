@@ -136,6 +136,7 @@ class PluginManager:
                 bc.config.plugins[plugin_name] = {
                     "autostart": False,
                 }
+                bc.config.mark_dirty()
         for plugin_name, plugin_state in bc.config.plugins.items():
             if plugin_state["autostart"]:
                 try:
@@ -1,4 +1,4 @@
-import importlib
+import importlib.util
 import os
 from typing import List, Optional
 
@@ -9,6 +9,7 @@ from src.cmdarg_parser import CmdArgParser
 from src.config import bc
 from src.log import log
 from src.plugin import BasePlugin
+from src.utils import Util
 
 PLUGIN_DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -21,12 +22,12 @@ class ChatGPTPlugin(BasePlugin):
 
     async def init(self) -> None:
         await super().init()
-        try:
-            self._openai = importlib.import_module("openai")
-        except ImportError:
+        if importlib.util.find_spec("openai") is None:
             log.error("Failed to import 'openai' module. Disabling ChatGPT plugin")
             self._enabled = False
             return
+        # openai takes about a second to import, so it is imported on the first request
+        self._openai = Util.lazy_import("openai")
 
         await bc.plugin_manager.register_bot_command(
             self.get_classname(), "chatgpt", const.Permission.USER,
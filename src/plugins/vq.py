@@ -6,9 +6,7 @@ from collections import deque
 from dataclasses import dataclass
 from typing import Any, Dict, List
 
-import browser_cookie3  # type:ignore
 import discord
-import yt_dlp  # type:ignore
 
 from src import const
 from src.api.command import BaseCmd, Command, SupportedPlatforms
@@ -21,6 +19,9 @@ from src.log import log
 from src.mail import Mail
 from src.utils import Util
 
+browser_cookie3 = Util.lazy_import("browser_cookie3")
+yt_dlp = Util.lazy_import("yt_dlp")
+
 
 class VoiceCtx:
     def __init__(self):
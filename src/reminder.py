@@ -9,6 +9,7 @@ from src.backend.discord.message import Msg
 from src.backend.telegram.util import send_message
 from src.bc import DoNotUpdateFlag
 from src.config import bc
+from src.db.repository import find
 from src.emoji import get_clock_emoji
 from src.log import log
 from src.mail import Mail
@@ -24,9 +25,10 @@ class ReminderProcessing:
         to_remove = []
         to_append = []
         reminder_do_not_update_flag = False
-        for key, rem in bc.config.reminders.items():
-            if rem.backend != str(backend):
-                continue
+        # Prereminders are less than 1 day before reminder, so later reminders are not checked
+        horizon = (Time().now().replace(second=0) + datetime.timedelta(days=1)).strftime(
+            const.REMINDER_DATETIME_FORMAT)
+        for key, rem in find(bc.config.reminders, backend=str(backend), time__le=horizon).items():
             for i in range(len(rem.prereminders_list)):
                 prereminder = rem.prereminders_list[i]
                 used_prereminder = rem.used_prereminders_list[i]
@@ -53,6 +55,7 @@ class ReminderProcessing:
                     else:
                         log.error(f"ReminderProcessing: backend '{backend}' is not supported")
                     rem.used_prereminders_list[i] = True
+                    bc.config.mark_dirty("reminders")
             if rem == now:
                 if backend == const.BotBackend.DISCORD:
                     channel = bc.discord.get_channel(rem.channel_id)
@@ -122,8 +125,10 @@ class ReminderProcessing:
             log.error(f"ReminderProcessing: backend '{backend}' is not supported")
         for key in to_remove:
             bc.config.reminders.pop(key)
+            bc.config.mark_dirty("reminders")
         for item in to_append:
             key = bc.config.ids["reminder"]
             bc.config.reminders[key] = item
             bc.config.ids["reminder"] += 1
+            bc.config.mark_dirty("reminders")
         log.debug3(f"{backend}: Reminder processing iteration has finished")
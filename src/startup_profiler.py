@@ -0,0 +1,116 @@
+"""Profiler of bot startup: `python walbot.py start --profile-startup`"""
+
+import builtins
+import contextlib
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class StartupProfiler:
+    """Collect durations of startup phases and of module imports"""
+
+    # Number of the slowest imports in the report
+    IMPORTS_REPORT_SIZE = 25
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._start_time = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.events: List[Tuple[str, float]] = []
+        # Module -> (time including nested imports, time of module itself)
+        self.imports: Dict[str, Tuple[float, float]] = dict()
+        self._import_stack: List[float] = []
+        self._original_import: Optional[Any] = None
+        self._original_import_module: Optional[Any] = None
+
+    def enable(self) -> None:
+        """Start profiling. Imports are measured only after this call, so it should be called as early as possible"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self._start_time = time.perf_counter()
+        self._original_import = builtins.__import__
+        self._original_import_module = importlib.import_module
+        builtins.__import__ = self._import
+        # Command modules and plugins are imported by name
+        importlib.import_module = self._import_module
+
+    def stop_measuring_imports(self) -> None:
+        """Restore import functions. Phases and events are still recorded, imports of running bot are not"""
+        if self._original_import is None:
+            return
+        builtins.__import__ = self._original_import
+        importlib.import_module = self._original_import_module
+        self._original_import = None
+        self._original_import_module = None
+
+    def _import(self, name: str, globals: Optional[Dict[str, Any]] = None, locals: Optional[Dict[str, Any]] = None,
+                fromlist: Tuple[str, ...] = (), level: int = 0) -> Any:
+        module_name = name
+        if level > 0 and globals is not None:
+            # Relative imports are reported by full module name
+            try:
+                module_name = importlib.util.resolve_name("." * level + name, globals.get("__package__"))
+            except (ImportError, ValueError):
+                pass
+        return self._measure(self._original_import, module_name, name, globals, locals, fromlist, level)
+
+    def _import_module(self, name: str, package: Optional[str] = None) -> Any:
+        return self._measure(self._original_import_module, name, name, package)
+
+    def _measure(self, import_func: Any, name: str, *args: Any) -> Any:
+        if name in sys.modules or threading.current_thread() is not threading.main_thread():
+            return import_func(*args)
+        self._import_stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return import_func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._import_stack.pop()
+            if self._import_stack:
+                self._import_stack[-1] += elapsed
+            total, own = self.imports.get(name, (0.0, 0.0))
+            self.imports[name] = (total + elapsed, own + elapsed - nested)
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure duration of startup phase"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def event(self, name: str) -> None:
+        """Remember time of event since start of profiling (for example, connection to gateway)"""
+        if self.enabled:
+            # Logger is not imported at module level, so profiler can be enabled before anything is imported
+            from src.log import log
+            self.events.append((name, time.perf_counter() - self._start_time))
+            log.info(f"Startup event: {name}: {self.events[-1][1]:.3f}s after start")
+
+    def report(self) -> str:
+        result = "Startup phases:\n"
+        for name, elapsed in self.phases:
+            result += f"  {elapsed:8.3f}s  {name}\n"
+        result += f"  {time.perf_counter() - self._start_time:8.3f}s  total since start\n"
+        if self.events:
+            result += "Events:\n"
+            for name, elapsed in self.events:
+                result += f"  {elapsed:8.3f}s  {name}\n"
+        result += f"Slowest imports (self time, cumulative time), {len(self.imports)} modules are imported:\n"
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)[:self.IMPORTS_REPORT_SIZE]
+        for name, (total, own) in slowest:
+            result += f"  {own:8.3f}s  {total:8.3f}s  {name}\n"
+        return result
+
+
+profiler = StartupProfiler()
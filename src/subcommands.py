@@ -0,0 +1,106 @@
+"""Parser of subcommands: $(cmd), $[cmd], ${cmd} and $`cmd`
+
+String is parsed in one pass to the tree of literal strings and subcommands, then subcommands are run bottom-up:
+nested subcommands are run first and their results are substituted into the command line of outer subcommand.
+
+Closing bracket closes the nearest open subcommand of the same kind. Subcommands of other kinds that are opened
+inside it and are not closed yet are treated as literal text, as well as closing brackets without open subcommand.
+Results of subcommands are not parsed again"""
+
+import re
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+
+_OPENING_BRACKETS = "([{`"
+_CLOSING_BRACKETS = {')': '(', ']': '[', '}': '{', '`': '`'}
+_TOKEN_REGEX = re.compile(r"\$[(\[{`]|[)\]}`]")
+
+
+class Subcommand:
+    """Subcommand which command line consists of literal strings and nested subcommands"""
+
+    __slots__ = ("kind", "parts")
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.parts: List[Union[str, "Subcommand"]] = []
+
+
+def parse(string: str) -> List[Union[str, Subcommand]]:
+    """Parse string to the list of literal strings and subcommands"""
+    root: List[Union[str, Subcommand]] = []
+    if '$' not in string:
+        if string:
+            root.append(string)
+        return root
+    stack: List[Subcommand] = []
+    # Number of open subcommands of every kind
+    open_count = dict.fromkeys(_OPENING_BRACKETS, 0)
+    position = 0
+
+    def parts() -> List[Union[str, Subcommand]]:
+        return stack[-1].parts if stack else root
+
+    def unwind() -> None:
+        # Subcommand that is not closed becomes literal text of its parent
+        subcommand = stack.pop()
+        open_count[subcommand.kind] -= 1
+        parent_parts = parts()
+        parent_parts.append('$' + subcommand.kind)
+        parent_parts.extend(subcommand.parts)
+
+    for match in _TOKEN_REGEX.finditer(string):
+        token = match.group()
+        if len(token) == 2 and not (token[1] == '`' and open_count['`']):
+            if match.start() > position:
+                parts().append(string[position:match.start()])
+            position = match.end()
+            stack.append(Subcommand(token[1]))
+            open_count[token[1]] += 1
+            continue
+        kind = _CLOSING_BRACKETS[token[-1]]
+        if not open_count[kind]:
+            continue
+        end = match.end() - 1
+        if end > position:
+            parts().append(string[position:end])
+        position = match.end()
+        while stack[-1].kind != kind:
+            unwind()
+        subcommand = stack.pop()
+        open_count[kind] -= 1
+        parts().append(subcommand)
+    if position < len(string):
+        parts().append(string[position:])
+    while stack:
+        unwind()
+    return root
+
+
+async def expand(
+        string: str, run: Callable[[str], Awaitable[Optional[str]]]) -> Optional[str]:
+    """Run subcommands of string and substitute their results.
+    run() gets command line of subcommand and returns its result. If it returns None, processing is stopped and
+    None is returned"""
+    tree = parse(string)
+    if all(isinstance(part, str) for part in tree):
+        return ''.join(tree)
+    # Stack of (parts, index of the next part, results of processed parts)
+    stack: List[Tuple[List[Union[str, Subcommand]], List[int], List[str]]] = [(tree, [0], [])]
+    while True:
+        parts, index, results = stack[-1]
+        if index[0] < len(parts):
+            part = parts[index[0]]
+            index[0] += 1
+            if isinstance(part, str):
+                results.append(part)
+            else:
+                stack.append((part.parts, [0], []))
+            continue
+        stack.pop()
+        text = ''.join(results)
+        if not stack:
+            return text
+        result = await run(text)
+        if result is None:
+            return None
+        stack[-1][2].append(result)
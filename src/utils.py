@@ -1,9 +1,13 @@
 import asyncio
+import contextlib
 import datetime
+import importlib.util
 import os
+import sys
 import tempfile
+import types
 from enum import IntEnum
-from typing import Any, Coroutine, Optional, Tuple
+from typing import Any, BinaryIO, Coroutine, Iterator, Optional, Tuple
 
 import requests
 import yaml
@@ -20,7 +24,30 @@ class TimeoutStatus(IntEnum):
     TIMEOUT = 1
 
 
+class _MissingModule(types.ModuleType):
+    """Placeholder for optional dependency that is not installed. It fails when it is used"""
+
+    def __getattr__(self, attr: str) -> Any:
+        raise ModuleNotFoundError(f"No module named '{self.__name__}'", name=self.__name__)
+
+
 class Util:
+    @staticmethod
+    def lazy_import(name: str) -> types.ModuleType:
+        """Get module that is actually imported on first access to its attribute.
+        It is used for heavy dependencies of commands and plugins, so they do not slow down bot start"""
+        if name in sys.modules:
+            return sys.modules[name]
+        spec = importlib.util.find_spec(name)
+        if spec is None or spec.loader is None:
+            return _MissingModule(name)
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
+
     @staticmethod
     async def run_function_with_time_limit(coro: Coroutine, timeout: float) -> Tuple[TimeoutStatus, Optional[Any]]:
         try:
@@ -58,17 +85,37 @@ class Util:
 
     @staticmethod
     def read_config_file(path: str) -> Any:
-        """Read YAML configuration file"""
+        """Read configuration file (JSON that is written by config_codec or YAML)"""
+        from src import config_codec
+
         yaml_loader, _ = Util.get_yaml()
         if not os.path.isfile(path):
             return None
-        with open(path, 'r') as f:
+        with open(path, 'r', encoding='utf-8') as f:
             try:
-                return yaml.load(f.read(), Loader=yaml_loader)
+                return config_codec.load(f, yaml_loader)
             except Exception:
                 log.error(f"File '{path}' can not be read!", exc_info=True)
         return None
 
+    @staticmethod
+    @contextlib.contextmanager
+    def atomic_write(path: str) -> Iterator[BinaryIO]:
+        """Open temporary file next to path for binary writing. When the block is finished successfully,
+        the file is flushed to disk and atomically replaces the file at path. Otherwise it is removed"""
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                yield f
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
     @staticmethod
     def path_to_module(path: str) -> str:
         """Convert OS path to Python module"""
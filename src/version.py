@@ -1,3 +1,3 @@
-CONFIG_VERSION = '0.0.60'
-MARKOV_CONFIG_VERSION = '0.0.7'
+CONFIG_VERSION = '0.0.64'
+MARKOV_CONFIG_VERSION = '0.0.8'
 SECRET_CONFIG_VERSION = '0.0.5'
@@ -1,4 +1,4 @@
-from src.algorithms import levenshtein_distance
+from src.algorithms import jit_kernels, levenshtein_distance, precompile_algs
 
 
 def test_levenshtein_distance_from_equal_strings():
@@ -19,3 +19,11 @@ def test_levenshtein_distance_different_length():
 
 def test_levenshtein_distance_swapped_letters():
     assert levenshtein_distance("help", "hepl") == 2
+
+
+def test_levenshtein_distance_is_same_after_precompilation(monkeypatch, tmp_path):
+    monkeypatch.setenv("NUMBA_CACHE_DIR", str(tmp_path / "numba_cache"))
+    assert jit_kernels["levenshtein_distance"] is levenshtein_distance
+    before = levenshtein_distance("kitten", "sitting")
+    precompile_algs(wait=True)
+    assert levenshtein_distance("kitten", "sitting") == before == 3
@@ -0,0 +1,97 @@
+import asyncio
+
+from src import const
+from src.api.command import Command, Implementation, SupportedPlatforms
+from src.api.dispatcher import LatencyHistogram, dispatcher
+from src.config import Command as LegacyDiscordCommand
+from src.config import bc
+from src.executor import Executor
+from tests.fixtures.context import BufferTestExecutionContext
+
+_commands = {
+    "ping": Command(
+        "fixture", "ping", const.Permission.USER, Implementation.MESSAGE, subcommand=True, impl_message="Pong!"),
+    "echo": Command(
+        "fixture", "echo", const.Permission.USER, Implementation.MESSAGE, subcommand=True, impl_message="@args@"),
+    "empty": Command(
+        "fixture", "empty", const.Permission.USER, Implementation.MESSAGE, subcommand=True, impl_message=""),
+}
+
+
+async def _args(cmd_line, execution_ctx):
+    """Print arguments"""
+    await execution_ctx.send_message(repr(cmd_line[1:]))
+
+
+class CommandsExecutionContext(BufferTestExecutionContext):
+    def find_command(self, command_name):
+        return (command_name, _commands[command_name]) if command_name in _commands else None
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for _ in range(90):
+        histogram.record(0.0001)
+    for _ in range(10):
+        histogram.record(0.05)
+    assert histogram.count == 100
+    assert 0.0001 <= histogram.percentile(50) < 0.0002
+    assert 0.05 <= histogram.percentile(95) < 0.1
+    assert histogram.percentile(100) == histogram.max == 0.05
+
+
+def test_dispatcher_records_command_and_subcommands(capsys):
+    dispatcher.latency.clear()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(
+        _commands["echo"].run(["echo", "$(ping)", "$(echo", "x)"], CommandsExecutionContext()))
+    captured = capsys.readouterr()
+    assert captured.out == "Pong! x\n"
+    assert dispatcher.latency["echo"].count == 2
+    assert dispatcher.latency["ping"].count == 1
+
+
+def test_dispatcher_uses_platform_command_settings(capsys):
+    class SettingsExecutionContext(CommandsExecutionContext):
+        def command_settings(self, command_name, command):
+            return settings
+
+        def is_command_available(self, command_name):
+            return command_name != "echo"
+
+    settings = LegacyDiscordCommand(permission=1)
+    loop = asyncio.get_event_loop()
+    execution_ctx = SettingsExecutionContext()
+    loop.run_until_complete(_commands["echo"].run(["echo", "hi"], execution_ctx))
+    loop.run_until_complete(_commands["ping"].run(["ping"], execution_ctx))
+    execution_ctx.permission_level = 1
+    loop.run_until_complete(_commands["ping"].run(["ping"], execution_ctx))
+    captured = capsys.readouterr()
+    assert captured.out == (
+        "Command 'echo' is not available in this channel\n"
+        "You don't have permission to call command 'ping'\n"
+        "Pong!\n"
+    )
+    assert settings.times_called == 1
+
+
+def test_dispatcher_drops_empty_arguments(capsys):
+    command = Command("fixture", "args", const.Permission.USER, Implementation.FUNCTION, impl_func=_args)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(command.run(["args", "a", "$(empty)", "b", "$(empty)"], CommandsExecutionContext()))
+    assert capsys.readouterr().out == "['a', 'b']\n"
+
+
+def test_find_command_filters_by_platform(monkeypatch):
+    executor = Executor()
+    executor.commands = {
+        name: Command("fixture", name, const.Permission.USER, Implementation.MESSAGE, impl_message=name,
+                      supported_platforms=platforms)
+        for name, platforms in (("all", SupportedPlatforms.ALL), ("discord", SupportedPlatforms.DISCORD))
+    }
+    monkeypatch.setattr(bc, "executor", executor)
+    execution_ctx = BufferTestExecutionContext()
+    assert execution_ctx.find_command("all") == ("all", executor.commands["all"])
+    assert execution_ctx.find_command("discord") is None
+    monkeypatch.setattr(execution_ctx, "command_platforms", lambda: SupportedPlatforms.DISCORD)
+    assert execution_ctx.find_command("discord") == ("discord", executor.commands["discord"])
@@ -0,0 +1,20 @@
+from src.api.variables import VariableTemplate, compile_template
+from tests.fixtures.context import BufferTestExecutionContext
+
+
+def test_variables_are_substituted():
+    execution_ctx = BufferTestExecutionContext()
+    cmd_line = ["cmd", "first", "second", "third"]
+    template = VariableTemplate("@channel@/@channelid@: @command@ | @args@ | @args2-@ @args-2@ @args1-1@ | @arg3@")
+    assert template.render(execution_ctx, cmd_line) == (
+        "console/0: cmd first second third | first second third | second third first second first | third")
+    template = VariableTemplate("@args3-1@ @args1-9@ @arg4@ @arg01@ @server@ @unknown@ mail@example.com")
+    assert template.render(execution_ctx, cmd_line) == template.source
+    assert compile_template("@arg1@") is compile_template("@arg1@")
+
+
+def test_only_alphanumeric_arguments_are_substituted_in_safe_mode():
+    execution_ctx = BufferTestExecutionContext()
+    template = VariableTemplate("echo @args@ @args1-1@ @arg1@ @arg2@")
+    assert template.render(execution_ctx, ["cmd", "a", "b;rm"], safe=True) == "echo @args@ @args1-1@ a @arg2@"
+    assert template.render(execution_ctx, ["cmd", "a", "b"], safe=True) == "echo a b a a b"
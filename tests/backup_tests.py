@@ -0,0 +1,111 @@
+import io
+import os
+import random
+
+import pytest
+
+from src.backup import BackupStore
+
+
+def _random_bytes(size, seed=42):
+    return random.Random(seed).randbytes(size)
+
+
+def test_backup_store_split_is_content_defined():
+    data = _random_bytes(1 << 20)
+    chunks = list(BackupStore.split(io.BytesIO(data)))
+    assert b''.join(chunks) == data
+    assert all(len(chunk) <= BackupStore.CHUNK_MAX_SIZE for chunk in chunks)
+    assert all(len(chunk) >= BackupStore.CHUNK_MIN_SIZE for chunk in chunks[:-1])
+
+    class SmallBlocksBackupStore(BackupStore):
+        READ_BLOCK_SIZE = 1000
+
+    assert list(SmallBlocksBackupStore.split(io.BytesIO(data))) == chunks
+    modified = data[:300000] + b"new data" + data[300000:]
+    modified_chunks = list(BackupStore.split(io.BytesIO(modified)))
+    assert len(set(modified_chunks) - set(chunks)) == 1
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_backup_store_restores_deduplicated_backups(tmp_path, compress):
+    store = BackupStore(os.path.join(tmp_path, "backup"), compress=compress)
+    path = os.path.join(tmp_path, "markov.yaml")
+    data = _random_bytes(1 << 20)
+    with open(path, 'wb') as f:
+        f.write(data)
+    first = store.backup(path)
+    chunks_count = sum(len(files) for _, _, files in os.walk(os.path.join(tmp_path, "backup", "chunks")))
+    with open(path, 'wb') as f:
+        f.write(data + b"new data")
+    second = store.backup(path)
+    assert first != second
+    assert [manifest["id"] for manifest in store.snapshots("markov.yaml")] == [first, second]
+    assert sum(len(files) for _, _, files in os.walk(os.path.join(tmp_path, "backup", "chunks"))) == chunks_count + 1
+    store.restore(first, path)
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    store.prune({})
+    assert [manifest["id"] for manifest in store.snapshots()] == [second]
+    assert sum(len(files) for _, _, files in os.walk(os.path.join(tmp_path, "backup", "chunks"))) == chunks_count
+    store.restore(second, path)
+    with open(path, 'rb') as f:
+        assert f.read() == data + b"new data"
+
+
+def test_backup_store_detects_corrupted_chunks(tmp_path):
+    store = BackupStore(os.path.join(tmp_path, "backup"), compress=False)
+    path = os.path.join(tmp_path, "config.yaml")
+    with open(path, 'wb') as f:
+        f.write(b"version: 0.0.1\n")
+    snapshot_id = store.backup(path)
+    digest = store.snapshots()[0]["chunks"][0]
+    with open(store._chunk_path(digest), 'r+b') as f:
+        f.write(b"\x00corrupted")
+    with pytest.raises(ValueError):
+        store.restore(snapshot_id, path)
+    with open(path, 'rb') as f:
+        assert f.read() == b"version: 0.0.1\n"
+
+
+def test_backup_store_retention_policy():
+    times = [
+        "2024-01-01_10-00-00", "2024-01-01_10-30-00", "2024-01-01_11-00-00",
+        "2024-01-02_09-00-00", "2024-01-09_09-00-00", "2024-01-09_09-10-00",
+    ]
+    snapshots = [{"id": f"config.yaml_{time}", "file": "config.yaml", "time": time} for time in times]
+    snapshots.append({"id": "markov.yaml_2023-01-01_00-00-00", "file": "markov.yaml", "time": "2023-01-01_00-00-00"})
+    assert BackupStore.retained(snapshots, {}) == {
+        "config.yaml_2024-01-09_09-10-00", "markov.yaml_2023-01-01_00-00-00"}
+    assert BackupStore.retained(snapshots, {"hourly": 3}) == {
+        "config.yaml_2024-01-09_09-10-00", "config.yaml_2024-01-02_09-00-00", "config.yaml_2024-01-01_11-00-00",
+        "markov.yaml_2023-01-01_00-00-00"}
+    assert BackupStore.retained(snapshots, {"daily": 7, "weekly": 1}) == {
+        "config.yaml_2024-01-09_09-10-00", "config.yaml_2024-01-02_09-00-00", "config.yaml_2024-01-01_11-00-00",
+        "markov.yaml_2023-01-01_00-00-00"}
+    assert BackupStore.retained(snapshots, {"weekly": 4}) == {
+        "config.yaml_2024-01-09_09-10-00", "config.yaml_2024-01-02_09-00-00", "markov.yaml_2023-01-01_00-00-00"}
+
+
+def test_backup_store_prunes_legacy_backups_and_keeps_chunks_of_unreadable_manifests(tmp_path):
+    store = BackupStore(str(tmp_path))
+    for time in ("2024-01-01_10-00-00", "2024-01-02_10-00-00"):
+        with open(os.path.join(tmp_path, f"markov_{time}.yaml.zip"), 'wb') as f:
+            f.write(b"zip")
+    path = os.path.join(tmp_path, "markov.yaml")
+    with open(path, 'wb') as f:
+        f.write(b"version: 0.0.1\n")
+    store.backup(path)
+    assert [backup["file"] for backup in store.legacy_backups()] == ["markov.yaml", "markov.yaml"]
+    with open(store._snapshot_path("broken"), 'w') as f:
+        f.write("{")
+    # Snapshot of the last day is kept
+    assert store.prune({"daily": 2}) == ["markov_2024-01-01_10-00-00.yaml.zip"]
+    assert [backup["id"] for backup in store.legacy_backups()] == ["markov_2024-01-02_10-00-00.yaml.zip"]
+    snapshot_id = store.snapshots()[0]["id"]
+    os.remove(store._snapshot_path(snapshot_id))
+    store.prune({})
+    assert os.listdir(store._chunks_path)
+    os.remove(store._snapshot_path("broken"))
+    store.prune({})
+    assert not any(os.listdir(os.path.join(store._chunks_path, chunks)) for chunks in os.listdir(store._chunks_path))
@@ -0,0 +1,40 @@
+import random
+
+from src.algorithms import levenshtein_distance
+from src.command_index import CommandIndex
+
+
+def test_command_index_lookup_and_completion():
+    index = CommandIndex()
+    index.rebuild(["ping", "poll", "reminder", "remindme"], {"pong": "ping"})
+    assert index.resolve("pong") == "ping" and index.resolve("poll") == "poll" and index.resolve("pin") is None
+    assert index.complete("remind") == ["reminder", "remindme"]
+    assert index.complete("p") == ["ping", "poll", "pong"]
+    index.remove("remindme")
+    index.add("rem", "reminder")
+    assert index.complete("rem") == ["rem", "reminder"]
+    assert index.suggest("remindm") == "reminder"
+    assert index.suggest("pung") == "ping"
+
+
+def test_command_index_suggests_commands_before_aliases():
+    index = CommandIndex()
+    index.rebuild(["ping"], {"pong": "ping"})
+    index.add("pang")
+    assert index.suggest("pung") == "ping"
+    index.remove("ping")
+    assert index.suggest("pung") == "pang"
+
+
+def test_command_index_suggestion_is_the_nearest_name():
+    rng = random.Random(42)
+    names = list(dict.fromkeys(''.join(rng.choices("abcdef", k=rng.randint(1, 8))) for _ in range(200)))
+    index = CommandIndex()
+    index.rebuild(names, {})
+    for name in rng.sample(names, 150):
+        index.remove(name)
+        names.remove(name)
+    for _ in range(100):
+        word = ''.join(rng.choices("abcdefg", k=rng.randint(0, 9)))
+        expected = min(names, key=lambda name: levenshtein_distance(word, name))
+        assert index.suggest(word) == expected
@@ -0,0 +1,31 @@
+import asyncio
+
+from src import const
+from src.config import bc
+from src.executor import Executor
+from tests.fixtures.context import BufferTestExecutionContext
+
+
+def test_lazy_commands_are_imported_on_first_invocation(monkeypatch, tmp_path, capsys):
+    monkeypatch.setenv("WALBOT_FEATURE_LAZY_COMMANDS", "1")
+    monkeypatch.setattr(const, "COMMANDS_CACHE_FILE_PATH", str(tmp_path / ".commands_cache"))
+    # Commands are bound to bc.executor
+    eager = Executor()
+    monkeypatch.setattr(bc, "executor", eager)
+    eager.load_commands()
+    assert "ping" in eager.commands and eager._lazy_modules == dict()
+    executor = Executor()
+    monkeypatch.setattr(bc, "executor", executor)
+    executor.load_commands()
+    assert "src.cmd.string" in executor._lazy_modules
+    assert executor.commands.keys() == eager.commands.keys()
+    for name, command in executor.commands.items():
+        assert command.description == eager.commands[name].description
+        assert command.permission_level == eager.commands[name].permission_level
+    urlencode = executor.commands["urlencode"]
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(urlencode.run(["urlencode", "a b"], BufferTestExecutionContext()))
+    assert "src.cmd.string" not in executor._lazy_modules
+    loop.run_until_complete(urlencode.run(["urlencode", "c"], BufferTestExecutionContext()))
+    assert capsys.readouterr().out == "a%20b\nc\n"
+    assert executor.commands["urlencode"] is urlencode and urlencode.times_called == 2
@@ -0,0 +1,23 @@
+import asyncio
+
+from src.cmd.markov import MarkovCommands
+from src.config import bc
+from src.markov import Markov
+from tests.fixtures.context import BufferTestExecutionContext
+
+
+def test_markov_command_keeps_words_that_start_with_dash(capsys, monkeypatch):
+    markov = Markov()
+    markov.add_string("apples are red")
+    monkeypatch.setattr(bc, "markov", markov)
+    monkeypatch.setattr(bc, "markov_pool", None)
+    bc.executor.commands = dict()
+    bc.executor.add_module(MarkovCommands())
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(
+        bc.executor.commands["markov"].run(["markov", "-h", "-1", "apples"], BufferTestExecutionContext()))
+    loop.run_until_complete(
+        bc.executor.commands["markov"].run(["markov", "--order", "5", "apples"], BufferTestExecutionContext()))
+    captured = capsys.readouterr()
+    assert captured.out.split('\n')[0] == "-h -1 apples are red"
+    assert captured.out.split('\n')[1].startswith("Order of Markov chain should be one of: 1, ")
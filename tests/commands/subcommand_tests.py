@@ -1,5 +1,7 @@
 import asyncio
 
+from src import const, subcommands
+from src.api.command import Command, Implementation
 from src.cmd.builtin import BuiltinCommands
 from src.cmd.math import MathCommands
 from src.config import bc
@@ -80,3 +82,41 @@ def test_if_and_calc_commands_as_subcommands(capsys):
         "not equal\n"
         "not greater\n"
     )
+
+
+def test_subcommands_are_expanded_bottom_up():
+    calls = []
+
+    async def run(command_line):
+        calls.append(command_line)
+        return f"<{command_line}>"
+
+    loop = asyncio.get_event_loop()
+    assert loop.run_until_complete(subcommands.expand("a $(b $[c] ${d}) e", run)) == "a <b <c> <d>> e"
+    assert calls == ["c", "d", "b <c> <d>"]
+    assert loop.run_until_complete(subcommands.expand("$(a $[b) c]", run)) == "<a $[b> c]"
+    assert loop.run_until_complete(subcommands.expand("$`a $`b` c`", run)) == "<a $>b` c`"
+    assert loop.run_until_complete(subcommands.expand("(x) $(y $(z)", run)) == "(x) $(y <z>"
+    assert loop.run_until_complete(subcommands.expand("$$(x)$()", run)) == "$<x><>"
+
+
+def test_recursive_custom_command_is_limited_by_depth():
+    bc.executor.commands = dict()
+    bc.executor.add_module(BuiltinCommands())
+    bc.executor.commands["rec"] = Command(
+        None, "rec", const.Permission.USER, Implementation.MESSAGE, subcommand=True, impl_message="x$(rec)")
+    loop = asyncio.get_event_loop()
+    result = loop.run_until_complete(bc.executor.commands["rec"].run(["rec"], BufferTestExecutionContext()))
+    assert result == "x" * const.MAX_SUBCOMMAND_DEPTH
+
+
+def test_nested_loops_are_limited_by_command_calls():
+    bc.executor.commands = dict()
+    bc.executor.add_module(BuiltinCommands())
+    bc.executor.add_module(MathCommands())
+    loop = asyncio.get_event_loop()
+    execution_ctx = BufferTestExecutionContext()
+    execution_ctx.silent = True
+    result = loop.run_until_complete(
+        bc.executor.commands["loop"].run("loop 100 loop 100 echo hi".split(), execution_ctx))
+    assert result.count("hi") < const.MAX_COMMAND_CALLS
@@ -0,0 +1,67 @@
+import io
+import os
+
+import yaml
+
+from src import config_codec, const
+from src.api.quote import Quote
+from src.api.reminder import Reminder
+from src.backend.discord.config import DiscordConfig
+from src.config import Config, GuildSettings, SecretConfig, User
+from src.utils import Util
+
+
+def test_config_codec_round_trip():
+    _, yaml_dumper = Util.get_yaml()
+    discord = DiscordConfig()
+    discord.users[1] = User(1)
+    discord.users[1].data["tz"] = "Europe/Moscow"
+    discord.guilds[2] = GuildSettings(2)
+    discord.guilds[2].whitelist = {10, 20}
+    reminder = Reminder("2030-01-01 10:00", "message", 10, "author", "2024-01-01 00:00", const.BotBackend.DISCORD)
+    reminder.prereminders_list = [5]
+    data = {
+        "discord": discord,
+        "reminders": {1: reminder},
+        "quotes": {1: Quote("quote", "author")},
+        "__type__": (1, "tuple"),
+    }
+    dumped = config_codec.dump(data, yaml_dumper)
+    assert b"!!python" not in dumped
+    loaded = config_codec.load(io.StringIO(dumped.decode("utf-8")), None)
+    assert loaded["discord"].users[1].data == {"tz": "Europe/Moscow"}
+    assert loaded["discord"].guilds[2].whitelist == {10, 20}
+    assert loaded["reminders"][1].__dict__ == reminder.__dict__
+    assert loaded["quotes"][1].timestamp == data["quotes"][1].timestamp
+    assert loaded["__type__"] == (1, "tuple")
+
+
+def test_config_codec_round_trip_of_config(caplog):
+    _, yaml_dumper = Util.get_yaml()
+    config = Config()
+    config.database_path = "walbot.db"
+    config.plugins["plugin"] = {"autostart": True}
+    dumped = config_codec.dump(config, yaml_dumper)
+    # Every attribute of Config state should be described by schema, otherwise it is stored in YAML
+    assert dumped.startswith(b"{") and "stored in YAML" not in caplog.text
+    loaded = config_codec.load(io.StringIO(dumped.decode("utf-8")), None)
+    assert isinstance(loaded, Config) and loaded.__getstate__() == config.__getstate__()
+
+
+def test_config_codec_falls_back_to_yaml(tmp_path, caplog):
+    yaml_loader, yaml_dumper = Util.get_yaml()
+    secret_config = SecretConfig()
+    secret_config.discord["token"] = "token"
+    path = os.path.join(tmp_path, "secret.yaml")
+    with open(path, 'wb') as f:
+        f.write(config_codec.dump(secret_config, yaml_dumper))
+    assert Util.read_config_file(path).discord["token"] == "token"
+    # Attributes that are not described by schema
+    secret_config.new_attribute = 1
+    dumped = config_codec.dump(secret_config, yaml_dumper)
+    assert dumped.startswith(b"!!python/object:src.config.SecretConfig")
+    assert "unknown fields ['new_attribute']" in caplog.text and "SecretConfig is stored in YAML" in caplog.text
+    with open(path, 'wb') as f:
+        f.write(dumped)
+    assert Util.read_config_file(path).new_attribute == 1
+    assert yaml.load(dumped, Loader=yaml_loader).discord["token"] == "token"
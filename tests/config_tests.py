@@ -0,0 +1,157 @@
+import os
+import threading
+
+import yaml
+
+from src import config as config_module
+from src import const
+from src.api.quote import Quote
+from src.backup import BackupStore
+from src.config import Config, SecretConfig, bc
+from src.markov import CompactMarkov, Markov
+from src.patch.updater import Updater
+from src.utils import Util
+
+
+def _make_config(monkeypatch, tmp_path):
+    # Config constructor exports help for Discord commands
+    monkeypatch.setattr(const, "DISCORD_COMMANDS_DOC_PATH", os.path.join(tmp_path, "DiscordCommands.md"))
+    yaml_loader, yaml_dumper = Util.get_yaml()
+    monkeypatch.setattr(bc, "yaml_loader", yaml_loader)
+    monkeypatch.setattr(bc, "yaml_dumper", yaml_dumper)
+    return Config()
+
+
+def _save(tmp_path, force=False):
+    bc.config.save(
+        os.path.join(tmp_path, "config.yaml"), os.path.join(tmp_path, "markov.yaml"),
+        os.path.join(tmp_path, "secret.yaml"), wait=True, force=force)
+
+
+def _stats(kind, names=("config", "secret config", "Markov model")):
+    return {name: bc.config.save_stats[kind][name] for name in names}
+
+
+def test_config_save_skips_files_that_are_not_changed(monkeypatch, tmp_path):
+    monkeypatch.setattr(bc, "config", _make_config(monkeypatch, tmp_path))
+    monkeypatch.setattr(bc, "secret_config", SecretConfig())
+    monkeypatch.setattr(bc, "markov", Markov())
+    bc.markov.min_chars = 1
+    _save(tmp_path)
+    assert _stats("written") == {"config": 1, "secret config": 1, "Markov model": 1}
+    _save(tmp_path)
+    assert _stats("skipped") == {"config": 1, "secret config": 1, "Markov model": 1}
+    bc.config.ids["timer"] += 1
+    bc.config.mark_dirty()
+    bc.markov.add_string("hello world")
+    _save(tmp_path)
+    assert bc.config.save_cycles == 3
+    assert _stats("written") == {"config": 2, "secret config": 1, "Markov model": 2}
+    assert _stats("skipped") == {"config": 1, "secret config": 2, "Markov model": 1}
+    _save(tmp_path, force=True)
+    assert _stats("written") == {"config": 3, "secret config": 2, "Markov model": 3}
+
+
+def test_config_revision_is_not_saved(monkeypatch, tmp_path):
+    config = _make_config(monkeypatch, tmp_path)
+    config.mark_dirty()
+    dumped = yaml.dump(config, Dumper=bc.yaml_dumper)
+    assert "revision" not in dumped and "save_stats" not in dumped
+    loaded = yaml.load(dumped, Loader=bc.yaml_loader)
+    assert loaded.revisions["config"] == 0 and loaded.saved_revisions == dict()
+    assert loaded.commands_prefix == config.commands_prefix
+
+
+def test_config_save_serializes_snapshot_in_background(monkeypatch, tmp_path):
+    monkeypatch.setattr(bc, "config", _make_config(monkeypatch, tmp_path))
+    monkeypatch.setattr(bc, "secret_config", SecretConfig())
+    monkeypatch.setattr(bc, "markov", Markov())
+    with config_module._save_lock:
+        # Save does not wait for the lock, snapshot of state is serialized by worker thread
+        bc.config.save(
+            os.path.join(tmp_path, "config.yaml"), os.path.join(tmp_path, "markov.yaml"),
+            os.path.join(tmp_path, "secret.yaml"))
+        revision = bc.config.revisions["config"]
+        bc.config.commands_prefix = "?"
+        bc.config.ids["quote"] += 1
+        bc.config.mark_dirty()
+        assert not os.path.exists(os.path.join(tmp_path, "config.yaml"))
+    for thread in threading.enumerate():
+        if thread.name == "ConfigSave":
+            thread.join()
+    config = Util.read_config_file(os.path.join(tmp_path, "config.yaml"))
+    assert config.commands_prefix == "!" and config.ids["quote"] == 1
+    assert bc.config.saved_revisions["config"] == revision
+    _save(tmp_path)
+    assert _stats("written", ("config",)) == {"config": 2}
+    assert Util.read_config_file(os.path.join(tmp_path, "config.yaml")).commands_prefix == "?"
+    assert sorted(os.listdir(tmp_path)) == [
+        "DiscordCommands.md", "config.d", "config.yaml", "markov.yaml", "secret.yaml"]
+
+
+def test_config_backup_includes_markov_wal(monkeypatch, tmp_path):
+    monkeypatch.setattr(bc, "config", _make_config(monkeypatch, tmp_path))
+    monkeypatch.setattr(const, "BACKUP_DIRECTORY", str(tmp_path / "backup"))
+    path, wal_prefix = str(tmp_path / "markov.bin"), str(tmp_path / "markov.wal")
+    monkeypatch.setattr(bc, "markov", CompactMarkov())
+    bc.markov.min_chars = 1
+    bc.markov.write_snapshot(path)
+    bc.markov.open_wal(wal_prefix)
+    bc.markov.add_string("hello world")
+    bc.config.backup(markov_file=path, wait=True)
+    store = BackupStore(const.BACKUP_DIRECTORY)
+    restored_path = str(tmp_path / "restored.bin")
+    store.restore(store.snapshots("markov.bin")[-1]["id"], restored_path)
+    restored = CompactMarkov.read_snapshot(restored_path)
+    assert restored.generate() == "hello world"
+    assert restored.generation == bc.markov.generation
+
+
+def test_config_domains_are_saved_independently(monkeypatch, tmp_path):
+    monkeypatch.setattr(bc, "config", _make_config(monkeypatch, tmp_path))
+    monkeypatch.setattr(bc, "secret_config", SecretConfig())
+    monkeypatch.setattr(bc, "markov", Markov())
+    _save(tmp_path)
+    assert sorted(os.listdir(os.path.join(tmp_path, "config.d"))) == sorted(
+        domain + ".yaml" for domain in Config.DOMAINS)
+    assert "quotes" not in yaml.dump(bc.config, Dumper=bc.yaml_dumper)
+    bc.config.quotes[1] = Quote("quote", "author")
+    bc.config.ids["quote"] += 1
+    bc.config.mark_dirty("quotes")
+    _save(tmp_path)
+    assert _stats("written", ("config", "quotes", "reminders")) == {"config": 2, "quotes": 2, "reminders": 1}
+    assert _stats("skipped", ("config", "quotes", "reminders")) == {"config": 0, "quotes": 0, "reminders": 1}
+
+    config = Config.load(os.path.join(tmp_path, "config.yaml"))
+    assert config.ids["quote"] == 2 and config.loaded_domains() == []
+    assert config.quotes[1].message == "quote"
+    assert config.loaded_domains() == ["quotes"]
+    monkeypatch.setattr(bc, "config", config)
+    _save(tmp_path, force=True)
+    assert _stats("written", ("config", "quotes", "reminders")) == {"config": 1, "quotes": 1, "reminders": 0}
+    assert "reminders" not in bc.config.loaded_domains()
+
+
+def test_config_patch_moves_domains_to_separate_files(monkeypatch, tmp_path):
+    config = _make_config(monkeypatch, tmp_path)
+    config.version = "0.0.61"
+    config.quotes[1] = Quote("quote", "author")
+    # Config of old version keeps all domains in config.yaml
+    monkeypatch.setattr(Config, "__getstate__", lambda self: {
+        key: value for key, value in self.__dict__.items()
+        if key not in ("_config_file", "revisions", "saved_revisions", "_saved_cycles", "save_cycles",
+                       "save_stats")})
+    with open(os.path.join(tmp_path, "config.yaml"), 'w') as f:
+        f.write(yaml.dump(config, Dumper=bc.yaml_dumper))
+    monkeypatch.undo()
+    monkeypatch.setattr(const, "DISCORD_COMMANDS_DOC_PATH", os.path.join(tmp_path, "DiscordCommands.md"))
+    monkeypatch.chdir(tmp_path)
+    updater = Updater("config")
+    updater.update()
+    assert updater.result()
+    with open(os.path.join(tmp_path, "config.yaml")) as f:
+        assert "quotes" not in f.read()
+    config = Config.load(os.path.join(tmp_path, "config.yaml"))
+    assert config.version == const.CONFIG_VERSION
+    assert config.quotes[1].message == "quote"
+    assert set(config.executor.keys()) == {"commands_data", "custom_commands"}
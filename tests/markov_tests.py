@@ -1,4 +1,20 @@
-from src.markov import Markov
+import asyncio
+import re
+
+import pytest
+import yaml
+
+from src.markov import (
+    CompactMarkov,
+    Markov,
+    MarkovV2,
+    collect_garbage_incrementally
+)
+from src.markov_index import WordIndex
+from src.markov_ingest import MarkovIngestQueue
+from src.markov_ngram import NgramMarkov
+from src.markov_pool import MarkovResponsePool
+from src.markov_wal import MarkovWriteAheadLog
 
 LOREM = (
     "Lorem ipsum dolor sit amet, consectetur adipiscing elit, "
@@ -60,3 +76,522 @@ def test_get_next_words_list_returns_sorted_counts():
     markov.add_string("hello world hello world hello friend")
     words = markov.get_next_words_list("hello")
     assert words == [("world", 2), ("friend", 1), (None, 0)]
+
+
+def test_compact_markov_correctly_parses_sentence():
+    markov = CompactMarkov()
+    markov.add_string(LOREM)
+    text = LOREM.split()
+    for i in range(len(text) - 1):
+        assert text[i + 1] in dict(markov.get_next_words_list(text[i])).keys()
+
+
+def test_compact_markov_correctly_deletes_word_with_regex():
+    markov = CompactMarkov()
+    markov.add_string(LOREM)
+    removed = markov.del_words("^[a-z]{3}$")
+    assert sorted(removed) == ["sed", "sit"]
+    assert "sit" not in dict(markov.get_next_words_list("dolor")).keys()
+    assert "ipsum" in dict(markov.get_next_words_list("Lorem")).keys()
+    assert markov.find_words("^[a-z]{3}$") == []
+    assert markov.check() is True
+
+
+def test_compact_markov_matches_object_graph_model():
+    markov = Markov()
+    markov.add_string("hello world hello world hello friend")
+    markov.add_string("hello there my friend")
+    compact = CompactMarkov.from_markov(markov)
+    for word in markov.model.keys():
+        assert sorted(compact.get_next_words_list(word), key=str) == sorted(
+            markov.get_next_words_list(word), key=str)
+    assert compact.pairs_count() == markov.pairs_count()
+    assert compact.words_count() == markov.words_count()
+
+
+def test_compact_markov_generate():
+    markov = CompactMarkov()
+    assert markov.generate() == "<Markov database is empty>"
+    markov.add_string("one two three")
+    assert markov.generate() == "one two three"
+    assert markov.generate("two") == "two three"
+    assert markov.generate("four") == "<Empty message was generated>"
+
+
+def test_compact_markov_collect_garbage():
+    markov = CompactMarkov()
+    markov.add_string("alpha beta gamma")
+    markov.del_words("^beta$")
+    assert markov.collect_garbage() == {"gamma"}
+    assert markov.find_words("") == ["alpha"]
+
+
+def test_compact_markov_yaml_round_trip():
+    markov = CompactMarkov()
+    markov.add_string(LOREM)
+    markov.add_string("Lorem ipsum again and again")
+    restored = yaml.load(yaml.dump(markov, Dumper=yaml.Dumper), Loader=yaml.Loader)
+    assert restored.find_words("") == markov.find_words("")
+    assert restored.get_next_words_list("Lorem") == markov.get_next_words_list("Lorem")
+    assert restored.check() is True
+
+
+def test_markov_node_choose_next_by_cumulative_counts():
+    markov = Markov()
+    markov.add_string("hello world hello world hello friend")
+    node = markov.model["hello"]
+    assert [node.choose_next(i) for i in range(node.total_next)] == ["world", "world", "friend"]
+    markov.add_string("hello there")
+    assert [node.choose_next(i) for i in range(node.total_next)] == ["world", "world", "friend", "there"]
+    try:
+        node.choose_next(node.total_next)
+        assert False, "IndexError is expected"
+    except IndexError:
+        pass
+
+
+def test_markov_yaml_dump_does_not_contain_cumulative_counts():
+    markov = Markov()
+    markov.add_string(LOREM)
+    assert markov.generate("Lorem") == LOREM
+    dump = yaml.dump(markov, Dumper=yaml.Dumper)
+    assert "_cumulative" not in dump
+    restored = yaml.load(dump, Loader=yaml.Loader)
+    assert restored.generate("Lorem") == LOREM
+
+
+def test_compact_markov_snapshot_round_trip(tmp_path):
+    markov = CompactMarkov()
+    markov.add_string(LOREM)
+    markov.add_string("Lorem привет again and again")
+    markov.del_words("^sit$")
+    markov.filters.append(re.compile("^http", re.DOTALL))
+    markov.ignored_prefixes[1] = "!"
+    path = str(tmp_path / "markov.bin")
+    markov.write_snapshot(path)
+    restored = CompactMarkov.read_snapshot(path)
+    assert restored.find_words("") == markov.find_words("")
+    for word in markov.find_words(""):
+        assert restored.get_next_words_list(word) == markov.get_next_words_list(word)
+    assert restored.filters[0].pattern == "^http" and restored.filters[0].flags & re.DOTALL
+    assert restored.ignored_prefixes == {1: "!"}
+    assert restored.check() is True
+
+
+def test_compact_markov_snapshot_is_not_modified_by_model(tmp_path):
+    markov = CompactMarkov()
+    markov.add_string("hello world hello friend")
+    path = tmp_path / "markov.bin"
+    markov.write_snapshot(str(path))
+    data = path.read_bytes()
+    restored = CompactMarkov.read_snapshot(str(path))
+    restored.add_string("hello world and more new words")
+    assert dict(restored.get_next_words_list("hello"))["world"] == 2
+    assert path.read_bytes() == data
+
+
+def test_compact_markov_snapshot_with_invalid_magic(tmp_path):
+    path = tmp_path / "markov.bin"
+    path.write_bytes(b"\0" * 1024)
+    with pytest.raises(ValueError):
+        CompactMarkov.read_snapshot(str(path))
+
+
+def test_compact_markov_to_markov():
+    compact = CompactMarkov()
+    compact.add_string(LOREM)
+    markov = compact.to_markov()
+    assert markov.generate("Lorem") == LOREM
+    assert markov.pairs_count() == compact.pairs_count()
+
+
+def _reopen(path, wal_prefix):
+    markov = CompactMarkov.read_snapshot(path)
+    markov.open_wal(wal_prefix)
+    return markov
+
+
+def test_compact_markov_wal_is_replayed_on_top_of_snapshot(tmp_path):
+    path, wal_prefix = str(tmp_path / "markov.bin"), str(tmp_path / "markov.wal")
+    markov = CompactMarkov()
+    markov.add_string(LOREM)
+    markov.write_snapshot(path)
+    markov.open_wal(wal_prefix)
+    markov.add_string("Lorem ipsum again and again")
+    markov.del_words("^sit$")
+    markov.generate()
+    markov.serialize(path)
+    restored = _reopen(path, wal_prefix)
+    assert restored.find_words("") == markov.find_words("")
+    for word in markov.find_words(""):
+        assert restored.get_next_words_list(word) == markov.get_next_words_list(word)
+    assert restored.chains_generated == 1
+    assert restored.check() is True
+
+
+def test_compact_markov_wal_compaction(tmp_path):
+    path, wal_prefix = str(tmp_path / "markov.bin"), str(tmp_path / "markov.wal")
+    markov = CompactMarkov()
+    markov.write_snapshot(path)
+    markov.open_wal(wal_prefix)
+    markov.add_string(LOREM)
+    markov.WAL_COMPACTION_THRESHOLD = 0
+    markov.serialize(path)
+    assert MarkovWriteAheadLog.list_generations(wal_prefix) == [1]
+    assert CompactMarkov.read_snapshot(path).find_words("") == markov.find_words("")
+    markov.add_string("Lorem ipsum again and again")
+    markov.drop()
+    markov.add_string("one more message")
+    markov.serialize(path)
+    assert MarkovWriteAheadLog.list_generations(wal_prefix) == [2]
+    restored = _reopen(path, wal_prefix)
+    assert restored.find_words("") == ["message", "more", "one"]
+    assert restored.generation == 2
+
+
+def test_compact_markov_wal_is_replayed_after_interrupted_compaction(tmp_path):
+    path, wal_prefix = str(tmp_path / "markov.bin"), str(tmp_path / "markov.wal")
+    markov = CompactMarkov()
+    markov.write_snapshot(path)
+    markov.open_wal(wal_prefix)
+    markov.add_string("hello world hello friend")
+    markov._wal.rotate()  # crash after log rotation, but before snapshot is written
+    markov.add_string("hello world again")
+    markov.serialize(path)
+    restored = _reopen(path, wal_prefix)
+    assert dict(restored.get_next_words_list("hello")) == dict(markov.get_next_words_list("hello"))
+
+
+def test_compact_markov_wal_ignores_torn_record(tmp_path):
+    path, wal_prefix = str(tmp_path / "markov.bin"), str(tmp_path / "markov.wal")
+    markov = CompactMarkov()
+    markov.write_snapshot(path)
+    markov.open_wal(wal_prefix)
+    markov.add_string("hello world hello friend")
+    markov.serialize(path)
+    with open(MarkovWriteAheadLog.get_path(wal_prefix, 0), 'ab') as f:
+        f.write(b"\x01\xff\x00\x00\x00garbage")
+    restored = _reopen(path, wal_prefix)
+    restored.add_string("hello there")
+    restored.serialize(path)
+    restored = _reopen(path, wal_prefix)
+    assert dict(restored.get_next_words_list("hello")) == {"world": 1, "friend": 1, "there": 1, None: 0}
+
+
+@pytest.fixture
+def markov_collection():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().db.markov
+    collection.insert_one({
+        "chains_generated": 0,
+        "end_node": {"word": None, "next": {"__markov_null": 0}, "total_next": 0, "type": 2},
+        "filters": [],
+        "ignored_prefixes": {},
+        "max_chars": 2000,
+        "max_words": 500,
+        "min_chars": 1,
+        "min_words": 1,
+        "model": {"__markov_null": {"word": None, "next": {"__markov_null": 0}, "total_next": 0, "type": 0}},
+        "version": "0.1.0",
+    })
+    return collection
+
+
+def test_markov_v2_buffers_writes_until_flush(markov_collection):
+    markov = MarkovV2(markov_collection)
+    markov.add_string("hello world.com")
+    assert markov_collection.find_one({})["model"]["__markov_null"]["total_next"] == 0
+    assert markov.generate() == "hello world.com"
+    markov.flush()
+    model = markov_collection.find_one({})["model"]
+    assert model["__markov_null"]["next"]["hello"] == 1
+    assert model["hello"] == {"word": "hello", "next": {"world<__markov_dot>com": 1}, "total_next": 1, "type": 1}
+    assert model["world<__markov_dot>com"]["next"] == {"__markov_terminate": 1}
+    assert MarkovV2(markov_collection).generate("hello") == "world.com"
+
+
+def test_markov_v2_cached_nodes_are_updated(markov_collection):
+    markov = MarkovV2(markov_collection)
+    markov.add_string("one two")
+    markov.flush()
+    assert markov.generate("one") == "two"
+    markov.add_string("one three")
+    assert markov.get_next("one")["next"] == {"two": 1, "three": 1}
+    assert markov.get_next("one")["total_next"] == 2
+    markov.flush()
+    assert markov_collection.find_one({})["model"]["one"]["next"] == {"two": 1, "three": 1}
+
+
+def test_markov_v2_settings_are_cached_until_invalidated(markov_collection):
+    markov = MarkovV2(markov_collection)
+    assert markov.get("min_words") == 1
+    markov_collection.update_one({}, {"$set": {"min_words": 3}})
+    assert markov.get("min_words") == 1
+    markov.invalidate_settings()
+    assert markov.get("min_words") == 3
+    markov.add_string("too short")
+    markov.flush()
+    assert "too" not in markov_collection.find_one({})["model"].keys()
+
+
+def test_markov_collect_garbage_on_long_chain():
+    markov = Markov()
+    markov.max_words = 10000
+    markov.max_chars = 100000
+    markov.add_string(' '.join(f"w{i}" for i in range(5000)))
+    markov.add_string("orphan word")
+    markov.model[""].del_next("orphan")
+    assert markov.collect_garbage() == {"orphan", "word"}
+    assert markov.words_count() == 5001
+
+
+@pytest.mark.parametrize("model_type", [Markov, CompactMarkov])
+def test_markov_incremental_gc_keeps_words_added_during_cycle(model_type):
+    markov = model_type()
+    markov.add_string("alpha beta gamma delta")
+    markov.del_words("^beta$")
+    assert markov.gc_step(1) is None
+    markov.add_string("epsilon delta zeta")
+    removed = None
+    while removed is None:
+        removed = markov.gc_step(1)
+    assert removed == {"gamma"}
+    assert sorted(markov.find_words("^[a-z]")) == ["alpha", "delta", "epsilon", "zeta"]
+    assert dict(markov.get_next_words_list("delta")) == {"zeta": 1, None: 1}
+    assert markov.collect_garbage() == set()
+
+
+def test_markov_incremental_gc_drops_edges_to_removed_words():
+    markov = Markov()
+    markov.add_string("delta omega")
+    markov.add_string("gamma delta")
+    markov.model[""].del_next("delta")
+    markov.model[""].del_next("gamma")
+    removed = None
+    while removed is None:
+        removed = markov.gc_step(1)
+        if removed is None and "delta" not in markov.model.keys() and "gamma" in markov.model.keys():
+            markov.add_string("alpha gamma")  # gamma is reused after delta is removed
+    assert removed == {"delta", "omega"}
+    assert "delta" not in markov.model["gamma"].next.keys()
+    assert markov.generate("gamma") == "gamma"
+
+
+def test_compact_markov_wal_replays_incremental_gc(tmp_path):
+    path, wal_prefix = str(tmp_path / "markov.bin"), str(tmp_path / "markov.wal")
+    markov = CompactMarkov()
+    markov.write_snapshot(path)
+    markov.open_wal(wal_prefix)
+    markov.add_string("alpha beta gamma")
+    markov.del_words("^beta$")
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(collect_garbage_incrementally(markov, budget=1)) == {"gamma"}
+    markov.serialize(path)
+    assert _reopen(path, wal_prefix).find_words("") == ["alpha"]
+
+
+def test_word_index_required_literals():
+    assert WordIndex.required_literals("^hello.*world$") == ("hello", ["hello", "world"])
+    assert WordIndex.required_literals("ab?cd") == (None, ["a", "cd"])
+    assert WordIndex.required_literals("(?i)abc") == (None, [])
+    assert WordIndex.required_literals("(?m)^abc") == (None, ["abc"])
+    assert WordIndex.required_literals("foo|bar") == (None, [])
+
+
+@pytest.mark.parametrize("regex", ["", "^hel", "llo", "^hel.*o$", "^[a-z]{4}$", "(?i)HELP", "o|x", "^\\w+s$", "help$"])
+def test_word_index_search_matches_full_scan(regex):
+    words = ["hello", "help", "helps", "yellow", "world", "ohello", "Help", "x"]
+    index = WordIndex(words)
+    index.add("hellos")
+    index.remove("ohello")
+    words = [word for word in words if word != "ohello"] + ["hellos"]
+    assert index.search(regex) == sorted(word for word in words if re.search(regex, word))
+
+
+def test_word_index_applies_changes_on_query():
+    index = WordIndex(["b", "d"])
+    index.add("c")
+    assert index.search("^") == ["b", "c", "d"]
+    index.remove("b")
+    index.add("a")
+    index.add("b")
+    index.remove("c")
+    index.add("c")
+    assert len(index) == 4
+    assert index.search("^") == ["a", "b", "c", "d"]
+
+
+@pytest.mark.parametrize("model_type", [Markov, CompactMarkov])
+def test_markov_del_words_removes_incoming_edges(model_type):
+    markov = model_type()
+    markov.add_string("one two three")
+    markov.add_string("four two five")
+    assert markov.find_words("^t") == ["three", "two"]
+    assert markov.del_words("^two$") == ["two"]
+    assert dict(markov.get_next_words_list("one")) == {None: 0}
+    assert dict(markov.get_next_words_list("four")) == {None: 0}
+    markov.add_string("four two six")
+    assert markov.find_words("^t") == ["three", "two"]
+    assert dict(markov.get_next_words_list("two")) == {"six": 1, None: 0}
+
+
+@pytest.mark.parametrize("state_size", NgramMarkov.STATE_SIZES)
+def test_ngram_markov_generates_only_seen_contexts(state_size):
+    chain = NgramMarkov(state_size)
+    chain.add_words("a b c d".split())
+    chain.add_words("x b e f".split())
+    messages = {chain.generate() for _ in range(200)}
+    # First order Markov chain can also produce "a b e f" and "x b c d"
+    assert messages == {"a b c d", "x b e f"}
+    assert {chain.generate("b") for _ in range(200)} == {"b c d", "b e f"}
+    assert chain.generate("unknown") is None
+
+
+def test_ngram_markov_hash_table_and_file_round_trip(tmp_path):
+    chain = NgramMarkov(3)
+    for i in range(2000):
+        chain.add_words([f"w{i % 97}", f"w{i % 89}", f"w{i % 83}", f"w{i % 7}"])
+    chain._compact()
+    chain.add_words(["w1", "w2", "w3"])
+    for state_id, key in enumerate(chain._state_keys[:chain._states_count].tolist()):
+        assert chain._find_state(key) == state_id
+    chain.write(str(tmp_path / "ngram.npz"))
+    restored = NgramMarkov.read(str(tmp_path / "ngram.npz"))
+    assert restored.state_size == 3
+    assert restored.pairs_count() == chain.pairs_count()
+    for state_id, key in enumerate(restored._state_keys[:restored._states_count].tolist()):
+        assert restored._find_state(key) == state_id
+    assert NgramMarkov.load(str(tmp_path / "ngram.npz"), 2).is_empty()
+
+
+def test_ngram_markov_reuses_ids_of_removed_words(monkeypatch, tmp_path, caplog):
+    monkeypatch.setattr(NgramMarkov, "MAX_WORDS", 8)
+    chain = NgramMarkov(2)
+    chain.add_words("a b c d".split())
+    chain.add_words("a e f".split())
+    chain.add_words("x y".split())
+    chain.add_words("p q".split())
+    assert chain.words_count() == 6 and caplog.text.count("is full") == 1
+    chain.remove_words(["e", "f"])
+    chain.add_words("x y".split())
+    assert len(chain.words) == 7 and chain.words[chain.word_ids["y"]] == "y"
+    assert {chain.generate() for _ in range(200)} == {"a b c d", "x y"}
+    chain.write(str(tmp_path / "ngram.npz"))
+    restored = NgramMarkov.read(str(tmp_path / "ngram.npz"))
+    assert restored._free_ids == []
+    restored.remove_words(["a", "x"])
+    restored.add_words("p q".split())
+    assert len(restored.words) == 7 and {restored.generate() for _ in range(200)} == {"p q"}
+
+
+@pytest.mark.parametrize("model_type", [Markov, CompactMarkov])
+def test_markov_generate_by_chain_of_higher_order(model_type, tmp_path):
+    markov = model_type()
+    markov.min_chars = 1
+    assert markov.generate(order=2) == "<Markov chain of order 2 is not enabled>"
+    markov.add_string("one two three")
+    markov.set_state_size(2, str(tmp_path / "ngram.npz"))
+    assert markov.generate("two") == "two three"  # falls back to first order until the chain is trained
+    assert markov.generate("two", order=2) == "<Empty message was generated>"
+    markov.add_string("a b c d")
+    markov.add_string("x b e f")
+    assert {markov.generate() for _ in range(100)} == {"a b c d", "x b e f"}
+    assert {markov.generate(order=1) for _ in range(200)} == {
+        "one two three", "a b c d", "x b e f", "a b e f", "x b c d"}
+    markov.del_words("^c$")
+    assert {markov.generate() for _ in range(100)} == {"a b", "x b e f"}
+
+
+def test_compact_markov_chain_of_higher_order_is_saved_with_snapshot(tmp_path):
+    path, wal_prefix, ngram_path = str(tmp_path / "markov.bin"), str(tmp_path / "markov.wal"), str(tmp_path / "n.npz")
+    markov = CompactMarkov()
+    markov.min_chars = 1
+    markov.set_state_size(2, ngram_path)
+    markov.add_string("a b c d")
+    markov.write_snapshot(path)
+    markov.open_wal(wal_prefix)
+    markov.add_string("x b e f")
+    markov.serialize(path)
+
+    def reopen():
+        restored = CompactMarkov.read_snapshot(path)
+        assert restored.state_size == 2
+        restored.attach_ngram(ngram_path)
+        restored.open_wal(wal_prefix)
+        return restored
+    assert {reopen().generate() for _ in range(100)} == {"a b c d", "x b e f"}
+    markov.WAL_COMPACTION_THRESHOLD = 0
+    markov.add_string("y b g")
+    markov.serialize(path)
+    assert NgramMarkov.read(ngram_path).generation == markov.generation
+    assert {reopen().generate() for _ in range(100)} == {"a b c d", "x b e f", "y b g"}
+
+
+@pytest.mark.parametrize("model_type", [Markov, CompactMarkov])
+def test_markov_ingest_queue_adds_messages_in_batches(model_type):
+    markov = model_type()
+    markov.ignored_prefixes[1] = "!"
+    ingest = MarkovIngestQueue(markov, batch_size=16)
+    ingest.start()
+    for i in range(100):
+        assert ingest.push(f"message number {i}") is True
+    ingest.push("!ignored command message")
+    ingest.flush()
+    assert markov.find_words("^number$") == ["number"]
+    assert markov.find_words("^command$") == []
+    assert dict(markov.get_next_words_list("number"))["7"] == 1
+    ingest.stop()
+    stats = ingest.stats()
+    assert stats["pending"] == 0
+    assert stats["processed"] == stats["pushed"] == 101
+    assert stats["batches"] <= 101
+
+
+def test_markov_ingest_queue_drops_messages_when_full():
+    markov = Markov()
+    ingest = MarkovIngestQueue(markov, maxsize=4, batch_size=2)
+    results = [ingest.push(f"message number {i}") for i in range(6)]
+    assert results == [True] * 4 + [False] * 2
+    stats = ingest.stats()
+    assert (stats["pushed"], stats["dropped"], stats["backpressure"]) == (4, 2, 2)
+    ingest.flush()  # consumer thread is not started, so messages are added by the caller
+    assert ingest.stats()["batches"] == 2
+    assert markov.find_words("^[0-9]$") == ["0", "1", "2", "3"]
+
+
+@pytest.mark.parametrize("model_type", [Markov, CompactMarkov])
+def test_markov_response_pool_returns_pregenerated_messages(model_type):
+    markov = model_type()
+    markov.min_chars = 1
+    markov.add_strings(["hello world", "hello there"])
+    pool = MarkovResponsePool(markov, size=4, words_count=2)
+    assert pool.get("hello") in ("hello world", "hello there")
+    assert (pool.stats()["hits"], pool.stats()["misses"]) == (0, 1)
+    assert markov.chains_generated == 1
+    assert pool.refill() == 8
+    assert pool.stats()["pooled"] == 8
+    assert pool.stats()["start_words"] == 1
+    assert markov.chains_generated == 1
+    assert pool.get() in ("hello world", "hello there")
+    assert pool.get("hello") in ("hello world", "hello there")
+    stats = pool.stats()
+    assert (stats["hits"], stats["misses"], stats["pooled"]) == (2, 1, 6)
+    assert markov.chains_generated == 3
+
+
+@pytest.mark.parametrize("model_type", [Markov, CompactMarkov])
+def test_markov_response_pool_is_cleared_after_words_removal(model_type):
+    markov = model_type()
+    markov.min_chars = 1
+    markov.add_strings(["hello world"])
+    pool = MarkovResponsePool(markov, size=4)
+    pool.refill()
+    assert pool.stats()["pooled"] == 4
+    markov.del_words("^world$")
+    assert pool.get() == "hello"
+    assert pool.stats()["misses"] == 1
+    assert pool.refill() == 4
+    assert pool.get() == "hello"
+    markov.drop()
+    assert pool.refill() == 0
+    assert pool.get() == "<Markov database is empty>"
@@ -1,4 +1,8 @@
+import os
+import threading
+
 from src.message_cache import CachedMsg, MessageCache
+from src.message_history import MessageHistoryStore
 
 
 def test_push_and_get():
@@ -21,3 +25,76 @@ def test_buffer_capacity_limit():
 
     assert cache.get("chan", MessageCache.BUFFER_CAPACITY) is None
     assert cache.get("chan", MessageCache.BUFFER_CAPACITY - 1).message == "10"
+
+
+def test_reset_and_push_after_buffer_wraps():
+    cache = MessageCache()
+    for i in range(MessageCache.BUFFER_CAPACITY * 2 + 5):
+        cache.push("chan", CachedMsg(str(i), "user"))
+    assert [cache.get("chan", i).message for i in range(3)] == ["2006", "2005", "2004"]
+    cache.reset("chan", [CachedMsg("new", "user"), CachedMsg("old", "user")])
+    cache.push("chan", CachedMsg("newest", "user"))
+    assert [cache.get("chan", i).message for i in range(3)] == ["newest", "new", "old"]
+    assert cache.get("chan", 3) is None
+
+
+def test_least_recently_used_channels_are_evicted():
+    message_size = MessageCache._message_size(CachedMsg("message", "user"))
+    cache = MessageCache(memory_budget=message_size * 4)
+    for channel in ("a", "b", "c"):
+        cache.push(channel, CachedMsg("message", "user"))
+    cache.push("a", CachedMsg("message", "user"))
+    cache.push("d", CachedMsg("message", "user"))
+    assert cache.get("b", 0) is None
+    assert all(cache.get(channel, 0) is not None for channel in ("a", "c", "d"))
+    assert cache.nbytes == message_size * 4
+
+
+def test_concurrent_pushes_from_backend_threads():
+    message_size = MessageCache._message_size(CachedMsg("message", "user"))
+    cache = MessageCache(memory_budget=message_size * 3000)
+
+    def push(backend):
+        for i in range(2000):
+            cache.push(f"{backend}_{i % 4}", CachedMsg("message", "user"))
+
+    threads = [threading.Thread(target=push, args=(backend,)) for backend in ("discord", "telegram")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.nbytes == sum(buffer.nbytes for buffer in cache._data.values())
+    assert cache.nbytes == message_size * sum(len(buffer.items) for buffer in cache._data.values())
+    assert cache.nbytes <= cache.memory_budget
+
+
+def test_message_history_is_restored(monkeypatch, tmp_path):
+    monkeypatch.setattr(MessageHistoryStore, "SEGMENT_SIZE", 256)
+    cache = MessageCache()
+    cache.attach_history(MessageHistoryStore(str(tmp_path), 10))
+    for i in range(100):
+        cache.push(-100 if i % 2 else 200, CachedMsg(f"message {i}", i))
+    cache.reset("chan", [CachedMsg("new", "user"), CachedMsg("old", "user")])
+    cache.history.close()
+    assert all(len(os.listdir(os.path.join(tmp_path, channel))) <= 3 for channel in ("-100", "200"))
+    restored = MessageCache()
+    restored.attach_history(MessageHistoryStore(str(tmp_path), 10))
+    restored.history.start()
+    assert [restored.get(-100, i).message for i in range(2)] == ["message 99", "message 97"]
+    assert restored.get(200, 9).author == 80 and restored.get(200, 10) is None
+    assert [restored.get("chan", i).message for i in range(2)] == ["new", "old"]
+    restored.push(200, CachedMsg("after restart", "user"))
+    restored.history.flush()
+    assert restored.history.pending() == 0
+    restored.history.close()
+    assert MessageHistoryStore(str(tmp_path), 10).load()[200][0].message == "after restart"
+
+
+def test_message_history_is_written_on_flush(tmp_path):
+    history = MessageHistoryStore(str(tmp_path), 10)
+    history.append("chan", CachedMsg("message", "user"))
+    assert history.pending() == 1 and not os.listdir(tmp_path)
+    history.flush()
+    assert history.pending() == 0
+    assert MessageHistoryStore(str(tmp_path), 10).load()["chan"][0].message == "message"
+    history.close()
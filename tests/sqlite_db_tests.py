@@ -0,0 +1,97 @@
+import os
+
+import yaml
+
+from src import const
+from src.api.quote import Quote
+from src.api.reminder import Reminder
+from src.backup import BackupStore
+from src.config import Config, User, bc
+from src.db.repository import find
+from src.db.sqlite_db import SqliteDatabase, SqliteRepository
+from src.utils import Util
+
+
+def _reminder(time, channel_id, author="author"):
+    return Reminder(time, "message", channel_id, author, "2024-01-01 00:00", const.BotBackend.DISCORD)
+
+
+def test_sqlite_repository(tmp_path):
+    path = os.path.join(tmp_path, "walbot.db")
+    reminders = SqliteDatabase(path).repository("reminders")
+    reminders[1] = _reminder("2024-01-01 10:00", 10)
+    reminders[2] = _reminder("2024-01-01 12:00", 20)
+    reminders[3] = _reminder("2024-01-02 10:00", 10, "other")
+    assert len(reminders) == 3 and list(reminders) == [1, 2, 3]
+    assert 2 in reminders.keys() and 4 not in reminders.keys()
+    assert reminders[1] is reminders[1]
+    assert list(reminders.find(channel_id=10).keys()) == [1, 3]
+    assert list(reminders.find(time__le="2024-01-01 12:00", author="author").keys()) == [1, 2]
+    reminders[2].notes = "notes"
+    assert reminders.flush() == 1
+    assert reminders.flush() == 0
+    reminders.pop(3)
+    reminders = SqliteDatabase(path).repository("reminders")
+    assert {key: reminder.notes for key, reminder in reminders.items()} == {1: "", 2: "notes"}
+    assert yaml.load(yaml.dump(reminders, Dumper=Util.get_yaml()[1]), Loader=Util.get_yaml()[0]).table == "reminders"
+
+
+def test_find_is_same_for_dict_and_sqlite_repository(tmp_path):
+    items = {index: _reminder(f"2024-01-0{index % 3 + 1} 10:00", index % 2) for index in range(1, 10)}
+    reminders = SqliteDatabase(os.path.join(tmp_path, "walbot.db")).repository("reminders")
+    reminders.replace(items)
+    for conditions in ({"channel_id": 1}, {"time__lt": "2024-01-03 10:00", "channel_id": 0}, {"time__ge": "2025"}):
+        assert list(find(reminders, **conditions).keys()) == list(find(items, **conditions).keys())
+
+
+def test_config_storage_can_be_moved_to_sqlite_and_back(monkeypatch, tmp_path):
+    monkeypatch.setattr(const, "DISCORD_COMMANDS_DOC_PATH", os.path.join(tmp_path, "DiscordCommands.md"))
+    yaml_loader, yaml_dumper = Util.get_yaml()
+    monkeypatch.setattr(bc, "yaml_loader", yaml_loader)
+    monkeypatch.setattr(bc, "yaml_dumper", yaml_dumper)
+    config = Config()
+    config.quotes[1] = Quote("quote", "author")
+    config.discord.users[100] = User(100)
+    path = os.path.join(tmp_path, "walbot.db")
+    config.select_storage(path)
+    assert config.database_path == path
+    assert isinstance(config.quotes, SqliteRepository) and isinstance(config.discord.users, SqliteRepository)
+    assert config.quotes[1].message == "quote"
+    config.discord.users[100].permission_level = const.Permission.ADMIN.value
+    config.mark_dirty("discord")
+    assert config.discord.users[100].permission_level == const.Permission.ADMIN.value
+    assert SqliteDatabase(path).repository("discord_users")[100].permission_level == const.Permission.ADMIN.value
+    # Domain files refer to database tables
+    assert "open_repository" in yaml.dump(config.discord, Dumper=yaml_dumper)
+    config.select_storage(None)
+    assert config.database_path is None
+    assert type(config.quotes) is dict and config.quotes[1].message == "quote"
+    assert type(config.discord.users) is dict
+    assert config.discord.users[100].permission_level == const.Permission.ADMIN.value
+
+
+def test_config_storage_selection_does_not_load_domains(monkeypatch, tmp_path):
+    monkeypatch.setattr(const, "DISCORD_COMMANDS_DOC_PATH", os.path.join(tmp_path, "DiscordCommands.md"))
+    yaml_loader, yaml_dumper = Util.get_yaml()
+    monkeypatch.setattr(bc, "yaml_loader", yaml_loader)
+    monkeypatch.setattr(bc, "yaml_dumper", yaml_dumper)
+    config_file = os.path.join(tmp_path, "config.yaml")
+    with open(config_file, 'w') as f:
+        f.write(yaml.dump(Config(), Dumper=yaml_dumper))
+    config = Config.load(config_file)
+    config.select_storage(None)
+    assert config.loaded_domains() == []
+
+
+def test_config_backup_includes_database(monkeypatch, tmp_path):
+    monkeypatch.setattr(const, "DISCORD_COMMANDS_DOC_PATH", os.path.join(tmp_path, "DiscordCommands.md"))
+    monkeypatch.setattr(const, "BACKUP_DIRECTORY", os.path.join(tmp_path, "backup"))
+    config = Config()
+    path = os.path.join(tmp_path, "walbot.db")
+    config.select_storage(path)
+    config.quotes[1] = Quote("quote", "author")
+    config.backup(wait=True)
+    store = BackupStore(const.BACKUP_DIRECTORY)
+    restored_path = os.path.join(tmp_path, "restored.db")
+    store.restore(store.snapshots("walbot.db")[-1]["id"], restored_path)
+    assert SqliteDatabase(restored_path).repository("quotes")[1].message == "quote"
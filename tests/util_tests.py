@@ -99,3 +99,11 @@ def test_request_get_text(monkeypatch):
     result = asyncio.run(Util.request("http://example.com").get_text())
 
     assert result == "hello"
+
+
+def test_lazy_import():
+    json_module = Util.lazy_import("json")
+    assert json_module.loads("[1]") == [1]
+    missing_module = Util.lazy_import("walbot_missing_module")
+    with pytest.raises(ModuleNotFoundError):
+        missing_module.attribute
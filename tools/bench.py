@@ -0,0 +1,480 @@
+"""Performance benchmarks for walbot subsystems"""
+
+import asyncio
+import itertools
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from src import config_codec, const, subcommands
+from src.algorithms import levenshtein_distance
+from src.api.command import Command, Implementation
+from src.api.command_budget import add_output, command_run
+from src.api.dispatcher import dispatcher
+from src.api.execution_context import ExecutionContext
+from src.api.quote import Quote
+from src.api.reminder import Reminder
+from src.api.variables import VariableTemplate, compile_template
+from src.backend.discord.config import DiscordConfig
+from src.command_index import CommandIndex
+from src.config import GuildSettings, User
+from src.log import log
+from src.markov import CompactMarkov, Markov, MarkovNode, MarkovV2
+from src.markov_ngram import NgramMarkov
+from src.message_cache import CachedMsg, MessageCache
+from src.utils import Util
+
+_benchmarks: Dict[str, Callable[[float], None]] = dict()
+
+
+def benchmark(func: Callable[[float], None]) -> Callable[[float], None]:
+    """Register function as benchmark. Benchmark name is the name of the function"""
+    _benchmarks[func.__name__] = func
+    return func
+
+
+def synthetic_corpus(messages_count: int, vocabulary_size: int, seed: int = 42) -> List[str]:
+    """Generate reproducible corpus of messages with Zipf-like word distribution"""
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(vocabulary_size)]
+    weights = [1 / (i + 1) for i in range(vocabulary_size)]
+    return [' '.join(rng.choices(vocabulary, weights, k=rng.randint(3, 20))) for _ in range(messages_count)]
+
+
+def measure_memory(build: Callable[[], Any]) -> Tuple[Any, int, float]:
+    """Build object and return it with amount of memory that is still allocated and elapsed time"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, allocated, elapsed
+
+
+def measure_time(func: Callable[[], Any], repeat: int) -> float:
+    """Get average time of function call in microseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def _format_size(size: int) -> str:
+    return f"{size / (1024 * 1024):.2f} MB"
+
+
+def _build_markov(model_type: type, corpus: List[str]) -> Any:
+    markov = model_type()
+    markov.min_chars = 1
+    for message in corpus:
+        markov.add_string(message)
+    if model_type is CompactMarkov:
+        markov._compact()
+    return markov
+
+
+@benchmark
+def markov_memory(scale: float) -> None:
+    """Compare memory usage of object graph and compact Markov models"""
+    corpus = synthetic_corpus(int(50000 * scale), int(20000 * scale))
+    print(f"Corpus: {len(corpus)} messages")
+    markov, markov_size, markov_time = measure_memory(lambda: _build_markov(Markov, corpus))
+    print(f"Markov:        {_format_size(markov_size):>12} (built in {markov_time:.2f}s), "
+          f"words: {markov.words_count()}, pairs: {markov.pairs_count()}")
+    del markov
+    compact, compact_size, compact_time = measure_memory(lambda: _build_markov(CompactMarkov, corpus))
+    print(f"CompactMarkov: {_format_size(compact_size):>12} (built in {compact_time:.2f}s), "
+          f"words: {compact.words_count()}, pairs: {compact.pairs_count()}")
+    print(f"Memory usage ratio: {markov_size / max(compact_size, 1):.2f}x")
+
+
+def _linear_choose_next(node: MarkovNode, index: int) -> Any:
+    """Reference implementation of next word selection by linear scan (used before cumulative tables)"""
+    count = 0
+    for word, next_count in node.next.items():
+        count += next_count
+        if count > index:
+            return word
+    raise IndexError(f"Index {index} is out of range of next words")
+
+
+@benchmark
+def markov_generate(scale: float) -> None:
+    """Measure Markov chain generation speed and next word selection on hub nodes"""
+    corpus = synthetic_corpus(int(50000 * scale), int(20000 * scale))
+    repeat = 2000
+    markov = _build_markov(Markov, corpus)
+    begin_node = markov.model[""]
+    rng = random.Random(42)
+    linear_time = measure_time(lambda: _linear_choose_next(begin_node, rng.randrange(begin_node.total_next)), repeat)
+    bisect_time = measure_time(lambda: begin_node.choose_next(rng.randrange(begin_node.total_next)), repeat)
+    print(f"Begin node degree: {len(begin_node.next)}")
+    print(f"Next word selection (linear scan):       {linear_time:.2f} us")
+    print(f"Next word selection (cumulative counts): {bisect_time:.2f} us")
+    print(f"Markov.generate:        {measure_time(markov.generate, repeat):.2f} us")
+    compact = _build_markov(CompactMarkov, corpus)
+    print(f"CompactMarkov.generate: {measure_time(compact.generate, repeat):.2f} us")
+
+
+@benchmark
+def markov_load(scale: float) -> None:
+    """Compare Markov model save and load time for YAML and binary snapshot formats"""
+    corpus = synthetic_corpus(int(50000 * scale), int(20000 * scale))
+    yaml_loader, yaml_dumper = Util.get_yaml()
+    markov = _build_markov(Markov, corpus)
+    compact = CompactMarkov.from_markov(markov)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        yaml_path = os.path.join(tmp_dir, "markov.yaml")
+        snapshot_path = os.path.join(tmp_dir, "markov.bin")
+        save_time = measure_time(lambda: markov.serialize(yaml_path, yaml_dumper), 1)
+        load_time = measure_time(lambda: Util.read_config_file(yaml_path), 1)
+        print(f"YAML:     save {save_time / 1e6:.2f}s, load {load_time / 1e6:.2f}s, "
+              f"size {_format_size(os.path.getsize(yaml_path))}")
+        save_time = measure_time(lambda: compact.write_snapshot(snapshot_path), 1)
+        load_time = measure_time(lambda: CompactMarkov.read_snapshot(snapshot_path), 1)
+        print(f"Snapshot: save {save_time / 1e6:.2f}s, load {load_time / 1e6:.2f}s, "
+              f"size {_format_size(os.path.getsize(snapshot_path))}")
+
+
+def synthetic_config_domains(count: int, seed: int = 42) -> Dict[str, Any]:
+    """Generate config domains with reproducible reminders, quotes, users and guild settings"""
+    rng = random.Random(seed)
+    reminders = dict()
+    quotes = dict()
+    discord = DiscordConfig()
+    for i in range(count):
+        reminders[i] = Reminder(
+            f"2030-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00",
+            f"reminder message {i}", rng.getrandbits(60), f"user{rng.randrange(1000)}", "2024-01-01 00:00",
+            const.BotBackend.DISCORD)
+        reminders[i].prereminders_list = [5, 15]
+        reminders[i].used_prereminders_list = [False, False]
+        quotes[i] = Quote(f"quote message {i}", f"user{rng.randrange(1000)}")
+        discord.users[i] = User(i)
+        if i % 10 == 0:
+            discord.guilds[i] = GuildSettings(i)
+            discord.guilds[i].whitelist = set(rng.getrandbits(60) for _ in range(10))
+    return {"reminders": reminders, "quotes": quotes, "discord": discord}
+
+
+@benchmark
+def config_load(scale: float) -> None:
+    """Compare load and save time of config files in YAML with Python object tags and in schema-driven JSON"""
+    yaml_loader, yaml_dumper = Util.get_yaml()
+    domains = synthetic_config_domains(int(20000 * scale))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, domain in domains.items():
+            yaml_path = os.path.join(tmp_dir, name + ".yaml")
+            json_path = os.path.join(tmp_dir, name + ".json")
+
+            def save_yaml() -> None:
+                with open(yaml_path, 'wb') as f:
+                    f.write(yaml.dump(domain, Dumper=yaml_dumper, encoding='utf-8', allow_unicode=True))
+
+            def load_yaml() -> Any:
+                # The way config files were read before schema-driven loader
+                with open(yaml_path, 'r') as f:
+                    return yaml.load(f.read(), Loader=yaml_loader)
+
+            def save_json() -> None:
+                with open(json_path, 'wb') as f:
+                    f.write(config_codec.dump(domain, yaml_dumper))
+
+            yaml_save_time = measure_time(save_yaml, 1)
+            yaml_load_time = measure_time(load_yaml, 1)
+            json_save_time = measure_time(save_json, 1)
+            json_load_time = measure_time(lambda: Util.read_config_file(json_path), 1)
+            print(f"{name:>9} YAML: save {yaml_save_time / 1e6:.2f}s, load {yaml_load_time / 1e6:.2f}s, "
+                  f"size {_format_size(os.path.getsize(yaml_path))}")
+            print(f"{name:>9} JSON: save {json_save_time / 1e6:.2f}s, load {json_load_time / 1e6:.2f}s, "
+                  f"size {_format_size(os.path.getsize(json_path))} "
+                  f"(load is {yaml_load_time / max(json_load_time, 1e-9):.1f}x faster)")
+
+
+@benchmark
+def markov_search(scale: float) -> None:
+    """Compare regex word search by full vocabulary scan and by word index"""
+    corpus = synthetic_corpus(int(50000 * scale), int(20000 * scale))
+    markov = _build_markov(Markov, corpus)
+    vocabulary = list(markov.model.keys())
+    markov.find_words("")  # build index
+    for regex in ("^word123", "word1234", "^word12.*5$", "^[a-z]+99$"):
+        scan_time = measure_time(lambda: [word for word in vocabulary if re.search(regex, word)], 10)
+        index_time = measure_time(lambda: markov.find_words(regex), 10)
+        print(f"{regex:>12}: full scan {scan_time / 1e3:8.2f} ms, index {index_time / 1e3:8.2f} ms")
+    for model_type in (Markov, CompactMarkov):
+        model = _build_markov(model_type, corpus)
+        model.del_words("^word1$")  # build indexes
+        delete_time = measure_time(lambda: model.del_words("^word1[0-9]{3}$"), 1)
+        print(f"{model_type.__name__}.del_words: {delete_time / 1e3:.2f} ms")
+
+
+@benchmark
+def markov_wal(scale: float) -> None:
+    """Compare Markov model autosave time with write-ahead log and with full snapshot write"""
+    corpus = synthetic_corpus(int(50000 * scale), int(20000 * scale))
+    new_messages = synthetic_corpus(1000, int(20000 * scale), seed=1)
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot_path = os.path.join(tmp_dir, "markov.bin")
+        compact = _build_markov(CompactMarkov, corpus)
+        compact.write_snapshot(snapshot_path)
+        compact.open_wal(os.path.join(tmp_dir, "markov.wal"))
+        add_time = measure_time(lambda: compact.add_string(new_messages[rng.randrange(len(new_messages))]), 1000)
+        sync_time = measure_time(lambda: compact.serialize(snapshot_path), 1)
+        replay_time = measure_time(lambda: CompactMarkov.read_snapshot(snapshot_path).replay_wal(
+            os.path.join(tmp_dir, "markov.wal")), 1)
+        snapshot_time = measure_time(lambda: compact.write_snapshot(snapshot_path), 1)
+        print(f"CompactMarkov.add_string with write-ahead log: {add_time:.2f} us")
+        print(f"Autosave (write-ahead log sync): {sync_time / 1e3:.2f} ms")
+        print(f"Autosave (full snapshot write):  {snapshot_time / 1e3:.2f} ms")
+        print(f"Load with replay of {len(new_messages)} write-ahead log records: {replay_time / 1e3:.2f} ms")
+
+
+def _build_ngram(state_size: int, corpus: List[str]) -> NgramMarkov:
+    chain = NgramMarkov(state_size)
+    for message in corpus:
+        chain.add_words(message.split(' '))
+    chain._compact()
+    return chain
+
+
+@benchmark
+def markov_ngram(scale: float) -> None:
+    """Compare model size and generation speed of Markov chains of different orders"""
+    corpus = synthetic_corpus(int(50000 * scale), int(20000 * scale))
+    repeat = 1000
+    compact, size, elapsed = measure_memory(lambda: _build_markov(CompactMarkov, corpus))
+    print(f"Order 1: {_format_size(size):>12} (built in {elapsed:.2f}s), states: {compact.words_count()}, "
+          f"generate: {measure_time(compact.generate, repeat):.2f} us")
+    del compact
+    for state_size in NgramMarkov.STATE_SIZES:
+        chain, size, elapsed = measure_memory(lambda: _build_ngram(state_size, corpus))
+        print(f"Order {state_size}: {_format_size(size):>12} (built in {elapsed:.2f}s), "
+              f"states: {chain.states_count()}, generate: {measure_time(chain.generate, repeat):.2f} us")
+        del chain
+
+
+@benchmark
+def markov_mongo(scale: float) -> None:
+    """Measure ingest and generation throughput of MongoDB Markov model (uses mongomock)"""
+    try:
+        import mongomock  # type:ignore
+    except ImportError:
+        return log.error("mongomock is not installed. Install it to run this benchmark: pip install mongomock")
+    corpus = synthetic_corpus(int(5000 * scale), int(2000 * scale))
+    collection: Any = mongomock.MongoClient().db.markov
+    collection.insert_one({
+        "end_node": {"word": None, "next": {"__markov_null": 0}, "total_next": 0, "type": MarkovV2.NodeType.end},
+        "filters": [], "ignored_prefixes": {}, "min_chars": 1, "min_words": 1, "max_chars": 2000, "max_words": 500,
+        "model": {"__markov_null": {"word": None, "next": {}, "total_next": 0, "type": MarkovV2.NodeType.begin}},
+    })
+    markov = MarkovV2(collection)
+    start = time.perf_counter()
+    for message in corpus:
+        markov.add_string(message)
+    markov.flush()
+    elapsed = time.perf_counter() - start
+    print(f"Ingest:   {len(corpus) / elapsed:.0f} messages/s")
+    repeat = 1000
+    print(f"Generate: {1e6 / measure_time(markov.generate, repeat):.0f} messages/s (warm node cache)")
+
+
+class _ListMessageCache:
+    """Reference implementation of message cache that inserts messages to the beginning of list"""
+
+    def __init__(self) -> None:
+        self._data: Dict[int, List[CachedMsg]] = dict()
+
+    def push(self, channel_id: int, message: CachedMsg) -> None:
+        self._data.setdefault(channel_id, []).insert(0, message)
+        self._data[channel_id] = self._data[channel_id][:MessageCache.BUFFER_CAPACITY]
+
+    def get(self, channel_id: int, index: int) -> CachedMsg:
+        return self._data[channel_id][index]
+
+
+@benchmark
+def message_cache(scale: float) -> None:
+    """Compare message cache push and get time of list and ring buffer implementations"""
+    corpus = synthetic_corpus(1000, 1000)
+    channels = max(int(100 * scale), 1)
+    repeat = int(200000 * scale)
+    rng = random.Random(42)
+    messages = [(rng.randrange(channels), CachedMsg(rng.choice(corpus), "user")) for _ in range(repeat)]
+    for cache in (_ListMessageCache(), MessageCache()):
+        for i in range(channels * MessageCache.BUFFER_CAPACITY):
+            cache.push(i % channels, CachedMsg(corpus[i % len(corpus)], "user"))
+        pushes = iter(messages)
+        push_time = measure_time(lambda: cache.push(*next(pushes)), repeat)
+        gets = iter(messages)
+        get_time = measure_time(lambda: cache.get(next(gets)[0], 2), repeat)
+        print(f"{type(cache).__name__:>17}: push {push_time:.2f} us, get {get_time:.2f} us")
+
+
+async def _rescan_process_subcommands(string: str, run: Callable[[str], Any]) -> str:
+    """Reference implementation of subcommands processing that rescans the string after every substitution"""
+    command_indicators = {')': '(', ']': '[', '`': '`', '}': '{'}
+    while True:
+        updated = False
+        for i in range(len(string)):
+            if string[i] in command_indicators.keys():
+                for j in range(i - 1, 0, -1):
+                    if string[j] == command_indicators[string[i]] and string[j - 1] == '$':
+                        updated = True
+                        string = string[:j - 1] + await run(string[j + 1:i]) + string[i + 1:]
+                        break
+            if updated:
+                break
+        if not updated:
+            return string
+
+
+@benchmark
+def subcommands_expand(scale: float) -> None:
+    """Compare processing time of nested subcommands by rescanning and by one-pass parser"""
+    async def echo(command_line: str) -> str:
+        return command_line.partition(' ')[2]
+
+    padding = "text " * 20
+    for depth in (int(10 * scale) or 1, int(50 * scale) or 1, int(200 * scale) or 1):
+        nested = "$(echo " * depth + padding + ")" * depth
+        chained = ' '.join(f"$(echo {padding}$[echo {i}])" for i in range(depth))
+        for name, string in (("nested", nested), ("chained", chained)):
+            assert (asyncio.run(_rescan_process_subcommands(string, echo)) ==
+                    asyncio.run(subcommands.expand(string, echo)))
+            rescan_time = measure_time(lambda: asyncio.run(_rescan_process_subcommands(string, echo)), 5)
+            parser_time = measure_time(lambda: asyncio.run(subcommands.expand(string, echo)), 5)
+            print(f"{name:>7}, {depth:>3} subcommands: rescan {rescan_time / 1e3:8.2f} ms, "
+                  f"parser {parser_time / 1e3:8.2f} ms")
+
+
+@benchmark
+def command_suggest(scale: float) -> None:
+    """Compare search of the most similar command name by full scan and by BK-tree"""
+    rng = random.Random(42)
+    count = int(2000 * scale) or 1
+    names = list(dict.fromkeys(
+        ''.join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 12))) for _ in range(count)))
+    typos = [name[:-1] + "x" for name in rng.sample(names, min(100, len(names)))]
+    index = CommandIndex()
+    index.rebuild(names, {})
+
+    def scan(word: str) -> str:
+        return min(names, key=lambda name: levenshtein_distance(word, name))
+
+    # There are fewer typos than calls at small scales
+    typo = itertools.cycle(typos)
+    scan_time = measure_time(lambda: scan(next(typo)), 10)
+    typo = itertools.cycle(typos)
+    index_time = measure_time(lambda: index.suggest(next(typo)), 100)
+    print(f"{len(names)} commands: full scan {scan_time / 1e3:.2f} ms, BK-tree {index_time / 1e3:.2f} ms")
+
+
+class _BenchExecutionContext(ExecutionContext):
+    def __init__(self, silent: bool = False) -> None:
+        super().__init__()
+        self.platform = const.BotBackend.DUMMY_BACKEND
+        self.silent = silent
+
+    async def send_message(self, message: str, *args, **kwargs) -> None:
+        pass
+
+    async def reply(self, message: str, *args, **kwargs) -> None:
+        pass
+
+    async def send_direct_message(self, user_id: int, message: str, *args, **kwargs) -> None:
+        pass
+
+    async def disable_pings(self, message: str) -> str:
+        return message
+
+    def message_author(self) -> str:
+        return "<@0>"
+
+    def message_author_id(self) -> str:
+        return "0"
+
+    def channel_name(self) -> str:
+        return "<#0>"
+
+    def channel_id(self) -> int:
+        return 0
+
+    def bot_user_id(self) -> int:
+        return 0
+
+
+async def _layered_run(command: Command, cmd_line: List[str], silent: bool = False) -> Optional[str]:
+    """Reference of Discord command run through legacy command and then through common command: every layer
+    accounts budget, creates execution context and expands variables"""
+    with command_run():
+        execution_ctx = _BenchExecutionContext()
+        log.debug(f"Processing command: {' '.join(cmd_line)}")
+        command.times_called += 1
+        line = VariableTemplate(' '.join(cmd_line)).render(execution_ctx, cmd_line)
+        log.debug2(f"Command (after processing variables): {line}")
+        line = await dispatcher.expand_subcommands(execution_ctx, line)
+        log.debug2(f"Command (after processing subcommands): {line}")
+        with command_run():
+            execution_ctx = _BenchExecutionContext(silent)
+            command.times_called += 1
+            cmd_line = line.split(' ')
+            cmd_line = VariableTemplate(' '.join(cmd_line)).render(execution_ctx, cmd_line).split(' ')
+            template = command.template()
+            text = compile_template(template[0]).render(execution_ctx, cmd_line) if template else ' '.join(cmd_line)
+            result = await command.execute(text, execution_ctx)
+            add_output(result)
+            return result
+
+
+@benchmark
+def command_dispatch(scale: float) -> None:
+    """Compare per-command overhead of layered Discord command run and of single dispatcher"""
+    async def noop(cmd_line: List[str], execution_ctx: ExecutionContext) -> str:
+        """Do nothing"""
+        return cmd_line[0]
+
+    commands = (
+        Command("bench", "echo", const.Permission.USER, Implementation.MESSAGE, impl_message="@args@"),
+        Command("bench", "noop", const.Permission.USER, Implementation.FUNCTION, impl_func=noop),
+    )
+    repeat = int(20000 * scale) or 1
+
+    async def run_many(run: Callable[[], Any]) -> None:
+        for _ in range(repeat):
+            await Util.run_function_with_time_limit(run(), const.MAX_COMMAND_EXECUTION_TIME)
+
+    loop = asyncio.new_event_loop()
+    # Console output of debug logs would dominate the measured time
+    logging.disable(logging.DEBUG)
+    for command in commands:
+        cmd_line = [command.command_name, "hello", "@author@"]
+        layered_time = measure_time(
+            lambda: loop.run_until_complete(run_many(lambda: _layered_run(command, cmd_line))), 1) / repeat
+        dispatcher_time = measure_time(
+            lambda: loop.run_until_complete(run_many(
+                lambda: dispatcher.run(command, cmd_line, _BenchExecutionContext(), time_limit=False))), 1) / repeat
+        print(f"{command.command_name:>5}: layered {layered_time:.2f} us, dispatcher {dispatcher_time:.2f} us")
+    logging.disable(logging.NOTSET)
+    loop.close()
+
+
+def main(args) -> const.ExitStatus:
+    names = list(_benchmarks.keys()) if args.name == "all" else [args.name]
+    for name in names:
+        if name not in _benchmarks.keys():
+            log.error(f"Unknown benchmark '{name}'. Available benchmarks: {', '.join(_benchmarks.keys())}")
+            return const.ExitStatus.GENERAL_ERROR
+    for name in names:
+        print(f"--- {name}: {_benchmarks[name].__doc__} ---")
+        _benchmarks[name](args.scale)
+    return const.ExitStatus.NO_ERROR
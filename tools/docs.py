@@ -2,12 +2,11 @@ from src import const
 from src.api.command import SupportedPlatforms
 from src.config import Config, bc
 from src.log import log
-from src.utils import Util
 
 
 def main(args):
     log.info("Reading config.yaml")
-    config = Util.read_config_file(const.CONFIG_PATH)
+    config = Config.load(const.CONFIG_PATH)
     if config is None:
         config = Config()
     bc.executor.load_commands()
@@ -1,4 +1,7 @@
+import os
+
 from src import const
+from src.markov import CompactMarkov
 from src.utils import Util
 
 
@@ -7,9 +10,15 @@ class Repl:
     quit = False
 
     def start(self) -> int:
-        print("Reading markov.yaml...")
-        self.markov = Util.read_config_file(const.MARKOV_PATH)
-        print("markov.yaml is loaded")
+        if os.path.isfile(const.MARKOV_SNAPSHOT_PATH):
+            print(f"Reading {const.MARKOV_SNAPSHOT_PATH}...")
+            self.markov = CompactMarkov.read_snapshot(const.MARKOV_SNAPSHOT_PATH)
+            replayed = self.markov.replay_wal(const.MARKOV_WAL_PATH)
+            print(f"{const.MARKOV_SNAPSHOT_PATH} is loaded ({replayed} write-ahead log records are replayed)")
+        else:
+            print(f"Reading {const.MARKOV_PATH}...")
+            self.markov = Util.read_config_file(const.MARKOV_PATH)
+            print(f"{const.MARKOV_PATH} is loaded")
         while not self.quit:
             try:
                 command = input("> ")
@@ -27,6 +36,8 @@ class Repl:
             self._next(cmd)
         elif cmd[0] == "words":
             self._words(cmd)
+        elif cmd[0] == "export":
+            self._export(cmd)
         elif cmd[0] in ("q", "quit"):
             self._quit(cmd)
         else:
@@ -36,6 +47,7 @@ class Repl:
         print("- help : print this message")
         print("- next <word> : print list of next words")
         print("- words : list of words in Markov model")
+        print("- export <path> : export Markov model to YAML file")
         print("- quit : quit this REPL")
 
     def _next(self, cmd):
@@ -43,13 +55,25 @@ class Repl:
             print(f"Too few arguments for command '{cmd[0]}'")
             return
         word = cmd[1]
-        if word not in self.markov.model.keys():
+        next_words = self.markov.get_next_words_list(word)
+        if not next_words:
             print(f"No such word '{word}' in Markov model")
             return
-        print(self.markov.model[word].next)
+        print(dict(next_words))
 
     def _words(self, cmd):
-        print(self.markov.model.keys())
+        print(self.markov.find_words(""))
+
+    def _export(self, cmd):
+        if len(cmd) < 2:
+            print(f"Too few arguments for command '{cmd[0]}'")
+            return
+        _, yaml_dumper = Util.get_yaml()
+        if isinstance(self.markov, CompactMarkov):
+            self.markov.export_yaml(cmd[1], yaml_dumper)
+        else:
+            self.markov.serialize(cmd[1], yaml_dumper)
+        print(f"Markov model is exported to {cmd[1]}")
 
     def _quit(self, _):
         self.quit = True
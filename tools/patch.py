@@ -1,3 +1,5 @@
+import os
+
 from src.patch.updater import Updater
 
 
@@ -5,6 +7,9 @@ def main(args, files):
     if args.file != "all":
         files = [args.file]
     for file in files:
-        file = file.split('.')[0]  # Drop .yaml suffix
-        updater = Updater(file)
-        updater.update()
+        name, ext = os.path.splitext(file)
+        updater = Updater(name)
+        if ext == ".bin":
+            getattr(updater, name + "_bin")()
+        else:
+            updater.update()
@@ -18,6 +18,9 @@ def main():
     walbot_dir = os.path.normpath(os.path.dirname(os.path.abspath(__file__)))
     if os.path.normpath(os.getcwd()) != walbot_dir:
         os.chdir(walbot_dir)
+    if "--profile-startup" in sys.argv:
+        # Profiler is enabled before the launcher is imported to measure imports of all bot modules
+        importlib.import_module("src.startup_profiler").profiler.enable()
     launcher = importlib.import_module("src.launcher").Launcher()
     err_code = launcher.launch_bot()
     sys.exit(err_code)